@@ -0,0 +1,46 @@
+"""
+Benchmark loading a BED file without cache, with a cold cache(parse and write the cache)
+and with a warm cache(memory-map the cache).
+
+    python benchmarks/bench_bed_cache.py --rows 1000000
+"""
+import os
+import time
+import argparse
+import tempfile
+
+from luckyegg.io.bed import read_bed_batches, bed_cache_path
+
+from generators import write_bed6
+
+
+def load(path:str, cache:bool) -> int:
+    return sum(len(b) for b in read_bed_batches(path, cache=cache))
+
+
+def timeit(func, *args):
+    t0 = time.perf_counter()
+    res = func(*args)
+    return res, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.bed")
+        write_bed6(path, args.rows)
+        n, t_plain = timeit(load, path, False)
+        _, t_cold = timeit(load, path, True)
+        _, t_warm = timeit(load, path, True)
+        assert os.path.isdir(bed_cache_path(path))
+    print(f"rows: {n}")
+    print(f"no cache:   {t_plain:.3f}s")
+    print(f"cold cache: {t_cold:.3f}s")
+    print(f"warm cache: {t_warm:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
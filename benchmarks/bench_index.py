@@ -0,0 +1,42 @@
+"""
+Benchmark build and query time of `luckyegg.index.IntervalIndex`.
+
+    python benchmarks/bench_index.py --intervals 1000000 --queries 1000000
+"""
+import time
+import argparse
+
+from luckyegg.index import IntervalIndex
+
+from generators import random_ranges
+
+
+def timeit(func, *args):
+    t0 = time.perf_counter()
+    res = func(*args)
+    return res, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--intervals", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    intervals = random_ranges(args.intervals, 0)
+    queries = random_ranges(args.queries, 1)
+    index, t_build = timeit(IntervalIndex, intervals)
+    _, t_count = timeit(index.count_overlaps, queries)
+    _, t_query = timeit(index.query, queries)
+    _, t_nearest = timeit(index.nearest, queries)
+    _, t_single = timeit(lambda: [index.overlap(queries[i]) for i in range(1000)])
+    print(f"intervals: {args.intervals}, queries: {args.queries}")
+    print(f"build:          {t_build:.3f}s")
+    print(f"count_overlaps: {t_count:.3f}s")
+    print(f"query:          {t_query:.3f}s")
+    print(f"nearest:        {t_nearest:.3f}s")
+    print(f"overlap x1000:  {t_single:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
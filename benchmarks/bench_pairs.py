@@ -0,0 +1,57 @@
+"""
+Benchmark building a cool file from a synthetic pairs file.
+
+    python benchmarks/bench_pairs.py --contacts 3000000 --workers 4
+"""
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from luckyegg.genome import ChromSizes
+from luckyegg.io.pairs import pairs_to_cool
+
+
+CHROMSIZES = {f"chr{i}": 250_000_000 - i * 8_000_000 for i in range(1, 23)}
+
+
+def write_pairs(path:str, n:int, seed:int=0) -> None:
+    rng = np.random.default_rng(seed)
+    chroms = np.array(list(CHROMSIZES))
+    sizes = np.array(list(CHROMSIZES.values()))
+    with open(path, 'w') as f:
+        for chrom, size in CHROMSIZES.items():
+            f.write(f"#chromsize: {chrom} {size}\n")
+        f.write("#columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2\n")
+        for i in range(0, n, 500_000):
+            m = min(500_000, n - i)
+            c1 = rng.integers(0, len(chroms), m)
+            c2 = np.where(rng.random(m) < 0.9, c1, rng.integers(0, len(chroms), m))
+            pos1 = rng.integers(1, sizes[c1] + 1)
+            pos2 = np.clip(pos1 + rng.geometric(1e-6, m), 1, sizes[c2])
+            rows = zip(chroms[c1], pos1.tolist(), chroms[c2], pos2.tolist())
+            f.write("".join(f".\t{a}\t{b}\t{c}\t{d}\t+\t-\n" for a, b, c, d in rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--contacts", type=int, default=3_000_000)
+    parser.add_argument("--binsize", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-memory", type=int, default=1 << 26)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.pairs")
+        write_pairs(path, args.contacts)
+        for workers in sorted({1, args.workers}):
+            t0 = time.perf_counter()
+            stats = pairs_to_cool(path, os.path.join(tmp, f"out{workers}.cool"), args.binsize,
+                                  max_memory=args.max_memory, workers=workers)
+            print(f"workers={workers}: {time.perf_counter() - t0:.3f}s {stats}")
+
+
+if __name__ == "__main__":
+    main()
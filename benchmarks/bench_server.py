@@ -0,0 +1,72 @@
+"""
+Load test the region-query service on one machine: many concurrent clients send
+overlapping queries of an HDF5 track through the HTTP endpoint on a Unix socket.
+
+    python benchmarks/bench_server.py --clients 64 --requests 50
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+import numpy as np
+
+from luckyegg.genome import ChromSizes, GenomeRange
+from luckyegg.io.hdf5 import TrackStore
+from luckyegg.server import RegionService, TrackSource
+
+
+async def client(path:str, n:int, seed:int, latencies:list) -> None:
+    rng = np.random.default_rng(seed)
+    reader, writer = await asyncio.open_unix_connection(path, limit=1 << 24)
+    for _ in range(n):
+        start = int(rng.integers(0, 1_000_000)) // 1000 * 1000  # aligned windows, like a genome browser
+        t0 = time.perf_counter()
+        writer.write(f"GET /query/signal?region=chr1:{start}-{start + 20_000} HTTP/1.1\r\n\r\n".encode())
+        await writer.drain()
+        await reader.readline()
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line == b"\r\n":
+                break
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":")[1])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - t0)
+    writer.close()
+
+
+async def run(service:RegionService, path:str, clients:int, requests:int) -> list:
+    latencies = []
+    server = await service.serve(path=path)
+    async with server:
+        await asyncio.gather(*[client(path, requests, i, latencies) for i in range(clients)])
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--window", type=float, default=0.002)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with TrackStore(os.path.join(tmp, "tracks.h5"), "w") as store:
+            track = store.create_track("signal", ChromSizes({"chr1": 1_200_000}), binsize=10)
+            track.write(GenomeRange("chr1", 0, 1_200_000), np.random.default_rng(0).random(120_000))
+            for window in (None, args.window):
+                service = RegionService({"signal": TrackSource(track)}, window=window or 0)  # 0: flush every loop iteration
+                t0 = time.perf_counter()
+                latencies = asyncio.run(run(service, os.path.join(tmp, "s.sock"), args.clients, args.requests))
+                total = time.perf_counter() - t0
+                service.close()
+                print(f"window={window or 0}: {len(latencies) / total:.0f} req/s, "
+                      f"p50={np.percentile(latencies, 50) * 1000:.1f}ms p99={np.percentile(latencies, 99) * 1000:.1f}ms, "
+                      f"reads={service.stats['reads']} queries={service.stats['queries']}")
+
+
+if __name__ == "__main__":
+    main()
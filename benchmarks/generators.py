@@ -0,0 +1,109 @@
+"""
+Scalable synthetic data for the benchmarks, all generators are seeded(reproducible).
+"""
+from typing import Dict, List
+
+import numpy as np
+
+from luckyegg.genome import GenomeRangeArray
+
+
+CHROMS = [f"chr{i}" for i in range(1, 23)]
+CHROM_LEN = 100_000_000
+BED_TYPE_NAMES = ("Bed6", "Bed9", "Bed12", "BedGraph", "BedGeneral")
+
+
+def chromsizes(n_chroms:int=22, chrom_len:int=CHROM_LEN) -> Dict[str, int]:
+    return {f"chr{i}": chrom_len - i * 1000 for i in range(1, n_chroms + 1)}
+
+
+def random_ranges(n:int, seed:int, n_chroms:int=22, chrom_len:int=CHROM_LEN, max_len:int=2000) -> GenomeRangeArray:
+    rng = np.random.default_rng(seed)
+    chroms = [f"chr{i}" for i in range(1, n_chroms + 1)]
+    codes = rng.integers(0, n_chroms, n)
+    start = rng.integers(0, chrom_len, n)
+    end = start + rng.integers(1, max_len, n)
+    return GenomeRangeArray(chroms, codes, start, end)
+
+
+def _join(columns:List[np.ndarray]) -> List[str]:
+    out = columns[0].astype(str)
+    for col in columns[1:]:
+        out = np.char.add(np.char.add(out, "\t"), col.astype(str))
+    return out.tolist()
+
+
+def bed_lines(bed_type:str, n:int, seed:int=0) -> List[str]:
+    """
+    Random BED lines(without newline) of a BED type name, see `BED_TYPE_NAMES`.
+    """
+    rng = np.random.default_rng(seed)
+    chrom = np.array(CHROMS)[rng.integers(0, len(CHROMS), n)]
+    start = rng.integers(0, CHROM_LEN - 10000, n)
+    end = start + rng.integers(1, 5000, n)
+    if bed_type == "BedGraph":
+        return _join([chrom, start, end, np.round(rng.normal(size=n), 4)])
+    name = np.char.add("peak", np.arange(n).astype(str))
+    score = rng.integers(0, 1000, n)
+    strand = np.array(["+", "-", "."])[rng.integers(0, 3, n)]
+    columns = [chrom, start, end, name, score, strand]
+    if bed_type == "Bed6":
+        return _join(columns)
+    if bed_type == "BedGeneral":
+        extra = rng.integers(0, 100, n)
+        return _join(columns + [extra])
+    columns += [start, end, np.array(["255,0,0", "0,0,255"])[rng.integers(0, 2, n)]]
+    if bed_type == "Bed9":
+        return _join(columns)
+    if bed_type == "Bed12":
+        return _join(columns + [np.full(n, 2), np.full(n, "567,488,"), np.full(n, "0,3512")])
+    raise ValueError(f"Unknown BED type: {bed_type}")
+
+
+def write_bed(path:str, bed_type:str, n:int, seed:int=0, chunk:int=200_000) -> str:
+    """
+    Write a random BED file with `n` lines.
+    """
+    with open(path, 'w') as f:
+        for i in range(0, n, chunk):
+            lines = bed_lines(bed_type, min(chunk, n - i), seed + i)
+            f.write("\n".join(lines) + "\n")
+    return path
+
+
+def write_bed6(path:str, n:int, seed:int=0) -> str:
+    return write_bed(path, "Bed6", n, seed)
+
+
+def region_strings(n:int, seed:int=0) -> List[str]:
+    """
+    Random region strings, mixed 'chr:start-end', 'chr:pos' and 'chr' forms.
+    """
+    rng = np.random.default_rng(seed)
+    chrom = np.array(CHROMS)[rng.integers(0, len(CHROMS), n)]
+    start = rng.integers(0, CHROM_LEN, n)
+    end = start + rng.integers(1, 100000, n)
+    ranges = np.char.add(np.char.add(np.char.add(chrom, ":"), start.astype(str)),
+                         np.char.add("-", end.astype(str)))
+    kind = rng.random(n)
+    out = np.where(kind < 0.9, ranges, np.where(kind < 0.95, np.char.add(np.char.add(chrom, ":"), start.astype(str)), chrom))
+    return out.tolist()
+
+
+def create_cool(path:str, n_bins:int, n_contacts:int, binsize:int=10_000, seed:int=0) -> str:
+    """
+    Small .cool file of 3 chromosomes with `n_bins` bins in total, contacts decay with distance.
+    """
+    import pandas as pd
+    import cooler
+    sizes = pd.Series({"chr1": n_bins // 2 * binsize, "chr2": n_bins // 3 * binsize,
+                       "chr3": (n_bins - n_bins // 2 - n_bins // 3) * binsize})
+    bins = cooler.binnify(sizes, binsize)
+    rng = np.random.default_rng(seed)
+    bins["weight"] = rng.uniform(0.5, 1.5, len(bins))
+    i = rng.integers(0, len(bins), n_contacts)
+    j = np.clip(i + rng.geometric(0.01, n_contacts) - 1, 0, len(bins) - 1)
+    keys, counts = np.unique(i * len(bins) + j, return_counts=True)
+    pixels = pd.DataFrame({"bin1_id": keys // len(bins), "bin2_id": keys % len(bins), "count": counts})
+    cooler.create_cooler(path, bins, pixels, ordered=True)
+    return path
@@ -0,0 +1,235 @@
+"""
+Benchmark suite of the hot paths, results are written in JSON so runs can be compared.
+
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --profile full --filter 'io.bed' --output new.json --compare results.json
+
+Each case is timed `--repeat` times on synthetic data of several sizes(the 'quick' profile
+only runs the smallest one), the fastest run(least affected by noise) is compared.
+With `--compare`, cases slower than the baseline by more than `--threshold`(relative)
+are reported as regressions and the exit code is 1.
+"""
+import os
+import re
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from generators import BED_TYPE_NAMES, random_ranges, region_strings, write_bed, create_cool
+
+
+PROFILES = {"quick": 1, "full": None}  # number of data sizes of each case to run, None for all
+MIN_DIFF = 0.002  # seconds, smaller differences are noise
+
+CASES = {}
+
+
+def case(name:str, sizes:List[int]):
+    """
+    Register a benchmark case. The decorated function `setup(n, tmp_dir)` prepare the data
+    of size `n` and return the function to be timed.
+    """
+    def deco(setup:Callable) -> Callable:
+        CASES[name] = (setup, sizes)
+        return setup
+    return deco
+
+
+@case("genome.genome_range", [10_000, 100_000])
+def _(n, tmp):
+    from luckyegg.genome import genome_range
+    regions = region_strings(n)
+    return lambda: [genome_range(r) for r in regions]
+
+
+@case("genome.GenomeRange.from_str", [10_000, 100_000])
+def _(n, tmp):
+    from luckyegg.genome import GenomeRange
+    regions = region_strings(n)
+    return lambda: [GenomeRange.from_str(r) for r in regions]
+
+
+@case("genome.parse_regions", [100_000, 1_000_000])
+def _(n, tmp):
+    from luckyegg.genome import parse_regions
+    regions = region_strings(n)
+    return lambda: parse_regions(regions)
+
+
+@case("genome.GenomeRange.to_bin", [10_000, 100_000])
+def _(n, tmp):
+    granges = random_ranges(n, 0).to_granges()
+    return lambda: [g.to_bin(1000) for g in granges]
+
+
+@case("genome.GenomeRangeArray.to_bin", [1_000_000, 10_000_000])
+def _(n, tmp):
+    ranges = random_ranges(n, 0)
+    return lambda: ranges.to_bin(1000)
+
+
+@case("genome.ChromSizes.to_bin", [1_000, 100_000])
+def _(n, tmp):
+    from luckyegg.genome import ChromSizes
+    sizes = {f"contig{i}": 1000 + i for i in range(n)}  # draft assemblies have many contigs
+    return lambda: ChromSizes(sizes).to_bin(1000)
+
+
+for _bed_type in BED_TYPE_NAMES:
+    @case(f"io.bed.read_bed[{_bed_type}]", [20_000, 200_000])
+    def _(n, tmp, bed_type=_bed_type):
+        from luckyegg.io.bed import read_bed
+        path = write_bed(os.path.join(tmp, f"{bed_type}.bed"), bed_type, n)
+        return lambda: list(read_bed(path, general=bed_type == "BedGeneral"))
+
+    @case(f"io.bed.read_bed_batches[{_bed_type}]", [200_000, 2_000_000])
+    def _(n, tmp, bed_type=_bed_type):
+        from luckyegg.io.bed import read_bed_batches
+        path = write_bed(os.path.join(tmp, f"{bed_type}.bed"), bed_type, n)
+        return lambda: sum(len(b) for b in read_bed_batches(path, general=bed_type == "BedGeneral"))
+
+
+@case("io.bed.cache_warm", [200_000, 2_000_000])
+def _(n, tmp):
+    from luckyegg.io.bed import read_bed_batches
+    path = write_bed(os.path.join(tmp, "cached.bed"), "Bed6", n)
+    sum(len(b) for b in read_bed_batches(path, cache=True))
+    return lambda: sum(len(b) for b in read_bed_batches(path, cache=True))
+
+
+@case("io.bed.write_bed", [200_000, 2_000_000])
+def _(n, tmp):
+    from luckyegg.io.bed import read_bed_batches, write_bed as write
+    batches = list(read_bed_batches(write_bed(os.path.join(tmp, "in.bed"), "Bed6", n)))
+    return lambda: write(os.path.join(tmp, "out.bed"), batches)
+
+
+@case("index.IntervalIndex", [100_000, 1_000_000])
+def _(n, tmp):
+    from luckyegg.index import IntervalIndex
+    intervals, queries = random_ranges(n, 0), random_ranges(n, 1)
+    return lambda: IntervalIndex(intervals).count_overlaps(queries)
+
+
+def _matrix_case(n_bins:int, tmp:str, warm:bool):
+    from cooler.api import Cooler
+    from luckyegg.genome import GenomeBinRange
+    from luckyegg.io.hicmatrix import MatrixSelector
+    path = create_cool(os.path.join(tmp, f"{n_bins}.cool"), n_bins, n_bins * 50)
+    cool = Cooler(path)
+    rng = np.random.default_rng(0)
+    n_chr1 = n_bins // 2
+    windows = [GenomeBinRange("chr1", s, s + 200) for s in rng.integers(0, n_chr1 - 200, 50).tolist()]
+    selector = MatrixSelector(cool)
+    if warm:
+        for w in windows:
+            selector.fetch(w)
+        return lambda: [selector.fetch(w) for w in windows]
+    return lambda: [MatrixSelector(cool).fetch(w) for w in windows]
+
+
+@case("hicmatrix.MatrixSelector.fetch_cold", [2_000, 20_000])
+def _(n, tmp):
+    return _matrix_case(n, tmp, warm=False)
+
+
+@case("hicmatrix.MatrixSelector.fetch_warm", [2_000, 20_000])
+def _(n, tmp):
+    return _matrix_case(n, tmp, warm=True)
+
+
+def run_case(name:str, n:int, repeat:int) -> Dict:
+    setup, _ = CASES[name]
+    with tempfile.TemporaryDirectory(prefix="luckyegg-bench-") as tmp:
+        func = setup(n, tmp)
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - t0)
+    return {"case": name, "size": n, "repeat": repeat,
+            "min": min(times), "median": float(np.median(times))}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def metadata(profile:str) -> Dict:
+    return {"profile": profile, "commit": _git_commit(), "python": platform.python_version(),
+            "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(results:List[Dict], baseline:List[Dict], threshold:float) -> List[Dict]:
+    """
+    Compare the fastest runs with a baseline run, return the regressions.
+    """
+    base = {(r["case"], r["size"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = base.get((r["case"], r["size"]))
+        if b is None:
+            continue
+        ratio = r["min"] / b["min"] if b["min"] > 0 else float("inf")
+        r["baseline"], r["ratio"] = b["min"], ratio
+        if ratio > 1 + threshold and r["min"] - b["min"] > MIN_DIFF:
+            regressions.append(r)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=list(PROFILES), default="quick")
+    parser.add_argument("--filter", default=None, help="Regex of the case names to run.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None, help="Path of the JSON results.")
+    parser.add_argument("--compare", default=None, help="Path of baseline JSON results.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative slowdown.")
+    parser.add_argument("--list", action="store_true", help="List the cases.")
+    args = parser.parse_args()
+
+    names = [n for n in CASES if args.filter is None or re.search(args.filter, n)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+    n_sizes = PROFILES[args.profile]
+    results = []
+    for name in names:
+        for size in CASES[name][1][:n_sizes]:
+            res = run_case(name, size, args.repeat)
+            results.append(res)
+            print(f"{name:<45} n={res['size']:<10} median={res['median']:.4f}s min={res['min']:.4f}s", flush=True)
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        print(f"\nCompared with {args.compare}(threshold {args.threshold:.0%}):")
+        for r in results:
+            if "ratio" in r:
+                flag = "  REGRESSION" if r in regressions else ""
+                print(f"{r['case']:<45} n={r['size']:<10} {r['baseline']:.4f}s -> {r['min']:.4f}s "
+                      f"x{r['ratio']:.2f}{flag}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"meta": metadata(args.profile), "results": results}, f, indent=2)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s).")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
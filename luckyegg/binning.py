@@ -0,0 +1,228 @@
+"""
+Aggregate interval signal(peaks, bedGraph values) to fixed-size genome bins.
+
+Bins of all chromosomes are stored in dense genome-wide arrays, indexed by the
+global bin id(see `ChromSizes.offsets`). Intervals are split to the bins they overlap
+and scatter-added to the arrays chunk by chunk, so the input is streamed.
+"""
+from itertools import chain
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from luckyegg.genome import GenomeRangeArray, GenomeBinRange, ChromSizes, NONE_POS
+
+
+AGGREGATIONS = ("sum", "mean", "max", "count")
+
+
+def split_to_bins(ranges:GenomeRangeArray,
+        chromsizes:ChromSizes,
+        binsize:int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Split intervals to the bins they overlap with.
+    Intervals are clipped to the chromosomes, points(end is None) are treated as one base intervals.
+
+    Return
+    ------
+    index : numpy.ndarray
+        Index of the interval of each piece.
+    bins : numpy.ndarray
+        Global bin id of each piece.
+    overlap : numpy.ndarray
+        Overlap length(bp) of the interval and the bin.
+    """
+    if np.any(ranges.start == NONE_POS):
+        raise ValueError("Ranges must have start.")
+    codes = chromsizes.range_codes(ranges)
+    sizes = chromsizes.lengths()[codes]
+    start = np.clip(ranges.start, 0, sizes)
+    end = np.where(ranges.end == NONE_POS, ranges.start + 1, ranges.end)
+    end = np.clip(end, start, sizes)
+    first = start // binsize
+    n_bins = np.where(end > start, (end - 1) // binsize - first + 1, 0)
+    index = np.repeat(np.arange(len(ranges)), n_bins)
+    # bin of each piece = first bin of the interval + rank of the piece within the interval
+    piece_offsets = np.cumsum(n_bins) - n_bins
+    local = first[index] + np.arange(index.shape[0]) - piece_offsets[index]
+    overlap = np.minimum(end[index], (local + 1) * binsize) - np.maximum(start[index], local * binsize)
+    bins = chromsizes.offsets(binsize)[codes][index] + local
+    return index, bins, overlap
+
+
+class BinnedSignal(object):
+    """
+    Accumulator of interval values in fixed-size genome bins.
+
+    Aggregations:
+        sum: sum of value * overlap length(or value if not weighted).
+        mean: sum divided by the total overlap length(or number of intervals),
+            NaN for bins without intervals.
+        max: max value of intervals overlap with the bin, NaN for bins without intervals.
+        count: total overlap length(bases covered, with multiplicity), or number of intervals.
+
+    Parameters
+    ----------
+    chromsizes : `luckyegg.genome.ChromSizes`
+        Chromosome sizes of the genome, unit in 'bp'.
+    binsize : int
+        Bin size.
+    agg : {'sum', 'mean', 'max', 'count'}
+        Aggregation.
+    weighted : bool
+        Weight values by the overlap length of interval and bin or not.
+    """
+    def __init__(self, chromsizes:ChromSizes, binsize:int, agg:str="mean", weighted:bool=True) -> None:
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"agg must be one of {AGGREGATIONS}, got {agg!r}.")
+        if binsize < 1:
+            raise ValueError("binsize must be positive.")
+        self.chromsizes = chromsizes.to_bp(binsize)
+        self.binsize = binsize
+        self.agg = agg
+        self.weighted = weighted
+        self.n_bins = int(self.chromsizes.offsets(binsize)[-1])
+        if agg == "max":
+            self._acc = np.full(self.n_bins, -np.inf)
+        else:
+            self._acc = np.zeros(self.n_bins)
+        self._weight = np.zeros(self.n_bins) if agg == "mean" else None
+
+    def __repr__(self) -> str:
+        return f"BinnedSignal(binsize={self.binsize}, agg={self.agg!r}, n_bins={self.n_bins})"
+
+    def _scatter_add(self, out:np.ndarray, bins:np.ndarray, weights:np.ndarray) -> None:
+        # bincount over the whole genome is cheaper only when the chunk is dense
+        if bins.shape[0] * 8 >= self.n_bins:
+            out += np.bincount(bins, weights=weights, minlength=self.n_bins)
+        else:
+            np.add.at(out, bins, weights)
+
+    def add(self, ranges:GenomeRangeArray, values:Optional[np.ndarray]=None) -> None:
+        """
+        Add a chunk of intervals.
+
+        Parameters
+        ----------
+        ranges : `luckyegg.genome.GenomeRangeArray`
+            Intervals, unit in 'bp'.
+        values : numpy.ndarray, optional
+            Value of each interval, default is 1.
+        """
+        if values is None:
+            values = np.ones(len(ranges))
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape[0] != len(ranges):
+            raise ValueError(f"Length mismatch: {len(ranges)} ranges, {values.shape[0]} values.")
+        index, bins, overlap = split_to_bins(ranges, self.chromsizes, self.binsize)
+        if index.shape[0] == 0:
+            return
+        weight = overlap.astype(np.float64) if self.weighted else np.ones(index.shape[0])
+        if self.agg == "max":
+            np.maximum.at(self._acc, bins, values[index])
+        elif self.agg == "count":
+            self._scatter_add(self._acc, bins, weight)
+        else:
+            self._scatter_add(self._acc, bins, values[index] * weight)
+            if self._weight is not None:
+                self._scatter_add(self._weight, bins, weight)
+
+    def to_array(self) -> np.ndarray:
+        """
+        Genome-wide array of the aggregated values, indexed by global bin id.
+        """
+        if self.agg == "max":
+            return np.where(np.isneginf(self._acc), np.nan, self._acc)
+        elif self.agg == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.where(self._weight > 0, self._acc / self._weight, np.nan)
+        return self._acc.copy()
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        """
+        Aggregated values of each chromosome.
+        """
+        arr = self.to_array()
+        offsets = self.chromsizes.offsets(self.binsize)
+        return {chrom: arr[offsets[i]:offsets[i+1]] for i, chrom in enumerate(self.chromsizes.chroms)}
+
+    def write_track(self, store, name:str, dtype:str="float32"):
+        """
+        Write to a track of `luckyegg.io.hdf5.TrackStore`, the track is created if not exists.
+        Return the `luckyegg.io.hdf5.Track`.
+        """
+        if name in store:
+            track = store[name]
+            if track.binsize != self.binsize:
+                raise ValueError(f"Track {name} has binsize {track.binsize}, expect {self.binsize}.")
+        else:
+            track = store.create_track(name, self.chromsizes, binsize=self.binsize, dtype=dtype)
+        for chrom, values in self.to_dict().items():
+            track.write(GenomeBinRange(chrom, 0, values.shape[0]), values)
+        return track
+
+
+def _value_column(batch, column:Optional[str]) -> Optional[np.ndarray]:
+    if column is None:
+        column = "value" if "value" in batch.values else None
+        return None if column is None else batch.values[column]
+    if column not in batch.values:
+        raise ValueError(f"Column {column} is not numeric or not in {batch.bed_type.__name__} records.")
+    return batch.values[column]
+
+
+def bin_signal(source,
+        chromsizes:ChromSizes,
+        binsize:int,
+        agg:str="mean",
+        weighted:bool=True,
+        column:Optional[str]=None,
+        store=None,
+        track:Optional[str]=None) -> BinnedSignal:
+    """
+    Aggregate BED/bedGraph signal to fixed-size bins, input is read and added chunk by chunk.
+
+    Parameters
+    ----------
+    source : {str, file object, iterable}
+        Path or file object of a BED file, BED records, `BEDBatch`es,
+        or (GenomeRangeArray, values) pairs.
+    chromsizes : `luckyegg.genome.ChromSizes`
+        Chromosome sizes of the genome, unit in 'bp'.
+    binsize : int
+        Bin size.
+    agg : {'sum', 'mean', 'max', 'count'}
+        Aggregation, see `BinnedSignal`.
+    weighted : bool
+        Weight values by the overlap length of interval and bin or not.
+    column : str, optional
+        Numeric column used as the value, default is 'value' of bedGraph, 1 for other records.
+    store : `luckyegg.io.hdf5.TrackStore`, optional
+        Write the result to the store.
+    track : str, optional
+        Track name in the store.
+    """
+    binned = BinnedSignal(chromsizes, binsize, agg, weighted)
+    for ranges, values in _iter_chunks(source, column):
+        binned.add(ranges, values)
+    if store is not None:
+        if track is None:
+            raise ValueError("Track name is required to write to the store.")
+        binned.write_track(store, track)
+    return binned
+
+
+def _iter_chunks(source, column:Optional[str]) -> Iterator[Tuple[GenomeRangeArray, Optional[np.ndarray]]]:
+    from luckyegg.io.bed import _as_batches
+    if not isinstance(source, str) and not hasattr(source, "read"):
+        source = iter(source)
+        first = next(source, None)
+        if first is None:
+            return
+        if isinstance(first, tuple) and isinstance(first[0], GenomeRangeArray):
+            yield first
+            yield from source
+            return
+        source = chain([first], source)
+    for batch in _as_batches(source):
+        yield batch.ranges, _value_column(batch, column)
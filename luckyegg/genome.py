@@ -1,8 +1,23 @@
 import re
+import sys
 from collections import namedtuple
-from typing import Union, Any
+from typing import Union, Any, Iterable, List, Optional, Tuple
 import doctest
 
+import numpy as np
+
+from luckyegg.utils import as_bytes_array, split_lines, non_digit_prefix, all_digits, gather_bytes, decode_bytes
+
+
+_REGION_SEP = re.compile("[:-]")
+
+
+def intern_chrom(chrom:str) -> str:
+    """
+    Intern a chromosome name, so equal names share one str object.
+    """
+    return sys.intern(chrom)
+
 
 def change_chromname(chrom:str) -> str:
     if chrom.startswith("chr"):
@@ -107,17 +122,26 @@ class GenomeRange(GenomeRange_):
 
     @staticmethod
     def from_str(region:str) -> 'GenomeRange':
-        if '-' in region:
-            chr_, s_, e_ = re.split("[:-]", region)[:3]
+        """
+        Parse a region string like 'chr1:1000-2000', 'chr1:1000' or 'chr1'.
+
+        >>> GenomeRange.from_str("chr1:1000-2000")
+        GenomeRange(chr1, 1000, 2000)
+        """
+        chr_, colon, rest = region.partition(":")
+        if colon and rest.count("-") == 1 and "-" not in chr_ and ":" not in rest:
+            s_, _, e_ = rest.partition("-")
+            grange = GenomeRange(intern_chrom(chr_), int(s_), int(e_))
+        elif '-' in region:
+            chr_, s_, e_ = _REGION_SEP.split(region)[:3]
             s, e = int(s_), int(e_)
-            grange = GenomeRange(chr_, s, e)
-        elif ':' in region:
-            chr_, s_ = region.split(":")
-            s = int(s_)
-            grange = GenomeRange(chr_, s, None)
+            grange = GenomeRange(intern_chrom(chr_), s, e)
+        elif colon:
+            if ":" in rest:
+                raise ValueError(f"Invalid region string: {region}")
+            grange = GenomeRange(intern_chrom(chr_), int(rest), None)
         else:
-            chr_ = region
-            grange = GenomeRange(chr_, None, None)
+            grange = GenomeRange(intern_chrom(region), None, None)
         return grange
 
     @staticmethod
@@ -209,10 +233,353 @@ def genome_range(*args) -> GenomeRange:
     return result
 
 
+NONE_POS = np.iinfo(np.int64).min  # marker of a missing(None) position in GenomeRangeArray
+
+
+def _range_type_masks(start:np.ndarray, end:np.ndarray):
+    """
+    Vectorized version of `GenomeRange.range_type`,
+    return masks of 'chromosome', 'point' and 'range'.
+    """
+    start_none = start == NONE_POS
+    end_none = end == NONE_POS
+    is_chromosome = start_none & end_none
+    is_point = ~start_none & (end_none | (start + 1 == end))
+    is_range = ~start_none & ~is_point
+    return is_chromosome, is_point, is_range
+
+
+class GenomeRangeArray(object):
+    """
+    Columnar array of genome ranges,
+    store chromosome codes and start/end positions in NumPy arrays.
+
+    Attributes
+    ----------
+    chroms : list of str
+        Chromosome names, the `codes` index into it.
+    codes : numpy.ndarray
+        Chromosome code of each range, int32.
+    start : numpy.ndarray
+        Range start positions, int64. None is stored as `NONE_POS`.
+    end : numpy.ndarray
+        Range end positions, int64. None is stored as `NONE_POS`.
+    """
+    scalar_type = GenomeRange
+
+    def __init__(self, chroms:List[str], codes:np.ndarray, start:np.ndarray, end:np.ndarray) -> None:
+        self.chroms = chroms if isinstance(chroms, list) else list(chroms)
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.start = np.asarray(start, dtype=np.int64)
+        self.end = np.asarray(end, dtype=np.int64)
+        if not (self.codes.shape == self.start.shape == self.end.shape):
+            raise ValueError("codes, start and end must have the same shape.")
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(n={len(self)}, chroms={self.chroms})"
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            start, end = self.start[key], self.end[key]
+            return self.scalar_type(
+                self.chroms[self.codes[key]],
+                None if start == NONE_POS else int(start),
+                None if end == NONE_POS else int(end))
+        return self.__class__(self.chroms, self.codes[key], self.start[key], self.end[key])
+
+    def __iter__(self):
+        return iter(self.to_granges())
+
+    @classmethod
+    def from_granges(cls, granges:Iterable[GenomeRange]) -> 'GenomeRangeArray':
+        """
+        Construct from GenomeRange objects.
+
+        >>> GenomeRangeArray.from_granges([GenomeRange("chr1", 0, 100), GenomeRange("chr2", 10, None)])
+        GenomeRangeArray(n=2, chroms=['chr1', 'chr2'])
+        """
+        granges = list(granges)
+        if len(granges) == 0:
+            return cls([], [], [], [])
+        chrom, start, end = zip(*granges)
+        chrom_index = {}
+        codes = [chrom_index.setdefault(c, len(chrom_index)) for c in chrom]
+        n = len(granges)
+        start = np.fromiter((NONE_POS if s is None else s for s in start), dtype=np.int64, count=n)
+        end = np.fromiter((NONE_POS if e is None else e for e in end), dtype=np.int64, count=n)
+        return cls(list(chrom_index), codes, start, end)
+
+    @classmethod
+    def from_arrays(cls, chrom:Iterable[str], start:Iterable[int], end:Iterable[int]) -> 'GenomeRangeArray':
+        """
+        Construct from a array of chromosome names and start/end arrays.
+        """
+        chroms, codes = np.unique(np.asarray(chrom), return_inverse=True)
+        return cls([str(c) for c in chroms], codes.ravel(), start, end)
+
+    @classmethod
+    def concat(cls, arrays:Iterable['GenomeRangeArray']) -> 'GenomeRangeArray':
+        """
+        Concatenate arrays, their chromosome codes are remapped to a shared code space.
+        """
+        arrays = list(arrays)
+        if len(arrays) == 0:
+            return cls([], [], [], [])
+        chroms = arrays[0].chroms
+        if all(a.chroms is chroms for a in arrays):
+            codes = [a.codes for a in arrays]
+        else:
+            chrom_index = {}
+            codes = []
+            for a in arrays:
+                lut = np.array([chrom_index.setdefault(c, len(chrom_index)) for c in a.chroms] + [-1], dtype=np.int32)
+                codes.append(lut[a.codes])
+            chroms = list(chrom_index)
+        return cls(chroms,
+                   np.concatenate(codes),
+                   np.concatenate([a.start for a in arrays]),
+                   np.concatenate([a.end for a in arrays]))
+
+    def to_granges(self) -> List[GenomeRange]:
+        """
+        Convert to a list of GenomeRange objects.
+        """
+        chrom = np.array(self.chroms + [None], dtype=object)[self.codes]
+        start = self.start.astype(object)
+        start[self.start == NONE_POS] = None
+        end = self.end.astype(object)
+        end[self.end == NONE_POS] = None
+        return list(map(self.scalar_type, chrom, start, end))
+
+    @property
+    def chrom(self) -> np.ndarray:
+        """
+        Chromosome name of each range.
+        """
+        return np.array(self.chroms, dtype=object)[self.codes]
+
+    @property
+    def range_type(self) -> np.ndarray:
+        """
+        Genome range type of each range, see `GenomeRange.range_type`.
+        """
+        is_chromosome, is_point, _ = _range_type_masks(self.start, self.end)
+        types = np.full(len(self), "range", dtype=object)
+        types[is_point] = "point"
+        types[is_chromosome] = "chromosome"
+        return types
+
+    def lengths(self) -> np.ndarray:
+        """
+        Length of each range, see `GenomeRange.__len__`.
+        """
+        start_none = self.start == NONE_POS
+        end_none = self.end == NONE_POS
+        if np.any(start_none & end_none):
+            raise ValueError("If start and end both None, can not compute length")
+        return np.where(end_none, 1, np.abs(self.end - self.start))
+
+    def check(self) -> np.ndarray:
+        """
+        Check each range is valid or not, see `GenomeRange.check`.
+        Return a boolean mask instead of raising on the first invalid range.
+        """
+        start_none = self.start == NONE_POS
+        end_none = self.end == NONE_POS
+        valid = (self.codes >= 0) & (self.codes < len(self.chroms))
+        valid &= ~(start_none & ~end_none)
+        valid &= start_none | end_none | (self.start <= self.end)
+        return valid
+
+    def to_bin(self, binsize:int) -> 'GenomeBinRangeArray':
+        """
+        Convert to GenomeBinRangeArray, unit in 'bin'.
+        """
+        start_none = self.start == NONE_POS
+        end_none = self.end == NONE_POS
+        start = np.where(start_none, self.start, self.start // binsize)
+        end = np.where(start_none | end_none, self.end,
+                       self.end // binsize - (self.end % binsize == 0) + 1)
+        return GenomeBinRangeArray(self.chroms, self.codes, start, end)
+
+    def _align_codes(self, another:Union[GenomeRange, 'GenomeRangeArray']) -> np.ndarray:
+        """
+        Codes of another's chromosomes in this array's code space,
+        chromosomes not in this array get -1.
+        """
+        chrom_index = {c: i for i, c in enumerate(self.chroms)}
+        if isinstance(another, GenomeRange):
+            return np.int32(chrom_index.get(another.chrom, -1))
+        lut = np.array([chrom_index.get(c, -1) for c in another.chroms] + [-1], dtype=np.int32)
+        return lut[another.codes]
+
+    def _columns(self, another:Union[GenomeRange, 'GenomeRangeArray']):
+        if isinstance(another, GenomeRange):
+            start = NONE_POS if another.start is None else another.start
+            end = NONE_POS if another.end is None else another.end
+            return self._align_codes(another), np.int64(start), np.int64(end)
+        elif isinstance(another, GenomeRangeArray):
+            if len(another) != len(self):
+                raise ValueError(f"Length mismatch: {len(self)} != {len(another)}")
+            return self._align_codes(another), another.start, another.end
+        else:
+            raise TypeError("Expect GenomeRange or GenomeRangeArray object.")
+
+    def contains(self, another:Union[GenomeRange, 'GenomeRangeArray']) -> np.ndarray:
+        """
+        Element-wise `another in self`, see `GenomeRange.__contains__`.
+        `another` can be a GenomeRange(broadcast) or a GenomeRangeArray with same length.
+
+        >>> arr = GenomeRangeArray.from_granges([GenomeRange("chr1", 0, 100), GenomeRange("chr2", 0, 100)])
+        >>> arr.contains(GenomeRange("chr1", 10, 20))
+        array([ True, False])
+        """
+        codes, start, end = self._columns(another)
+        return _contains(self.codes, self.start, self.end, codes, start, end)
+
+    def within(self, another:Union[GenomeRange, 'GenomeRangeArray']) -> np.ndarray:
+        """
+        Element-wise `self in another`, see `GenomeRange.__contains__`.
+        """
+        codes, start, end = self._columns(another)
+        return _contains(codes, start, end, self.codes, self.start, self.end)
+
+
+class GenomeBinRangeArray(GenomeRangeArray):
+    """
+    Similar to GenomeRangeArray, but the unit is the number of 'bin'.
+    """
+    scalar_type = GenomeBinRange
+
+    def to_bp(self, binsize:int) -> GenomeRangeArray:
+        """
+        Convert to GenomeRangeArray, unit in 'bp'
+        """
+        start_none = self.start == NONE_POS
+        end_none = self.end == NONE_POS
+        start = np.where(start_none, self.start, self.start * binsize)
+        end = np.where(start_none | end_none, self.end, self.end * binsize)
+        return GenomeRangeArray(self.chroms, self.codes, start, end)
+
+
+def _contains(codes:np.ndarray, start:np.ndarray, end:np.ndarray,
+              codes_:np.ndarray, start_:np.ndarray, end_:np.ndarray) -> np.ndarray:
+    """
+    Vectorized `GenomeRange.__contains__`, test (codes_, start_, end_) in (codes, start, end).
+    Negative codes(invalid rows, or chromosomes missing from the other array) never match.
+    """
+    chrom, point, range_ = _range_type_masks(start, end)
+    chrom_, point_, range_in = _range_type_masks(start_, end_)
+    res = range_ & range_in & (start_ >= start) & (end_ <= end)
+    res |= range_ & point_ & (start <= start_) & (start_ < end)
+    res |= chrom & (point_ | range_in)
+    res |= point & point_ & (start == start_) & (end == end_)
+    return res & (codes == codes_) & (codes >= 0) & (codes_ >= 0)
+
+
+def _join_regions(regions:Union[Iterable[str], np.ndarray]) -> bytes:
+    if isinstance(regions, np.ndarray) and regions.dtype.kind == "S":
+        return b"\n".join(regions.tolist()) + b"\n"
+    if isinstance(regions, np.ndarray):
+        regions = regions.astype(str).tolist()
+    return ("\n".join(regions) + "\n").encode()
+
+
+def parse_regions(regions:Union[Iterable[str], np.ndarray],
+        chroms:Optional[List[str]]=None) -> Tuple[GenomeRangeArray, np.ndarray]:
+    """
+    Parse many region strings('chr1:1000-2000', 'chr1:1000' or 'chr1')
+    to a GenomeRangeArray in one vectorized pass, see `GenomeRange.from_str`.
+
+    Invalid strings(positions are not non-negative integers, start > end, empty chromosome, ...)
+    do not raise, they are reported by the returned mask, and stored with chrom code -1
+    and `NONE_POS` start/end. Use `ranges[mask]` to get the valid ones.
+
+    Parameters
+    ----------
+    regions : iterable of str, or numpy.ndarray of str/bytes
+        Region strings, should not contain newlines.
+    chroms : list of str, optional
+        Chromosome names seen before, new chromosomes will be appended to it,
+        so codes of different calls can be shared.
+
+    >>> ranges, valid = parse_regions(["chr1:100-200", "chr2:5", "chrX", "chr1:2-1"])
+    >>> ranges[valid].to_granges()
+    [GenomeRange(chr1, 100, 200), GenomeRange(chr2, 5, None), GenomeRange(chrX, None, None)]
+    >>> valid
+    array([ True,  True,  True, False])
+    """
+    chroms = [] if chroms is None else chroms
+    if not isinstance(regions, np.ndarray):
+        regions = list(regions)
+    if len(regions) == 0:
+        return GenomeRangeArray(chroms, [], [], []), np.zeros(0, dtype=bool)
+    data = _join_regions(regions)
+    buf = as_bytes_array(data)
+    line_starts, line_ends = split_lines(buf)
+    n = line_starts.shape[0]
+    colon = buf == ord(":")
+    is_sep = colon | (buf == ord("-"))
+    sep_pos = np.flatnonzero(is_sep)
+    sep_line = np.searchsorted(line_ends, sep_pos)
+    n_sep = np.bincount(sep_line, minlength=n)
+    n_colon = np.bincount(np.searchsorted(line_ends, np.flatnonzero(colon)), minlength=n)
+    first_sep = np.cumsum(n_sep) - n_sep
+
+    def sep(k):
+        """Position of the k-th separator of each line, line end if not exists."""
+        idx = np.minimum(first_sep + k, max(sep_pos.shape[0] - 1, 0))
+        pos = sep_pos[idx] if sep_pos.shape[0] > 0 else line_ends
+        return np.where(n_sep > k, pos, line_ends)
+
+    # same rules as GenomeRange.from_str
+    has_dash = n_sep > n_colon
+    is_range = has_dash
+    is_point = ~has_dash & (n_colon > 0)
+    p1, p2, p3 = sep(0), sep(1), sep(2)
+    chrom_end = np.where(is_range | is_point, p1, line_ends)
+    start_beg, start_end = p1 + 1, np.where(is_range, p2, line_ends)
+    end_beg, end_end = p2 + 1, p3
+    prefix = non_digit_prefix(buf)
+    start_ok = all_digits(prefix, start_beg, start_end)
+    valid = chrom_end > line_starts
+    valid &= ~is_range | ((n_sep >= 2) & start_ok & all_digits(prefix, end_beg, end_end))
+    valid &= ~is_point | ((n_colon == 1) & start_ok)
+
+    start = np.full(n, NONE_POS, dtype=np.int64)
+    end = np.full(n, NONE_POS, dtype=np.int64)
+    has_start = valid & (is_range | is_point)
+    start[has_start] = gather_bytes(buf, start_beg[has_start], start_end[has_start]).astype(np.int64)
+    has_end = valid & is_range
+    end[has_end] = gather_bytes(buf, end_beg[has_end], end_end[has_end]).astype(np.int64)
+    valid &= ~has_end | (start <= end)
+
+    codes = np.full(n, -1, dtype=np.int32)
+    uniq, inverse = np.unique(gather_bytes(buf, line_starts[valid], chrom_end[valid]), return_inverse=True)
+    chrom_index = {c: i for i, c in enumerate(chroms)}
+    lut = np.empty(uniq.shape[0], dtype=np.int32)
+    for i, name in enumerate(decode_bytes(uniq)):
+        if name not in chrom_index:
+            chrom_index[name] = len(chroms)
+            chroms.append(intern_chrom(name))
+        lut[i] = chrom_index[name]
+    codes[valid] = lut[inverse.ravel()]
+    start[~valid] = NONE_POS
+    end[~valid] = NONE_POS
+    return GenomeRangeArray(chroms, codes, start, end), valid
+
+
 class ChromSizes(object):
     """
     Object for represent the Chromosomes's length of a Genome.
 
+    Chromosomes are ordered as the `sizes` dict, the genome-wide(global)
+    coordinate of a position is the cumulative offset of its chromosome plus the position.
+    Derived arrays(offsets, bin sizes) are cached, so `sizes` should not be modified in place.
+
     Attributes
     ----------
     sizes : dict
@@ -223,16 +590,139 @@ class ChromSizes(object):
     def __init__(self, chromsizes:dict, unit:str='bp') -> None:
         self.sizes = chromsizes
         self.unit = unit
+        self._cache = {}
+
+    def _cached(self, key, func):
+        if key not in self._cache:
+            self._cache[key] = func()
+        return self._cache[key]
+
+    @property
+    def chroms(self) -> List[str]:
+        """
+        Chromosome names, in order.
+        """
+        return self._cached("chroms", lambda: list(self.sizes))
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def lengths(self, binsize:Optional[int]=None) -> np.ndarray:
+        """
+        Chromosome sizes in order, in number of bins if `binsize` is given.
+
+        >>> ChromSizes({"chr1": 2500, "chr2": 1000}).lengths(1000)
+        array([3, 1])
+        """
+        def compute():
+            lengths = np.fromiter(self.sizes.values(), dtype=np.int64, count=len(self.sizes))
+            return lengths if binsize is None else -(-lengths // binsize)
+        return self._cached(("lengths", binsize), compute)
+
+    def offsets(self, binsize:Optional[int]=None) -> np.ndarray:
+        """
+        Cumulative offsets of chromosomes, the last element is the genome size.
+        In number of bins if `binsize` is given.
+
+        >>> ChromSizes({"chr1": 2500, "chr2": 1000}).offsets(1000)
+        array([0, 3, 4])
+        """
+        def compute():
+            offsets = np.zeros(len(self.sizes) + 1, dtype=np.int64)
+            np.cumsum(self.lengths(binsize), out=offsets[1:])
+            return offsets
+        return self._cached(("offsets", binsize), compute)
+
+    def chrom_codes(self, chroms:Union[Iterable[str], np.ndarray]) -> np.ndarray:
+        """
+        Index of chromosome names in `self.chroms`, -1 for unknown names.
+        """
+        chroms = np.asarray(chroms if isinstance(chroms, np.ndarray) else list(chroms))
+        if chroms.shape[0] == 0:
+            return np.zeros(0, dtype=np.int32)
+        index = self._cached("index", lambda: {c: i for i, c in enumerate(self.sizes)})
+        uniq, inverse = np.unique(chroms, return_inverse=True)
+        lut = np.array([index.get(c.decode() if isinstance(c, bytes) else c, -1) for c in uniq.tolist()],
+                       dtype=np.int32)
+        return lut[inverse.ravel()]
+
+    def range_codes(self, ranges:'GenomeRangeArray') -> np.ndarray:
+        """
+        Index of the chromosome of each range in `self.chroms`,
+        raise ValueError if any chromosome is not in the genome.
+        """
+        index = self._cached("index", lambda: {c: i for i, c in enumerate(self.sizes)})
+        lut = np.array([index.get(c, -1) for c in ranges.chroms] + [-1], dtype=np.int32)
+        codes = lut[ranges.codes]
+        if np.any(codes < 0):
+            missing = sorted({ranges.chroms[c] for c in np.unique(ranges.codes[codes < 0])})
+            raise ValueError(f"Chromosomes {missing} not in the genome.")
+        return codes
+
+    def to_global(self,
+            chrom:Union[Iterable[str], np.ndarray],
+            pos:np.ndarray,
+            binsize:Optional[int]=None) -> np.ndarray:
+        """
+        Global coordinate of (chrom, pos) pairs, global bin id if `binsize` is given.
+
+        >>> ChromSizes({"chr1": 2500, "chr2": 1000}).to_global(["chr2", "chr1"], [10, 2100], binsize=1000)
+        array([3, 2])
+        """
+        codes = self.chrom_codes(chrom)
+        if np.any(codes < 0):
+            raise ValueError(f"Chromosomes {sorted(set(np.asarray(chrom)[codes < 0].tolist()))} not in the genome.")
+        pos = np.asarray(pos, dtype=np.int64)
+        if binsize is not None:
+            pos = pos // binsize
+        return self.offsets(binsize)[codes] + pos
+
+    def ranges_to_global(self, ranges:'GenomeRangeArray', binsize:Optional[int]=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Global [start, end) of ranges, in global bin ids if `binsize` is given
+        (the bins overlap with each range, like `GenomeRange.to_bin`).
+        """
+        if np.any((ranges.start == NONE_POS) | (ranges.end == NONE_POS)):
+            raise ValueError("Ranges must have start and end.")
+        offsets = self.offsets(binsize)[self.range_codes(ranges)]
+        if binsize is None:
+            return offsets + ranges.start, offsets + ranges.end
+        return offsets + ranges.start // binsize, offsets + -(-ranges.end // binsize)
+
+    def from_global(self, gpos:np.ndarray, binsize:Optional[int]=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reverse of `to_global`, return chromosome codes(index of `self.chroms`) and
+        positions(bin index if `binsize` is given) within the chromosomes.
+
+        >>> ChromSizes({"chr1": 2500, "chr2": 1000}).from_global([0, 2600], binsize=None)
+        (array([0, 1], dtype=int32), array([  0, 100]))
+        """
+        offsets = self.offsets(binsize)
+        gpos = np.asarray(gpos, dtype=np.int64)
+        if np.any((gpos < 0) | (gpos >= offsets[-1])):
+            raise ValueError(f"Global positions must in [0, {offsets[-1]}).")
+        codes = (np.searchsorted(offsets, gpos, side="right") - 1).astype(np.int32)
+        return codes, gpos - offsets[codes]
+
+    def global_bins_to_ranges(self, bins:np.ndarray, binsize:int) -> 'GenomeRangeArray':
+        """
+        Genome ranges(in bp) of global bin ids, the last bin of a chromosome is clipped to it's size.
+
+        >>> ChromSizes({"chr1": 2500, "chr2": 1000}).global_bins_to_ranges([2, 3], 1000).to_granges()
+        [GenomeRange(chr1, 2000, 2500), GenomeRange(chr2, 0, 1000)]
+        """
+        codes, local = self.from_global(bins, binsize)
+        start = local * binsize
+        end = np.minimum(start + binsize, self.lengths()[codes])
+        return GenomeRangeArray(self.chroms, codes, start, end)
 
     def to_bin(self, binsize:int) -> 'ChromSizes':
         """
         Return a ChromSize object unit in 'bin'
         """
         if self.unit != 'bin':
-            sizes = {}
-            for key, value in self.sizes.items():
-                sizes[key] = value // binsize + int(value % binsize != 0)
-            return ChromSizes(sizes, "bin")
+            return self._cached(("to_bin", binsize), lambda: ChromSizes(
+                dict(zip(self.chroms, self.lengths(binsize).tolist())), "bin"))
         else:
             return self
 
@@ -241,10 +731,8 @@ class ChromSizes(object):
         Return a ChromSize object unit in 'bp'
         """
         if self.unit != 'bp':
-            sizes = {}
-            for key, value in self.sizes.items():
-                sizes[key] = value * binsize
-            return ChromSizes(sizes, "bp")
+            return self._cached(("to_bp", binsize), lambda: ChromSizes(
+                dict(zip(self.chroms, (self.lengths() * binsize).tolist())), "bp"))
         else:
             return self
 
@@ -0,0 +1,193 @@
+from operator import attrgetter
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from luckyegg.genome import GenomeRange, GenomeRangeArray, NONE_POS
+
+
+POS_BITS = 40  # positions are packed with chromosome code into one int64 key
+MAX_POS = (1 << POS_BITS) - 1
+
+
+class IntervalIndex(object):
+    """
+    Per-chromosome interval index for fast overlap queries.
+
+    Intervals are sorted by (chrom, start) and packed into int64 keys,
+    a running maximum of the ends(max-end sweep) bound the candidates of a query.
+    All query methods accept a GenomeRange or a GenomeRangeArray(batched query).
+    Two intervals overlap if `start < another.end and end > another.start`.
+
+    Parameters
+    ----------
+    ranges : `luckyegg.genome.GenomeRangeArray`
+        Intervals to index. Points(end is None) are treated as one base intervals.
+    records : list, optional
+        Objects(e.g. BED records) corresponding to the ranges.
+    """
+    def __init__(self, ranges:GenomeRangeArray, records:Optional[list]=None) -> None:
+        if records is not None and len(records) != len(ranges):
+            raise ValueError("records and ranges must have the same length.")
+        start = ranges.start
+        end = np.where(ranges.end == NONE_POS, start + 1, ranges.end)
+        if np.any(start == NONE_POS):
+            raise ValueError("Can not index chromosome ranges.")
+        if len(ranges) > 0 and (start.min() < 0 or end.max() > MAX_POS or np.any(end < start)):
+            raise ValueError(f"Interval positions must within [0, {MAX_POS}] and end >= start.")
+        self.chroms = list(ranges.chroms)
+        self.ranges = ranges
+        self.records = records
+        codes = ranges.codes.astype(np.int64) << POS_BITS
+        start_key = codes | start
+        end_key = codes | end
+        self._order = np.argsort(start_key, kind="stable")
+        self._start_key = start_key[self._order]
+        self._end_key = end_key[self._order]
+        self._max_end_key = np.maximum.accumulate(self._end_key) if len(ranges) > 0 else self._end_key
+        self._end_order = np.argsort(end_key, kind="stable")
+        self._sorted_end_key = end_key[self._end_order]
+
+    def __len__(self) -> int:
+        return len(self.ranges)
+
+    def __repr__(self) -> str:
+        return f"IntervalIndex(n={len(self)}, chroms={self.chroms})"
+
+    @classmethod
+    def from_records(cls, records:Iterable) -> 'IntervalIndex':
+        """
+        Build from BED records(`luckyegg.io.bed.BEDLike`) or GenomeRange objects.
+        """
+        records = list(records)
+        chrom = list(map(attrgetter("chrom"), records))
+        start = list(map(attrgetter("start"), records))
+        end = list(map(attrgetter("end"), records))
+        if len(records) == 0:
+            ranges = GenomeRangeArray([], [], [], [])
+        else:
+            ranges = GenomeRangeArray.from_arrays(chrom, start, end)
+        return cls(ranges, records)
+
+    @classmethod
+    def from_batches(cls, batches:Iterable) -> 'IntervalIndex':
+        """
+        Build from columnar BED batches(`luckyegg.io.bed.BEDBatch`),
+        the results are row ids in the concatenated batches.
+        """
+        return cls(GenomeRangeArray.concat(b.ranges for b in batches))
+
+    def _query_keys(self, query:Union[GenomeRange, GenomeRangeArray]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Convert query to (start, end) keys in this index's code space.
+        Chromosomes not in index are mapped to a code without any interval.
+        """
+        chrom_index = {c: i for i, c in enumerate(self.chroms)}
+        missing = len(self.chroms)
+        if isinstance(query, GenomeRange):
+            query = GenomeRangeArray([query.chrom], [0],
+                                     [NONE_POS if query.start is None else query.start],
+                                     [NONE_POS if query.end is None else query.end])
+        lut = np.array([chrom_index.get(c, missing) for c in query.chroms] + [missing], dtype=np.int64)
+        codes = lut[query.codes] << POS_BITS
+        start_none = query.start == NONE_POS
+        end_none = query.end == NONE_POS
+        start = np.where(start_none, 0, query.start)
+        end = np.where(start_none, MAX_POS, np.where(end_none, query.start + 1, query.end))
+        return codes | np.clip(start, 0, MAX_POS), codes | np.clip(end, 0, MAX_POS)
+
+    def _candidates(self, start_key:np.ndarray, end_key:np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        lo = np.searchsorted(self._max_end_key, start_key, side="right")
+        hi = np.searchsorted(self._start_key, end_key, side="left")
+        return lo, np.maximum(hi, lo)
+
+    def query(self, query:Union[GenomeRange, GenomeRangeArray]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find all overlapping (query, interval) pairs.
+
+        Return
+        ------
+        query_ids : numpy.ndarray
+            Index of the query ranges.
+        ids : numpy.ndarray
+            Index of the overlapping intervals, in the order they were given.
+        """
+        start_key, end_key = self._query_keys(query)
+        lo, hi = self._candidates(start_key, end_key)
+        n_cand = hi - lo
+        total = int(n_cand.sum())
+        query_ids = np.repeat(np.arange(start_key.shape[0]), n_cand)
+        offsets = np.arange(total) - np.repeat(np.cumsum(n_cand) - n_cand, n_cand)
+        pos = np.repeat(lo, n_cand) + offsets
+        hit = self._end_key[pos] > start_key[query_ids]
+        return query_ids[hit], self._order[pos[hit]]
+
+    def overlap(self, grange:GenomeRange) -> np.ndarray:
+        """
+        Index of the intervals overlap with a GenomeRange, sorted by position.
+        """
+        return self.query(grange)[1]
+
+    def overlap_records(self, grange:GenomeRange) -> list:
+        """
+        Records overlap with a GenomeRange, sorted by position.
+        """
+        if self.records is None:
+            raise ValueError("IntervalIndex is not built from records.")
+        return [self.records[i] for i in self.overlap(grange)]
+
+    def count_overlaps(self, query:Union[GenomeRange, GenomeRangeArray]) -> Union[int, np.ndarray]:
+        """
+        Count the intervals overlap with each query range.
+        """
+        start_key, end_key = self._query_keys(query)
+        n_start_before = np.searchsorted(self._start_key, end_key, side="left")
+        n_end_before = np.searchsorted(self._sorted_end_key, start_key, side="right")
+        counts = n_start_before - n_end_before
+        if isinstance(query, GenomeRange):
+            return int(counts[0])
+        return counts
+
+    def nearest(self, query:Union[GenomeRange, GenomeRangeArray]):
+        """
+        Find the nearest interval of each query range.
+        Overlapping intervals have distance 0, otherwise the distance
+        is the gap between them, ties are resolved to the upstream one.
+
+        Return
+        ------
+        ids : {int, numpy.ndarray}
+            Index of the nearest intervals, -1 if the chromosome has no interval.
+        distances : {int, numpy.ndarray}
+            Distances to the nearest intervals, -1 if not found.
+        """
+        start_key, end_key = self._query_keys(query)
+        n = start_key.shape[0]
+        chrom_key = start_key >> POS_BITS
+        ids = np.full(n, -1, dtype=np.int64)
+        distances = np.full(n, -1, dtype=np.int64)
+        n_total = len(self)
+
+        up = np.searchsorted(self._sorted_end_key, start_key, side="right") - 1
+        up_ok = up >= 0
+        up_ok[up_ok] = (self._sorted_end_key[up[up_ok]] >> POS_BITS) == chrom_key[up_ok]
+        up_dist = np.where(up_ok, start_key - self._sorted_end_key[np.maximum(up, 0)], -1) if n_total else up
+        down = np.searchsorted(self._start_key, end_key, side="left")
+        down_ok = down < n_total
+        down_ok[down_ok] = (self._start_key[down[down_ok]] >> POS_BITS) == chrom_key[down_ok]
+        down_dist = np.where(down_ok, self._start_key[np.minimum(down, n_total - 1)] - end_key, -1) if n_total else down
+
+        use_up = up_ok & (~down_ok | (up_dist <= down_dist))
+        use_down = down_ok & ~use_up
+        ids[use_up] = self._end_order[up[use_up]]
+        distances[use_up] = up_dist[use_up]
+        ids[use_down] = self._order[down[use_down]]
+        distances[use_down] = down_dist[use_down]
+
+        query_ids, overlap_ids = self.query(query)
+        first_query, first = np.unique(query_ids, return_index=True)
+        ids[first_query] = overlap_ids[first]
+        distances[first_query] = 0
+        if isinstance(query, GenomeRange):
+            return int(ids[0]), int(distances[0])
+        return ids, distances
@@ -0,0 +1,364 @@
+"""
+Lightweight instrumentation of the hot paths: counters and latency histograms.
+
+Recording is off by default, a disabled hook costs one function call that finds
+no target registry. Turn it on globally with `enable()`(or set the environment
+variable LUCKYEGG_INSTRUMENT=1), or for a scope with `profile()`:
+
+    with profile() as prof:
+        batches = list(read_bed_batches("peaks.bed"))
+    prof["bed.rows"].value
+    prof.export("profile.prom")
+
+With LUCKYEGG_INSTRUMENT_OUTPUT=<path>, the global registry is exported to the
+path(JSON if it ends with '.json', otherwise Prometheus text format) at exit.
+
+Metrics recorded inside worker processes are not collected, the parallel helpers
+record the parent side(tasks, bytes, time spent waiting for results).
+"""
+import os
+import re
+import json
+import time
+import atexit
+import bisect
+import fnmatch
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Sequence, Union
+
+
+# seconds, upper bounds of the latency histogram buckets(+Inf is implicit)
+DEFAULT_BUCKETS = (1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+
+class Counter(object):
+    """
+    Monotonic counter.
+    """
+    kind = "counter"
+
+    def __init__(self, name:str) -> None:
+        self.name = name
+        self.value = 0
+
+    def __repr__(self) -> str:
+        return f"Counter({self.name!r}, value={self.value})"
+
+    def inc(self, n:Union[int, float]=1) -> None:
+        self.value += n
+
+    def to_dict(self) -> dict:
+        return {"type": self.kind, "value": self.value}
+
+
+class Histogram(object):
+    """
+    Histogram of observed values(e.g. latency in seconds), in fixed buckets.
+
+    Parameters
+    ----------
+    name : str
+        Metric name.
+    buckets : sequence of float
+        Upper bounds(inclusive) of the buckets, values greater than the last one
+        fall in the +Inf bucket.
+    """
+    kind = "histogram"
+
+    def __init__(self, name:str, buckets:Sequence[float]=DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def __repr__(self) -> str:
+        return f"Histogram({self.name!r}, count={self.count}, sum={self.sum:.6g})"
+
+    def observe(self, value:float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else float("nan")
+
+    def quantile(self, q:float) -> float:
+        """
+        Approximate quantile, the upper bound of the bucket contains it(clipped to the max value).
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("q must be in [0, 1].")
+        if self.count == 0:
+            return float("nan")
+        rank = q * self.count
+        cum = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cum += n
+            if cum >= rank and cum > 0:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        cum, buckets = 0, {}
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            cum += n
+            buckets[_format_bound(bound)] = cum
+        return {"type": self.kind, "count": self.count, "sum": self.sum,
+                "min": self.min if self.count else None, "max": self.max if self.count else None,
+                "mean": self.mean if self.count else None, "buckets": buckets}
+
+
+def _format_bound(bound:float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class Registry(object):
+    """
+    Thread safe collection of metrics, indexed by dotted names like 'bed.rows'.
+    Metrics are created on first use.
+    """
+    def __init__(self) -> None:
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"Registry({len(self._metrics)} metrics)"
+
+    def __len__(self) -> int:
+        return len(self._metrics)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(sorted(self._metrics))
+
+    def __contains__(self, name:str) -> bool:
+        return name in self._metrics
+
+    def __getitem__(self, name:str) -> Union[Counter, Histogram]:
+        return self._metrics[name]
+
+    def get(self, name:str, default=None) -> Optional[Union[Counter, Histogram]]:
+        return self._metrics.get(name, default)
+
+    def _metric(self, cls, name:str, *args):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is a {metric.kind}, not a {cls.kind}.")
+        return metric
+
+    def counter(self, name:str) -> Counter:
+        with self._lock:
+            return self._metric(Counter, name)
+
+    def histogram(self, name:str, buckets:Sequence[float]=DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            return self._metric(Histogram, name, buckets)
+
+    def inc(self, name:str, n:Union[int, float]=1) -> None:
+        with self._lock:
+            self._metric(Counter, name).inc(n)
+
+    def observe(self, name:str, value:float) -> None:
+        with self._lock:
+            self._metric(Histogram, name).observe(value)
+
+    def query(self, pattern:str="*") -> Dict[str, Union[Counter, Histogram]]:
+        """
+        Metrics whose names match a glob pattern, e.g. 'hicmatrix.*'.
+        """
+        with self._lock:
+            return {name: self._metrics[name] for name in sorted(self._metrics) if fnmatch.fnmatchcase(name, pattern)}
+
+    def value(self, name:str) -> float:
+        """
+        Value of a counter, or total of a histogram(e.g. seconds), 0 if not recorded.
+        """
+        metric = self._metrics.get(name)
+        if metric is None:
+            return 0
+        return metric.value if metric.kind == "counter" else metric.sum
+
+    def reset(self) -> None:
+        with self._lock:
+            self._metrics.clear()
+
+    def to_dict(self, pattern:str="*") -> Dict[str, dict]:
+        return {name: m.to_dict() for name, m in self.query(pattern).items()}
+
+    def to_json(self, pattern:str="*") -> str:
+        return json.dumps(self.to_dict(pattern), indent=2)
+
+    def to_prometheus(self, prefix:str="luckyegg", pattern:str="*") -> str:
+        """
+        Metrics in Prometheus text exposition format, dots in names become underscores.
+        """
+        lines = []
+        for name, m in self.query(pattern).items():
+            key = re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}_{name}" if prefix else name)
+            if m.kind == "counter":
+                lines.append(f"# TYPE {key}_total counter")
+                lines.append(f"{key}_total {m.value}")
+                continue
+            lines.append(f"# TYPE {key} histogram")
+            for bound, cum in m.to_dict()["buckets"].items():
+                lines.append(f'{key}_bucket{{le="{bound}"}} {cum}')
+            lines.append(f"{key}_sum {m.sum!r}")
+            lines.append(f"{key}_count {m.count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def export(self, path:str, format:Optional[str]=None) -> str:
+        """
+        Write the metrics to a file.
+
+        Parameters
+        ----------
+        path : str
+            Output path.
+        format : {'json', 'prometheus'}, optional
+            Default is 'json' if the path ends with '.json', otherwise 'prometheus'.
+        """
+        if format is None:
+            format = "json" if path.endswith(".json") else "prometheus"
+        if format == "json":
+            text = self.to_json()
+        elif format == "prometheus":
+            text = self.to_prometheus()
+        else:
+            raise ValueError(f"Unknown format: {format}")
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+
+REGISTRY = Registry()
+
+_targets = ()  # registries that receive the records, empty when disabled
+_global = False
+_profiles = []
+_state_lock = threading.Lock()
+
+
+def _update_targets() -> None:
+    global _targets
+    _targets = tuple(([REGISTRY] if _global else []) + _profiles)
+
+
+def enable() -> None:
+    """
+    Record metrics to the global `REGISTRY`.
+    """
+    global _global
+    with _state_lock:
+        _global = True
+        _update_targets()
+
+
+def disable() -> None:
+    """
+    Stop recording to the global `REGISTRY`, active `profile` scopes keep recording.
+    """
+    global _global
+    with _state_lock:
+        _global = False
+        _update_targets()
+
+
+def enabled() -> bool:
+    return len(_targets) > 0
+
+
+def inc(name:str, n:Union[int, float]=1) -> None:
+    """
+    Increase a counter.
+    """
+    for registry in _targets:
+        registry.inc(name, n)
+
+
+def observe(name:str, value:float) -> None:
+    """
+    Add a value to a histogram.
+    """
+    for registry in _targets:
+        registry.observe(name, value)
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+    def __init__(self, name:str, targets:tuple) -> None:
+        self.name = name
+        self.targets = targets
+
+    def __enter__(self) -> '_Timer':
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> None:
+        elapsed = time.perf_counter() - self.t0
+        for registry in self.targets:
+            registry.observe(self.name, elapsed)
+
+
+def timer(name:str):
+    """
+    Context manager record the elapsed seconds of the block to a histogram.
+    """
+    if not _targets:
+        return _NULL_TIMER
+    return _Timer(name, _targets)
+
+
+@contextmanager
+def profile(registry:Optional[Registry]=None) -> Iterator[Registry]:
+    """
+    Record the metrics of a scope(of all threads) to a new registry, nested scopes all receive the records.
+
+    Parameters
+    ----------
+    registry : `Registry`, optional
+        Registry to record to, default is a new one.
+    """
+    registry = Registry() if registry is None else registry
+    with _state_lock:
+        _profiles.append(registry)
+        _update_targets()
+    try:
+        yield registry
+    finally:
+        with _state_lock:
+            _profiles.remove(registry)
+            _update_targets()
+
+
+def _export_at_exit(path:str) -> None:
+    try:
+        REGISTRY.export(path)
+    except OSError:
+        pass
+
+
+if os.environ.get("LUCKYEGG_INSTRUMENT", "").lower() not in ("", "0", "false", "no"):
+    enable()
+if os.environ.get("LUCKYEGG_INSTRUMENT_OUTPUT"):
+    enable()
+    atexit.register(_export_at_exit, os.environ["LUCKYEGG_INSTRUMENT_OUTPUT"])
@@ -1,7 +1,23 @@
+import io
+import os
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import tempfile
+from contextlib import ExitStack
 from collections import namedtuple
-from typing import Iterable, Union, Type, List, NewType, NamedTuple, TypeVar
+from typing import Iterable, Iterator, Union, Type, List, NewType, NamedTuple, TypeVar, IO, Dict, Optional, Tuple
 
-from luckyegg.genome import GenomeRange
+import numpy as np
+
+from luckyegg.genome import GenomeRange, GenomeRangeArray, ChromSizes
+from luckyegg.index import IntervalIndex
+from luckyegg.instrument import inc, timer
+from luckyegg.utils import as_bytes_array, tokenize, gather_bytes, decode_bytes, parse_numeric, join_lines, squeeze_whitespace, format_ints
+from luckyegg.io.bgzf import BgzfReader, BgzfWriter
+from luckyegg.io.tabix import TabixIndex, MAX_POS
 
 class BED6_(NamedTuple):
     chrom: str
@@ -96,31 +112,683 @@ class BedGeneral(BEDLike, BEDGeneral_):
 
 
 
-def read_bed(path: str, general:bool=False) -> Iterable[BEDLike]:
+NUMERIC_FIELDS = ("score", "value")
+DEFAULT_CHUNKSIZE = 1 << 16
+DEFAULT_BLOCKSIZE = 1 << 22
+CACHE_SUFFIX = ".lecache"
+CACHE_VERSION = 2
+BED_TYPES = {t.__name__: t for t in (Bed6, Bed9, Bed12, BedGraph, BedGeneral)}
+
+
+class BEDBatch(object):
+    """
+    A batch of BED records stored in columns.
+
+    Attributes
+    ----------
+    bed_type : Type[BEDLike]
+        Type of the records.
+    ranges : `luckyegg.genome.GenomeRangeArray`
+        chrom codes and start/end of the records.
+    fields : dict
+        Raw text(bytes array) of other columns. For `BedGeneral` records,
+        the 'items' column hold the text of all columns after the third.
+    values : dict
+        Numeric(int64 or float64) version of the 'score'/'value' column.
+    """
+    def __init__(self,
+            bed_type:Type['BEDLike'],
+            ranges:GenomeRangeArray,
+            fields:Dict[str, np.ndarray],
+            values:Optional[Dict[str, np.ndarray]]=None) -> None:
+        self.bed_type = bed_type
+        self.ranges = ranges
+        self.fields = fields
+        if values is None:
+            values = {}
+            for name in NUMERIC_FIELDS:
+                if name in fields:
+                    parsed = parse_numeric(fields[name])
+                    if parsed is not None:
+                        values[name] = parsed
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.ranges)
+
+    def __repr__(self) -> str:
+        return f"BEDBatch({self.bed_type.__name__}, n={len(self)})"
+
+    def __getitem__(self, name:str) -> np.ndarray:
+        """
+        Get a column, numeric columns are returned in typed version.
+        """
+        if name == "chrom":
+            return self.ranges.chrom
+        elif name == "start":
+            return self.ranges.start
+        elif name == "end":
+            return self.ranges.end
+        elif name in self.values:
+            return self.values[name]
+        else:
+            return self.fields[name]
+
+    @staticmethod
+    def from_records(records:List['BEDLike']) -> 'BEDBatch':
+        """
+        Construct from BED record objects of the same type.
+        """
+        bed_type = type(records[0])
+        ranges = GenomeRangeArray.from_arrays([r.chrom for r in records],
+                                              [r.start for r in records], [r.end for r in records])
+        if bed_type is BedGeneral:
+            fields = {"items": _encode(["\t".join(r.items) for r in records])}
+        else:
+            fields = {name: _encode([str(r[k]) for r in records])
+                      for k, name in enumerate(bed_type._fields[3:], start=3)}
+        return BEDBatch(bed_type, ranges, fields)
+
+    @staticmethod
+    def concat(batches:List['BEDBatch']) -> 'BEDBatch':
+        """
+        Concatenate batches of the same BED type.
+        """
+        ranges = GenomeRangeArray.concat([b.ranges for b in batches])
+        fields = {k: np.concatenate([b.fields[k] for b in batches]) for k in batches[0].fields}
+        values = None
+        if all(b.values.keys() == batches[0].values.keys() for b in batches):
+            values = {k: np.concatenate([b.values[k] for b in batches]) for k in batches[0].values}
+        return BEDBatch(batches[0].bed_type, ranges, fields, values)
+
+    def take(self, idx) -> 'BEDBatch':
+        """
+        Select rows by index array, mask or slice.
+        """
+        return BEDBatch(
+            self.bed_type, self.ranges[idx],
+            {k: v[idx] for k, v in self.fields.items()},
+            {k: v[idx] for k, v in self.values.items()})
+
+    def to_records(self) -> List['BEDLike']:
+        """
+        Convert to BED record objects.
+        """
+        chrom = self.ranges.chrom
+        start = self.ranges.start.tolist()
+        end = self.ranges.end.tolist()
+        if self.bed_type is BedGeneral:
+            items = [s.split() for s in decode_bytes(self.fields["items"])]
+            return list(map(BedGeneral, chrom, start, end, items))
+        cols = [decode_bytes(self.fields[name]) for name in self.bed_type._fields[3:]]
+        return list(map(self.bed_type, chrom, start, end, *cols))
+
+
+def _encode(strs:List[str]) -> np.ndarray:
+    return np.array([s.encode() for s in strs], dtype="S")
+
+
+def bed_type_from_ncols(ncols:int) -> Type[BEDLike]:
+    if ncols == 4:
+        return BedGraph
+    elif ncols == 6:
+        return Bed6
+    elif ncols == 9:
+        return Bed9
+    elif ncols == 12:
+        return Bed12
+    else:
+        return BedGeneral
+
+
+def parse_bed_block(data:bytes,
+        bed_type:Type[BEDLike],
+        chroms:List[str],
+        chrom_index:Optional[Dict[str, int]]=None) -> BEDBatch:
+    """
+    Parse a block of complete BED lines to a BEDBatch.
+    Empty lines are skipped.
+
+    Parameters
+    ----------
+    data : bytes
+        Text of the lines.
+    bed_type : Type[BEDLike]
+        Type of the records.
+    chroms : list of str
+        Chromosome names seen before, new chromosomes will be appended to it.
+    chrom_index : dict, optional
+        Mapping from chromosome name to it's index in `chroms`, updated in place.
+    """
+    if chrom_index is None:
+        chrom_index = {c: i for i, c in enumerate(chroms)}
+    buf = as_bytes_array(data)
+    line_ids, tok_starts, tok_ends, n_lines = tokenize(buf)
+    counts = np.bincount(line_ids, minlength=n_lines)
+    counts = counts[counts > 0]
+    first = np.cumsum(counts) - counts
+
+    def column(k):
+        return gather_bytes(buf, tok_starts[first + k], tok_ends[first + k])
+
+    if bed_type is BedGeneral:
+        bad = counts < 3
+        n_fields = 3
+    else:
+        n_fields = len(bed_type._fields)
+        bad = counts != n_fields
+    if np.any(bad):
+        i = np.flatnonzero(bad)[0]
+        line_start = tok_starts[first[i]]
+        line_end = tok_ends[first[i] + counts[i] - 1]
+        line = bytes(data[line_start:line_end]).decode(errors="replace")
+        raise ValueError(f"Line with {counts[i]} fields can not be parsed as {bed_type.__name__}: {line!r}")
+
+    chrom_col = column(0)
+    uniq, inverse = np.unique(chrom_col, return_inverse=True)
+    lut = np.empty(uniq.shape[0], dtype=np.int32)
+    for i, name in enumerate(decode_bytes(uniq)):
+        if name not in chrom_index:
+            chrom_index[name] = len(chroms)
+            chroms.append(name)
+        lut[i] = chrom_index[name]
+    codes = lut[inverse.ravel()]
+    try:
+        start = column(1).astype(np.int64)
+        end = column(2).astype(np.int64)
+    except ValueError as e:
+        raise ValueError(f"BED start/end must be integers: {e}")
+    ranges = GenomeRangeArray(chroms, codes, start, end)  # chroms list is shared between batches
+
+    if bed_type is BedGeneral:
+        has_items = counts > 3
+        last = first + counts - 1
+        items_start = np.where(has_items, tok_starts[np.minimum(first + 3, last)], 0)
+        items_end = np.where(has_items, tok_ends[last], 0)
+        fields = {"items": gather_bytes(buf, items_start, items_end)}
+    else:
+        fields = {name: column(k) for k, name in enumerate(bed_type._fields[3:], start=3)}
+    return BEDBatch(bed_type, ranges, fields)
+
+
+def _open_binary(source:Union[str, IO], stack) -> IO:
+    if isinstance(source, str):
+        if source == "-":
+            f = sys.stdin.buffer
+        else:
+            f = stack.enter_context(open(source, 'rb'))
+    elif isinstance(source, io.TextIOBase):
+        if hasattr(source, "buffer"):
+            f = source.buffer
+        else:  # in-memory text, e.g. io.StringIO
+            f = io.BytesIO(source.read().encode())
+    else:
+        f = source
+    if not hasattr(f, "peek") and hasattr(f, "readinto"):
+        f = io.BufferedReader(f)
+        stack.callback(f.detach)  # don't close the caller's file object
+    if hasattr(f, "peek") and f.peek(2)[:2] == b"\x1f\x8b":
+        f = stack.enter_context(gzip.GzipFile(fileobj=f))
+    return f
+
+
+def _iter_line_blocks(f:IO, n_lines:int, blocksize:int) -> Iterator[bytes]:
+    """
+    Read from a binary stream, yield blocks contain `n_lines` complete lines.
+    """
+    buf = bytearray()
+    count = 0
+    while True:
+        data = f.read(blocksize)
+        if data:
+            buf += data
+            count += data.count(b"\n")
+        while count >= n_lines:
+            cut = _nth_newline(buf, n_lines) + 1
+            yield bytes(buf[:cut])
+            del buf[:cut]
+            count -= n_lines
+        if not data:
+            break
+    if buf:
+        if not buf.endswith(b"\n"):
+            buf += b"\n"
+        yield bytes(buf)
+
+
+def _nth_newline(buf:bytearray, n:int) -> int:
+    return int(np.flatnonzero(as_bytes_array(buf) == ord("\n"))[n - 1])
+
+
+def _scan_header(block:bytes) -> Tuple[int, Optional[int]]:
+    """
+    Scan the header and empty lines at the beginning of a block of complete lines.
+    Return the number of header rows and the offset of the first record line(None if not found).
+    """
+    header_rows = 0
+    pos = 0
+    while pos < len(block):
+        nl = block.find(b"\n", pos)
+        line = block[pos:nl]
+        if is_header(line.decode(errors="replace")):
+            header_rows += 1
+        elif line.strip() != b"":
+            return header_rows, pos
+        pos = nl + 1
+    return header_rows, None
+
+
+def sniff_bed(path:str, general:bool=False) -> Tuple[Type[BEDLike], int]:
+    """
+    Sniff the BED type and the byte offset of the first record line of an uncompressed BED file.
+    """
+    offset = 0
+    with timer("bed.sniff_seconds"), open(path, 'rb') as f:
+        for block in _iter_line_blocks(f, 1024, 1 << 16):
+            _, pos = _scan_header(block)
+            if pos is not None:
+                first_line = block[pos:block.find(b"\n", pos)]
+                bed_type = BedGeneral if general else bed_type_from_ncols(len(first_line.split()))
+                return bed_type, offset + pos
+            offset += len(block)
+    raise IOError(f"Bed-like file {path} don't have enough content.")
+
+
+class BEDReader(object):
+    """
+    Single-pass, chunked reader for BED(BED-like) file, iterate over it to get `BEDBatch` objects.
+    Header rows and the BED type are sniffed from the stream itself,
+    so it also works on pipes.
+
+    Parameters
+    ----------
+    source : {str, file object}
+        Path to bed(bed-like) file, '-' for stdin, or an opened file object.
+        gzip compressed input is detected automatically.
+    general : bool
+        Treat the file as general bed-like file or not.
+    chunksize : int
+        Number of rows per batch.
+    blocksize : int
+        Number of bytes per read from the stream.
+
+    Attributes
+    ----------
+    bed_type : Type[BEDLike]
+        Type of the records, available after the first batch.
+    header_rows : int
+        Number of header rows, available after the first batch.
+    chroms : list of str
+        Chromosome names, the chrom codes of all batches index into it.
+    """
+    def __init__(self,
+            source:Union[str, IO],
+            general:bool=False,
+            chunksize:int=DEFAULT_CHUNKSIZE,
+            blocksize:int=DEFAULT_BLOCKSIZE) -> None:
+        self.source = source
+        self.general = general
+        self.chunksize = chunksize
+        self.blocksize = blocksize
+        self.bed_type = BedGeneral if general else None
+        self.header_rows = 0
+        self.chroms = []
+        self._chrom_index = {}
+
+    def _skip_header(self, block:bytes) -> Optional[bytes]:
+        """
+        Skip header lines and sniff BED type, return the remaining data,
+        or None if the whole block is header.
+        """
+        header_rows, pos = _scan_header(block)
+        self.header_rows += header_rows
+        if pos is None:
+            return None
+        if self.bed_type is None:
+            self.bed_type = bed_type_from_ncols(len(block[pos:block.find(b"\n", pos)].split()))
+        return block[pos:]
+
+    def __iter__(self) -> Iterator[BEDBatch]:
+        with ExitStack() as stack:
+            f = _open_binary(self.source, stack)
+            in_header = True
+            blocks = _iter_line_blocks(f, self.chunksize, self.blocksize)
+            while True:
+                with timer("bed.read_seconds"):
+                    block = next(blocks, None)
+                if block is None:
+                    break
+                inc("bed.bytes", len(block))
+                if in_header:
+                    with timer("bed.sniff_seconds"):
+                        block = self._skip_header(block)
+                    if block is None:
+                        continue
+                    in_header = False
+                with timer("bed.parse_seconds"):
+                    batch = parse_bed_block(block, self.bed_type, self.chroms, self._chrom_index)
+                if len(batch) > 0:
+                    inc("bed.rows", len(batch))
+                    yield batch
+
+
+def read_bed_batches(source:Union[str, IO],
+        general:bool=False,
+        chunksize:int=DEFAULT_CHUNKSIZE,
+        cache:bool=False,
+        cache_dir:Optional[str]=None) -> Iterator[BEDBatch]:
+    """
+    Read BED records form file, in columnar batches.
+
+    Parameters
+    ----------
+    source : {str, file object}
+        Path to bed(bed-like) file, '-' for stdin, or an opened file object.
+    general : bool
+        Treat the file as general bed-like file or not.
+    chunksize : int
+        Number of rows per batch.
+    cache : bool
+        Use the binary sidecar cache of the parsed columns, see `load_bed_cache`.
+        Only take effect when source is a path.
+    cache_dir : str, optional
+        Directory to store the cache, default is next to the source file.
+    """
+    if cache and isinstance(source, str) and source != "-":
+        return _iter_cached(source, general, chunksize, cache_dir)
+    return iter(BEDReader(source, general=general, chunksize=chunksize))
+
+
+def read_bed(path:Union[str, IO],
+        general:bool=False,
+        cache:bool=False,
+        cache_dir:Optional[str]=None) -> Iterable[BEDLike]:
     """
     Read BED records form file.
 
+    Parameters
+    ----------
+    path : {str, file object}
+        Path to bed(bed-like) file, '-' for stdin, or an opened file object.
+    general : bool
+        Treat the file as general bed-like file or not.
+    cache : bool
+        Use the binary sidecar cache of the parsed columns, see `load_bed_cache`.
+    cache_dir : str, optional
+        Directory to store the cache, default is next to the source file.
+    """
+    for batch in read_bed_batches(path, general=general, cache=cache, cache_dir=cache_dir):
+        with timer("bed.to_records_seconds"):
+            records = batch.to_records()
+        yield from records
+
+
+def bed_cache_path(path:str, general:bool=False, cache_dir:Optional[str]=None) -> str:
+    """
+    Directory of the binary cache of a BED file, path + '.lecache' by default.
+    """
+    suffix = CACHE_SUFFIX + ("-general" if general else "")
+    if cache_dir is None:
+        return path + suffix
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, os.path.basename(path) + "." + digest + suffix)
+
+
+def _cache_key(path:str) -> dict:
+    st = os.stat(path)
+    return {"version": CACHE_VERSION, "path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def load_bed_cache(path:str, general:bool=False, cache_dir:Optional[str]=None) -> Optional[BEDBatch]:
+    """
+    Load the binary cache of a BED file as one `BEDBatch`, columns are memory-mapped.
+    Return None if the cache not exists or is stale(source path, size or mtime changed).
+    """
+    cache = bed_cache_path(path, general, cache_dir)
+    try:
+        with open(os.path.join(cache, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["key"] != _cache_key(path):
+            return None
+        n = meta["rows"]
+        cols = {name: np.memmap(os.path.join(cache, name + ".bin"), dtype=np.dtype(dtype), mode='r', shape=(n,))
+                for name, dtype in meta["columns"].items()}
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    ranges = GenomeRangeArray(meta["chroms"], cols["codes"], cols["start"], cols["end"])
+    fields = {k: cols["field." + k] for k in meta["fields"]}
+    values = {k: cols["value." + k] for k in meta["values"]}
+    return BEDBatch(BED_TYPES[meta["bed_type"]], ranges, fields, values)
+
+
+class _BedCacheWriter(object):
+    """
+    Write the binary cache of a BED file batch by batch, columns are appended to
+    raw .bin files, their dtypes and the chromosome names are stored in meta.json.
+    A column is rewritten(chunk by chunk) only if the dtype differs between batches,
+    e.g. longer names in later batches.
+    The cache is written to a temporary directory and moved in place by `close`.
+    """
+    def __init__(self, path:str, key:dict, general:bool=False, cache_dir:Optional[str]=None) -> None:
+        self.cache = bed_cache_path(path, general, cache_dir)
+        self.key = key
+        parent = os.path.dirname(os.path.abspath(self.cache))
+        os.makedirs(parent, exist_ok=True)
+        self._tmp = tempfile.mkdtemp(prefix=".tmp", dir=parent)
+        self._files = {}
+        self._parts = {}  # column name -> [(dtype, rows)] of each batch
+        self._meta = None
+        self.chroms = []
+        self._chrom_index = {}
+        self.rows = 0
+
+    def write(self, batch:BEDBatch) -> None:
+        if self._meta is None:
+            self._meta = {"bed_type": batch.bed_type.__name__, "fields": list(batch.fields), "values": list(batch.values)}
+        elif list(batch.values) != self._meta["values"]:  # not numeric in all batches, like `BEDBatch.concat`
+            for k in self._meta["values"]:
+                self._files.pop("value." + k).close()
+                self._parts.pop("value." + k)
+                os.remove(os.path.join(self._tmp, f"value.{k}.bin"))
+            self._meta["values"] = []
+        ranges = batch.ranges
+        lut = np.array([self._chrom_index.setdefault(c, len(self._chrom_index)) for c in ranges.chroms] + [-1], dtype=np.int32)
+        self.chroms.extend(list(self._chrom_index)[len(self.chroms):])
+        cols = {"codes": lut[ranges.codes], "start": ranges.start, "end": ranges.end}
+        cols.update({"field." + k: batch.fields[k] for k in self._meta["fields"]})
+        cols.update({"value." + k: batch.values[k] for k in self._meta["values"]})
+        for name, col in cols.items():
+            if name not in self._files:
+                self._files[name] = open(os.path.join(self._tmp, name + ".bin"), 'wb')
+                self._parts[name] = []
+            col = np.ascontiguousarray(col)
+            col.tofile(self._files[name])
+            self._parts[name].append((col.dtype, col.shape[0]))
+        self.rows += len(batch)
+
+    def _unify(self, name:str) -> np.dtype:
+        parts = self._parts[name]
+        dtype = np.result_type(*[d for d, _ in parts])
+        if all(d == dtype for d, _ in parts):
+            return dtype
+        src = os.path.join(self._tmp, name + ".bin")
+        with open(src, 'rb') as fin, open(src + ".tmp", 'wb') as fout:
+            for d, n in parts:
+                np.fromfile(fin, dtype=d, count=n).astype(dtype).tofile(fout)
+        os.replace(src + ".tmp", src)
+        return dtype
+
+    def close(self) -> str:
+        """
+        Finalize the cache, return its path.
+        """
+        try:
+            for f in self._files.values():
+                f.close()
+            meta = dict(self._meta or {}, key=self.key, chroms=self.chroms, rows=self.rows,
+                        columns={name: self._unify(name).str for name in self._parts})
+            with open(os.path.join(self._tmp, "meta.json"), 'w') as f:
+                json.dump(meta, f)
+            if os.path.isdir(self.cache):
+                shutil.rmtree(self.cache)
+            os.replace(self._tmp, self.cache)
+        except BaseException:
+            self.abort()
+            raise
+        return self.cache
+
+    def abort(self) -> None:
+        for f in self._files.values():
+            f.close()
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+
+def save_bed_cache(batch:BEDBatch, path:str, key:dict, general:bool=False, cache_dir:Optional[str]=None) -> str:
+    """
+    Write a BEDBatch(all records of the file) as the binary cache of a BED file,
+    columns are stored in raw .bin files, with their dtypes and the chromosome names in meta.json.
+    The cache is written to a temporary directory and then moved in place.
+    """
+    writer = _BedCacheWriter(path, key, general, cache_dir)
+    try:
+        writer.write(batch)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def _iter_cached(path:str, general:bool, chunksize:int, cache_dir:Optional[str]) -> Iterator[BEDBatch]:
+    with timer("bed.cache_load_seconds"):
+        batch = load_bed_cache(path, general, cache_dir)
+    inc("bed.cache_misses" if batch is None else "bed.cache_hits")
+    if batch is not None:
+        for i in range(0, len(batch), chunksize):
+            yield batch.take(slice(i, i + chunksize))
+        return
+    key = _cache_key(path)  # before parsing, so changes during parsing invalidate the cache
+    try:
+        writer = _BedCacheWriter(path, key, general, cache_dir)
+    except OSError:  # e.g. read-only directory, just go without cache
+        writer = None
+    complete = False
+    try:
+        for batch in BEDReader(path, general=general, chunksize=chunksize):
+            if writer is not None:
+                try:
+                    writer.write(batch)
+                except OSError:
+                    writer.abort()
+                    writer = None
+            yield batch
+        complete = True
+    finally:
+        if writer is not None:
+            if complete and writer.rows > 0:
+                try:
+                    writer.close()
+                except OSError:
+                    pass
+            else:  # stopped by the caller or failed, the cache would be partial
+                writer.abort()
+
+
+def _iter_indexable_records(lines:Iterable[Tuple[int, bytes]], next_voffset) -> Iterator[Tuple[int, int, str, int, int]]:
+    """
+    Yield (virtual offset begin, virtual offset end, chrom, start, end) of
+    BED lines for building tabix index, header lines are skipped.
+    """
+    for voffset, line in lines:
+        if is_header(line.decode(errors="replace")) or line.strip() == b"":
+            continue
+        items = line.split(None, 3)
+        yield voffset, next_voffset(), items[0].decode(), int(items[1]), int(items[2])
+
+
+def index_bed(path:str) -> TabixIndex:
+    """
+    Build the tabix index(path + '.tbi') of a bgzip compressed, sorted BED file.
+    """
+    with BgzfReader(path) as f:
+        index = TabixIndex.build(_iter_indexable_records(f.iter_lines(), f.tell))
+    index.save(path + ".tbi")
+    return index
+
+
+def bgzip_bed(source:Union[str, IO], path:Optional[str]=None, level:int=6) -> str:
+    """
+    Compress a sorted BED file with bgzip, and build the tabix index(path + '.tbi').
+    Return the path of compressed file.
+
+    Parameters
+    ----------
+    source : {str, file object}
+        Path to the sorted BED file, or an opened file object.
+    path : str, optional
+        Path to the output file, default is source + '.gz'.
+    level : int
+        Compression level.
+    """
+    if path is None:
+        if not isinstance(source, str):
+            raise ValueError("Output path is required when source is not a path.")
+        path = source + ".gz"
+    with ExitStack() as stack:
+        f = _open_binary(source, stack)
+        writer = stack.enter_context(BgzfWriter(path, level=level))
+
+        def lines():
+            for line in f:
+                voffset = writer.tell()
+                writer.write(line if line.endswith(b"\n") else line + b"\n")
+                yield voffset, line
+
+        index = TabixIndex.build(_iter_indexable_records(lines(), writer.tell))
+    index.save(path + ".tbi")
+    return path
+
+
+def fetch(path:str, grange:GenomeRange, general:bool=False) -> List[BEDLike]:
+    """
+    Fetch BED records overlap with a genome range, from a bgzip compressed,
+    tabix indexed BED file. Only the blocks cover the region are read.
+
     Parameters
     ----------
     path : str
-        Path to bed(bed-like) file.
+        Path to the bgzip compressed BED file, the index should be path + '.tbi'.
+    grange : `luckyegg.genome.GenomeRange`
+        Query region.
     general : bool
         Treat the file as general bed-like file or not.
     """
-    if not general:
-        bed_type = infer_bed_type(path)
+    index = TabixIndex.load(path + ".tbi")
+    if grange.start is None:
+        beg, end = 0, MAX_POS
     else:
-        bed_type = BedGeneral
-    header_rows = infer_header_rows(path)
-    with open(path) as f:
-        [f.readline() for _ in range(header_rows)]
-        for line in f:
-            line = line.strip()
-            yield bed_type.from_line(line)
+        beg = grange.start
+        end = grange.start + 1 if grange.end is None else grange.end
+    lines = []
+    with BgzfReader(path) as f:
+        for vbeg, vend in index.chunks(grange.chrom, beg, end):
+            f.seek(vbeg)
+            while f.tell() < vend:
+                line = f.readline()
+                if not line:
+                    break
+                items = line.split(None, 3)
+                if len(items) < 3 or items[0].decode() != grange.chrom:
+                    continue
+                if int(items[1]) < end and int(items[2]) > beg:
+                    lines.append(line)
+    if len(lines) == 0:
+        return []
+    bed_type = BedGeneral if general else bed_type_from_ncols(len(lines[0].split()))
+    return parse_bed_block(b"".join(lines), bed_type, []).to_records()
 
 
 def infer_bed_type(path:str) -> Type[BEDLike]:
-    with open(path) as f:
+    with timer("bed.sniff_seconds"), open(path) as f:
         while True:
             line = f.readline()
             if not is_header(line):
@@ -128,20 +796,11 @@ def infer_bed_type(path:str) -> Type[BEDLike]:
         else:
             raise IOError(f"Bed-like file {path} don't have enough content.")
     items = line.strip().split()
-    if len(items) == 4:
-        return BedGraph
-    elif len(items) == 6:
-        return Bed6
-    elif len(items) == 9:
-        return Bed9
-    elif len(items) == 12:
-        return Bed12
-    else:
-        return BedGeneral
+    return bed_type_from_ncols(len(items))
 
 
 def infer_header_rows(path:str) -> int:
-    with open(path) as f:
+    with timer("bed.sniff_seconds"), open(path) as f:
         i = 0
         while True:
             line = f.readline()
@@ -159,3 +818,717 @@ def is_header(line) -> bool:
         return True
     else:
         return False
+
+
+# Set operations on sorted BED streams.
+# Inputs are sorted by chromosome name(lexicographic order, like `sort -k1,1 -k2,2n`) then start,
+# and are processed chromosome by chromosome in a single pass.
+
+BEDSource = Union[str, IO, Iterable[BEDLike], Iterable[BEDBatch]]
+
+
+def _as_batches(source:BEDSource, chunksize:int=DEFAULT_CHUNKSIZE) -> Iterator[BEDBatch]:
+    """
+    Normalize a path, file object, or iterable of records/batches to an iterator of batches.
+    """
+    if isinstance(source, str) or hasattr(source, "read"):
+        yield from read_bed_batches(source, chunksize=chunksize)
+        return
+    records = []
+    for item in source:
+        if isinstance(item, BEDBatch):
+            if records:
+                yield BEDBatch.from_records(records)
+                records = []
+            yield item
+        else:
+            records.append(item)
+            if len(records) >= chunksize:
+                yield BEDBatch.from_records(records)
+                records = []
+    if records:
+        yield BEDBatch.from_records(records)
+
+
+def _sorted_chunks(batches:Iterable[BEDBatch], name:str) -> Iterator[Tuple[str, BEDBatch]]:
+    """
+    Split batches to chunks of one chromosome, yield (chrom, chunk).
+    Raise ValueError if the records are not sorted.
+    """
+    last_chrom, last_start = None, -1
+    for batch in batches:
+        n = len(batch)
+        if n == 0:
+            continue
+        codes = batch.ranges.codes
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        for b0, b1 in zip([0] + bounds.tolist(), bounds.tolist() + [n]):
+            chrom = batch.ranges.chroms[codes[b0]]
+            chunk = batch.take(slice(b0, b1))
+            start = chunk.ranges.start
+            if chrom != last_chrom:
+                if last_chrom is not None and chrom < last_chrom:
+                    raise ValueError(f"{name} is not sorted: chromosome {chrom} after {last_chrom}.")
+                last_start = -1
+            if start[0] < last_start or np.any(start[1:] < start[:-1]):
+                raise ValueError(f"{name} is not sorted by start on chromosome {chrom}.")
+            last_chrom, last_start = chrom, int(start[-1])
+            yield chrom, chunk
+
+
+class _SweepWindow(object):
+    """
+    Active window of the sorted stream b, advanced along the chunks of the sorted stream a.
+
+    For each chunk of a, the window holds the b records of the chromosome which end after
+    the chunk's first start, up to the first record starts at or after the chunk's max end.
+    Records end before it can't overlap the following a records and are dropped,
+    only the one with the largest end is kept as the upstream neighbour(for `closest`).
+    So the memory is bounded by the b records around the a chunk, not by the chromosome.
+    """
+    def __init__(self, chunks:Iterator[Tuple[str, BEDBatch]]) -> None:
+        self._chunks = chunks
+        self._pending = next(chunks, None)
+        self.bed_type = None if self._pending is None else self._pending[1].bed_type
+        self.n_extra = 0 if self._pending is None else len(_extra_columns(self._pending[1]))
+        self.chrom = None
+        self.batch = None  # active records, in the order of the stream
+        self.upstream = None  # dropped record with the largest end(the last one if tie)
+
+    def _drop(self, pos:int) -> None:
+        ended = self.batch.ranges.end <= pos
+        if not np.any(ended):
+            return
+        idx = np.flatnonzero(ended)
+        last = idx[::-1][np.argmax(self.batch.ranges.end[idx][::-1])]
+        if self.upstream is None or self.batch.ranges.end[last] >= self.upstream.ranges.end[0]:
+            self.upstream = self.batch.take(slice(last, last + 1))
+        self.batch = self.batch.take(~ended) if not np.all(ended) else None
+
+    def advance(self, chrom:str, chunk:BEDBatch) -> None:
+        """
+        Move the window to a chunk of a, chunks must be given in order.
+        """
+        if chrom != self.chrom:
+            self.chrom, self.batch, self.upstream = chrom, None, None
+            while self._pending is not None and self._pending[0] < chrom:
+                self._pending = next(self._chunks, None)
+        elif self.batch is not None:
+            self._drop(int(chunk.ranges.start[0]))
+        max_end = int(chunk.ranges.end.max())
+        parts = [] if self.batch is None else [self.batch]
+        while (self._pending is not None and self._pending[0] == chrom and
+               (not parts or parts[-1].ranges.start[-1] < max_end)):
+            parts.append(self._pending[1])
+            self._pending = next(self._chunks, None)
+        if len(parts) > 1:
+            self.batch = BEDBatch.concat(parts)
+        elif parts:
+            self.batch = parts[0]
+        if self.batch is not None:
+            self._drop(int(chunk.ranges.start[0]))
+
+    def candidates(self) -> Optional[BEDBatch]:
+        """
+        Active records with the upstream neighbour(first), for nearest search.
+        """
+        parts = [b for b in (self.upstream, self.batch) if b is not None]
+        if len(parts) > 1:
+            return BEDBatch.concat(parts)
+        return parts[0] if parts else None
+
+
+def _extra_columns(batch:BEDBatch) -> List[np.ndarray]:
+    """
+    Raw text of the columns after the third.
+    """
+    if batch.bed_type is BedGeneral:
+        return [batch.fields["items"]]
+    return [batch.fields[name] for name in batch.bed_type._fields[3:]]
+
+
+def _with_ranges(batch:BEDBatch, start:np.ndarray, end:np.ndarray) -> BEDBatch:
+    ranges = GenomeRangeArray(batch.ranges.chroms, batch.ranges.codes, start, end)
+    return BEDBatch(batch.bed_type, ranges, batch.fields, batch.values)
+
+
+class _IntervalOutput(object):
+    """
+    Build BedGeneral batches of the results, with a shared chromosome list.
+    """
+    def __init__(self) -> None:
+        self.chroms = []
+        self._index = {}
+
+    def batch(self, chrom:str, start:np.ndarray, end:np.ndarray, items:Optional[np.ndarray]=None) -> BEDBatch:
+        if chrom not in self._index:
+            self._index[chrom] = len(self.chroms)
+            self.chroms.append(chrom)
+        n = start.shape[0]
+        ranges = GenomeRangeArray(self.chroms, np.full(n, self._index[chrom], dtype=np.int32), start, end)
+        if items is None:
+            items = np.zeros(n, dtype="S1")
+        return BEDBatch(BedGeneral, ranges, {"items": items}, {})
+
+
+def _clusters(start:np.ndarray, end:np.ndarray, distance:int=0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge intervals sorted by start, intervals overlap or within `distance` are merged.
+    """
+    cum_end = np.maximum.accumulate(end)
+    new = np.ones(start.shape[0], dtype=bool)
+    new[1:] = start[1:] > cum_end[:-1] + distance
+    first = np.flatnonzero(new)
+    last = np.append(first[1:], start.shape[0]) - 1
+    return start[first], cum_end[last]
+
+
+def merge(source:BEDSource, distance:int=0) -> Iterator[BEDBatch]:
+    """
+    Merge overlapping or book-ended records of a sorted BED stream, like `bedtools merge`.
+    Yield BedGeneral batches of the merged intervals.
+
+    Parameters
+    ----------
+    source : {str, file object, iterable}
+        Path, file object, or iterable of sorted BED records or `BEDBatch`.
+    distance : int
+        Max distance between records to be merged.
+    """
+    out = _IntervalOutput()
+    cur = None  # the last cluster, may be extended by the following records
+    for chrom, chunk in _sorted_chunks(_as_batches(source), "Input"):
+        start, end = chunk.ranges.start, chunk.ranges.end
+        if cur is not None and cur[0] == chrom:
+            start = np.concatenate([[cur[1]], start])
+            end = np.concatenate([[cur[2]], end])
+        elif cur is not None:
+            yield out.batch(cur[0], np.array([cur[1]]), np.array([cur[2]]))
+        c_start, c_end = _clusters(start, end, distance)
+        if c_start.shape[0] > 1:
+            yield out.batch(chrom, c_start[:-1], c_end[:-1])
+        cur = (chrom, int(c_start[-1]), int(c_end[-1]))
+    if cur is not None:
+        yield out.batch(cur[0], np.array([cur[1]]), np.array([cur[2]]))
+
+
+def _sweep(a:BEDSource, b:BEDSource) -> Iterator[Tuple[str, BEDBatch, _SweepWindow]]:
+    """
+    Sweep two sorted streams together, yield (chrom, chunk of a, window of b).
+    Only the b records around the a chunk are kept in memory, see `_SweepWindow`.
+    """
+    window = _SweepWindow(_sorted_chunks(_as_batches(b), "B"))
+    for chrom, chunk in _sorted_chunks(_as_batches(a), "A"):
+        window.advance(chrom, chunk)
+        yield chrom, chunk, window
+
+
+def intersect(a:BEDSource, b:BEDSource, mode:str="overlap") -> Iterator[BEDBatch]:
+    """
+    Intersect two sorted BED streams, like `bedtools intersect`. Yield batches of a's type.
+
+    Parameters
+    ----------
+    a, b : {str, file object, iterable}
+        Path, file object, or iterable of sorted BED records or `BEDBatch`.
+    mode : {'overlap', 'any', 'none'}
+        'overlap': each overlapping pair of a and b, a record's interval clipped to the overlap.
+        'any': a records overlap with any b record, once each(-u).
+        'none': a records don't overlap with b records(-v).
+    """
+    if mode not in ("overlap", "any", "none"):
+        raise ValueError(f"Unknown intersect mode: {mode}")
+    for chrom, chunk, window in _sweep(a, b):
+        b_win = window.batch
+        index = None if b_win is None else IntervalIndex(b_win.ranges)
+        if mode == "overlap":
+            if index is None:
+                continue
+            query_ids, ids = index.query(chunk.ranges)
+            res = chunk.take(query_ids)
+            res = _with_ranges(res,
+                               np.maximum(res.ranges.start, b_win.ranges.start[ids]),
+                               np.minimum(res.ranges.end, b_win.ranges.end[ids]))
+        else:
+            hit = np.zeros(len(chunk), dtype=bool) if index is None else index.count_overlaps(chunk.ranges) > 0
+            res = chunk.take(hit if mode == "any" else ~hit)
+        if len(res) > 0:
+            yield res
+
+
+def subtract(a:BEDSource, b:BEDSource) -> Iterator[BEDBatch]:
+    """
+    Remove the parts of a records overlapped by b records, like `bedtools subtract`.
+    A record may be split to several pieces. Yield batches of a's type.
+
+    Parameters
+    ----------
+    a, b : {str, file object, iterable}
+        Path, file object, or iterable of sorted BED records or `BEDBatch`.
+    """
+    for chrom, chunk, window in _sweep(a, b):
+        if window.batch is None:
+            yield chunk
+            continue
+        u_start, u_end = _clusters(window.batch.ranges.start, window.batch.ranges.end)
+        start, end = chunk.ranges.start, chunk.ranges.end
+        # union intervals [i0, i1) overlap with each record, split it to k + 1 pieces
+        i0 = np.searchsorted(u_end, start, side="right")
+        i1 = np.searchsorted(u_start, end, side="left")
+        k = np.maximum(i1 - i0, 0)
+        rows = np.repeat(np.arange(len(chunk)), k + 1)
+        j = np.arange(rows.shape[0]) - np.repeat(np.cumsum(k + 1) - (k + 1), k + 1)
+        last = u_start.shape[0] - 1
+        p_start = np.where(j == 0, start[rows], u_end[np.clip(i0[rows] + j - 1, 0, last)])
+        p_end = np.where(j == k[rows], end[rows], u_start[np.clip(i0[rows] + j, 0, last)])
+        p_start = np.maximum(p_start, start[rows])
+        p_end = np.minimum(p_end, end[rows])
+        keep = p_end > p_start
+        res = _with_ranges(chunk.take(rows[keep]), p_start[keep], p_end[keep])
+        if len(res) > 0:
+            yield res
+
+
+def _join_columns(columns:List[np.ndarray]) -> np.ndarray:
+    """
+    Join text columns with tab, empty values are replaced with '.'.
+    """
+    res = None
+    for col in columns:
+        col = col.astype("S") if col.dtype.kind != "S" else col
+        col = np.where(col == b"", b".", col)
+        res = col if res is None else np.char.add(np.char.add(res, b"\t"), col)
+    return res
+
+
+def closest(a:BEDSource, b:BEDSource) -> Iterator[BEDBatch]:
+    """
+    Find the closest b record of each a record, like `bedtools closest -d -t first`.
+    Overlapping records have distance 0, otherwise the distance is the gap between them.
+
+    Yield BedGeneral batches, the columns are: a record, b record, distance.
+    If there is no b record on the chromosome, b columns are '.'(positions -1) and distance is -1.
+
+    Parameters
+    ----------
+    a, b : {str, file object, iterable}
+        Path, file object, or iterable of sorted BED records or `BEDBatch`.
+    """
+    out = _IntervalOutput()
+    for chrom, chunk, window in _sweep(a, b):
+        n = len(chunk)
+        b_chrom = window.candidates()
+        if b_chrom is None:
+            ids, distances = np.full(n, -1), np.full(n, -1)
+            b_cols = [np.full(n, b"."), np.full(n, -1), np.full(n, -1)] + [np.full(n, b".")] * window.n_extra
+        else:
+            ids, distances = IntervalIndex(b_chrom.ranges).nearest(chunk.ranges)
+            found = ids >= 0
+            idx = np.maximum(ids, 0)
+            b_cols = [np.where(found, chrom.encode(), b"."),
+                      np.where(found, b_chrom.ranges.start[idx], -1),
+                      np.where(found, b_chrom.ranges.end[idx], -1)]
+            b_cols += [np.where(found, col[idx], b".") for col in _extra_columns(b_chrom)]
+        items = _join_columns(_extra_columns(chunk) + b_cols + [distances])
+        yield out.batch(chrom, chunk.ranges.start, chunk.ranges.end, items)
+
+
+def complement(source:BEDSource, chromsizes:ChromSizes) -> Iterator[BEDBatch]:
+    """
+    Intervals of the genome not covered by the records of a sorted BED stream,
+    like `bedtools complement`. Chromosomes are in lexicographic order.
+    Yield BedGeneral batches.
+
+    Parameters
+    ----------
+    source : {str, file object, iterable}
+        Path, file object, or iterable of sorted BED records or `BEDBatch`.
+    chromsizes : `luckyegg.genome.ChromSizes`
+        Chromosome sizes of the genome.
+    """
+    out = _IntervalOutput()
+    genome = sorted(chromsizes.sizes)
+    pos = 0  # index of the next chromosome in genome
+    cur_chrom, covered = None, 0
+
+    def tail(chrom, covered):
+        size = chromsizes[chrom]
+        return [out.batch(chrom, np.array([covered]), np.array([size]))] if covered < size else []
+
+    for chrom, chunk in _sorted_chunks(_as_batches(source), "Input"):
+        if chrom not in chromsizes.sizes:
+            raise ValueError(f"Chromosome {chrom} not in chromsizes.")
+        if chrom != cur_chrom:
+            if cur_chrom is not None:
+                yield from tail(cur_chrom, covered)
+            while genome[pos] < chrom:  # chromosomes without any record
+                yield out.batch(genome[pos], np.array([0]), np.array([chromsizes[genome[pos]]]))
+                pos += 1
+            pos += 1
+            cur_chrom, covered = chrom, 0
+        size = chromsizes[chrom]
+        start = np.minimum(chunk.ranges.start, size)
+        cum_end = np.maximum.accumulate(np.concatenate([[covered], np.minimum(chunk.ranges.end, size)]))
+        gap = start > cum_end[:-1]
+        if np.any(gap):
+            yield out.batch(chrom, cum_end[:-1][gap], start[gap])
+        covered = int(cum_end[-1])
+    if cur_chrom is not None:
+        yield from tail(cur_chrom, covered)
+    for chrom in genome[pos:]:
+        yield out.batch(chrom, np.array([0]), np.array([chromsizes[chrom]]))
+
+
+# External merge sort.
+
+DEFAULT_SORT_MEMORY = 1 << 30
+_SORT_POS_BITS = 40  # (chrom rank, start) are packed into one int64 key during merging
+
+
+def _batch_nbytes(batch:BEDBatch) -> int:
+    ranges = batch.ranges
+    return (ranges.codes.nbytes + ranges.start.nbytes + ranges.end.nbytes +
+            sum(v.nbytes for v in batch.fields.values()) + sum(v.nbytes for v in batch.values.values()))
+
+
+def _write_run(batch:BEDBatch, path:str) -> str:
+    """
+    Sort a batch by (chrom name, start, end), save the columns to a run directory.
+    """
+    ranges = batch.ranges
+    order = sorted(range(len(ranges.chroms)), key=ranges.chroms.__getitem__)
+    rank = np.empty(len(order) + 1, dtype=np.int32)
+    rank[order] = np.arange(len(order))
+    codes = rank[ranges.codes]
+    if len(batch) > 0 and (ranges.start.min() < 0 or ranges.start.max() >= 1 << _SORT_POS_BITS):
+        raise ValueError(f"Start positions must within [0, {1 << _SORT_POS_BITS}) for sorting.")
+    idx = np.lexsort((ranges.end, ranges.start, codes))
+    os.makedirs(path)
+    cols = {"codes": codes[idx], "start": ranges.start[idx], "end": ranges.end[idx]}
+    cols.update({"field." + k: v[idx] for k, v in batch.fields.items()})
+    for name, col in cols.items():
+        np.save(os.path.join(path, name + ".npy"), col)
+    meta = {"chroms": [ranges.chroms[i] for i in order], "bed_type": batch.bed_type.__name__,
+            "fields": list(batch.fields), "n": len(batch)}
+    with open(os.path.join(path, "meta.json"), 'w') as f:
+        json.dump(meta, f)
+    return path
+
+
+def _range_run(path:str, begin:int, end:int, bed_type:Type[BEDLike], run_path:str) -> str:
+    """
+    Parse a byte range of a BED file and save it as a sorted run, for process pool.
+    """
+    with open(path, 'rb') as f:
+        f.seek(begin)
+        data = f.read(end - begin)
+    if data and not data.endswith(b"\n"):
+        data += b"\n"
+    return _write_run(parse_bed_block(data, bed_type, []), run_path)
+
+
+def _generate_runs(source:Union[str, IO], general:bool, max_memory:int,
+                   workers:int, tmp_dir:str) -> Iterator[str]:
+    if workers > 1 and isinstance(source, str) and source != "-" and not _is_gzip(source):
+        from concurrent.futures import ProcessPoolExecutor
+        from luckyegg.parallel import split_file, iter_ordered
+        bed_type, offset = sniff_bed(source, general=general)
+        # text expands about 2x when parsed, and sorting needs another copy
+        ranges = split_file(source, max(max_memory // (4 * workers), 1 << 16), offset)
+        tasks = ((source, b, e, bed_type, os.path.join(tmp_dir, f"run{i}")) for i, (b, e) in enumerate(ranges))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from iter_ordered(executor, _range_run, tasks, 2 * workers)
+        return
+    batches, nbytes, i = [], 0, 0
+    chunksize = min(max(max_memory // 1024, 1024), DEFAULT_CHUNKSIZE)
+    for batch in BEDReader(source, general=general, chunksize=chunksize):
+        batches.append(batch)
+        nbytes += _batch_nbytes(batch)
+        if nbytes >= max_memory // 2:
+            yield _write_run(BEDBatch.concat(batches), os.path.join(tmp_dir, f"run{i}"))
+            batches, nbytes, i = [], 0, i + 1
+    if batches:
+        yield _write_run(BEDBatch.concat(batches), os.path.join(tmp_dir, f"run{i}"))
+
+
+def _is_gzip(path:str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(2) == b"\x1f\x8b"
+
+
+class _Run(object):
+    """
+    Memory-mapped sorted run, read block by block.
+    """
+    def __init__(self, path:str, chrom_index:Dict[str, int]) -> None:
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.bed_type = BED_TYPES[meta["bed_type"]]
+        self.n = meta["n"]
+        self.pos = 0
+        lut = np.array([chrom_index[c] for c in meta["chroms"]] + [-1], dtype=np.int64)
+        load = lambda name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+        self._codes, self._lut = load("codes"), lut
+        self._start, self._end = load("start"), load("end")
+        self._fields = {k: load("field." + k) for k in meta["fields"]}
+        self.last_key = -1
+
+    @property
+    def exhausted(self) -> bool:
+        return self.pos >= self.n
+
+    def read(self, n_rows:int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        sl = slice(self.pos, min(self.pos + n_rows, self.n))
+        self.pos = sl.stop
+        codes = self._lut[self._codes[sl]]
+        start = np.array(self._start[sl])
+        key = (codes << _SORT_POS_BITS) | start
+        self.last_key = int(key[-1])
+        return key, codes, np.array(self._end[sl]), {k: np.array(v[sl]) for k, v in self._fields.items()}
+
+
+def _merge_runs(run_paths:List[str], max_memory:int) -> Iterator[BEDBatch]:
+    """
+    K-way merge sorted runs. Each step loads a block from the run which limit the progress,
+    and emits all buffered rows before the smallest 'last loaded key' of unfinished runs.
+    """
+    chroms = set()
+    for path in run_paths:
+        with open(os.path.join(path, "meta.json")) as f:
+            chroms.update(json.load(f)["chroms"])
+    chroms = sorted(chroms)
+    chrom_index = {c: i for i, c in enumerate(chroms)}
+    runs = [_Run(p, chrom_index) for p in run_paths]
+    runs = [r for r in runs if r.n > 0]
+    if not runs:
+        return
+    row_bytes = 20 + sum(v.itemsize for v in runs[0]._fields.values())
+    block_rows = max(max_memory // (2 * len(runs) * row_bytes), 1024)
+    buf = None
+    loading = runs
+    while True:
+        parts = [r.read(block_rows) for r in loading]
+        if buf is not None:
+            parts.append(buf)
+        key, codes, end = (np.concatenate([p[i] for p in parts]) for i in range(3))
+        fields = {k: np.concatenate([p[3][k] for p in parts]) for k in parts[0][3]}
+        active = [r for r in runs if not r.exhausted]
+        bound = min(r.last_key for r in active) if active else None
+        order = np.lexsort((end, key))
+        n_emit = key.shape[0] if bound is None else int(np.searchsorted(key[order], bound, side="left"))
+        emit, rest = order[:n_emit], order[n_emit:]
+        if n_emit > 0:
+            ranges = GenomeRangeArray(chroms, codes[emit], key[emit] & ((1 << _SORT_POS_BITS) - 1), end[emit])
+            yield BEDBatch(runs[0].bed_type, ranges, {k: v[emit] for k, v in fields.items()})
+        if bound is None:
+            break
+        buf = (key[rest], codes[rest], end[rest], {k: v[rest] for k, v in fields.items()})
+        loading = [r for r in active if r.last_key == bound]
+
+
+def sort_bed_batches(source:Union[str, IO],
+        general:bool=False,
+        max_memory:int=DEFAULT_SORT_MEMORY,
+        workers:int=1,
+        tmp_dir:Optional[str]=None) -> Iterator[BEDBatch]:
+    """
+    Sort a BED file by (chrom name, start, end) with an external merge sort.
+    Chunks are sorted in memory and spilled to temporary runs(.npy columns),
+    then the runs are merged block by block. Header lines are dropped.
+    Yield sorted `BEDBatch`, see `sort_bed` for the parameters.
+    """
+    with tempfile.TemporaryDirectory(prefix="luckyegg-sort-", dir=tmp_dir) as tmp:
+        runs = list(_generate_runs(source, general, max_memory, workers, tmp))
+        yield from _merge_runs(runs, max_memory)
+
+
+def sort_bed(source:Union[str, IO],
+        output:Union[str, IO],
+        general:bool=False,
+        max_memory:int=DEFAULT_SORT_MEMORY,
+        workers:int=1,
+        tmp_dir:Optional[str]=None) -> None:
+    """
+    Sort a BED file by (chrom name, start, end), like `sort -k1,1 -k2,2n -k3,3n`,
+    files larger than memory are sorted with temporary files.
+
+    Parameters
+    ----------
+    source : {str, file object}
+        Path to bed(bed-like) file, '-' for stdin, or an opened file object.
+    output : {str, file object}
+        Path or opened text file object of the sorted output.
+    general : bool
+        Treat the file as general bed-like file or not.
+    max_memory : int
+        Approximate memory ceiling(bytes) of parsed records.
+    workers : int
+        Number of processes to generate the sorted runs,
+        only take effect when source is a path of uncompressed file.
+    tmp_dir : str, optional
+        Directory of temporary files, default is the system temporary directory.
+    """
+    write_bed(output, sort_bed_batches(source, general, max_memory, workers, tmp_dir))
+
+
+# Writing BED files.
+
+WRITE_BUFFER = 1 << 24  # bytes of formatted text written(and compressed) at once
+GZIP_MEMBER_SIZE = 1 << 22  # uncompressed size of each gzip member compressed by a thread
+
+
+def format_batch(batch:BEDBatch, squeeze:bool=True) -> bytes:
+    """
+    Format a batch to BED text lines, same as `str(record) + '\\n'` of each record in `batch.to_records()`.
+    The whole batch is formatted at once, without creating Python objects per record.
+
+    Parameters
+    ----------
+    batch : `BEDBatch`
+        Records to format.
+    squeeze : bool
+        Replace whitespace runs in the 'items' column of `BedGeneral` batch with a tab,
+        like the items are split when converted to records. Batches built from records
+        don't need it, their 'items' column are already joined by tab.
+    """
+    ranges = batch.ranges
+    chroms = np.array([c.encode() for c in ranges.chroms] + [b""], dtype="S")
+    columns = [chroms[ranges.codes], format_ints(ranges.start), format_ints(ranges.end)]
+    if batch.bed_type is BedGeneral:
+        items = batch.fields["items"]
+        columns.append(squeeze_whitespace(items) if squeeze else items)
+        return join_lines(columns, skip_empty=(3,))
+    columns.extend(batch.fields[name] for name in batch.bed_type._fields[3:])
+    return join_lines(columns)
+
+
+def _iter_formatted(source:BEDSource, chunksize:int=DEFAULT_CHUNKSIZE) -> Iterator[bytes]:
+    """
+    Formatted text of the records/batches, joined to buffers of about `WRITE_BUFFER` bytes.
+    """
+    if isinstance(source, str) or hasattr(source, "read"):
+        source = read_bed_batches(source, chunksize=chunksize)
+    buf, size = [], 0
+
+    def formatted():
+        records = []
+        for item in source:
+            if isinstance(item, BEDBatch):
+                if records:
+                    yield format_batch(BEDBatch.from_records(records), squeeze=False)
+                    records = []
+                yield format_batch(item)
+            else:
+                records.append(item)
+                if len(records) >= chunksize:
+                    yield format_batch(BEDBatch.from_records(records), squeeze=False)
+                    records = []
+        if records:
+            yield format_batch(BEDBatch.from_records(records), squeeze=False)
+
+    for data in formatted():
+        buf.append(data)
+        size += len(data)
+        if size >= WRITE_BUFFER:
+            yield b"".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield b"".join(buf)
+
+
+def _write_gzip(f:IO, chunks:Iterable[bytes], level:int, threads:int) -> None:
+    """
+    Write data as a series of gzip members(a valid multi-member gzip file),
+    members are compressed in parallel by threads.
+    """
+    def members():
+        for data in chunks:
+            for i in range(0, len(data), GZIP_MEMBER_SIZE):
+                yield data[i:i+GZIP_MEMBER_SIZE]
+
+    compress = lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+    if threads <= 1:
+        for data in members():
+            f.write(compress(data))
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(threads) as pool:
+        pending = []
+        for data in members():
+            pending.append(pool.submit(compress, data))
+            if len(pending) >= 2 * threads:
+                f.write(pending.pop(0).result())
+        for fut in pending:
+            f.write(fut.result())
+
+
+class _TextSink(object):
+    """
+    Write bytes to a text file object without underlying buffer, like `io.StringIO`.
+    """
+    def __init__(self, f:IO) -> None:
+        self.f = f
+
+    def write(self, data:bytes) -> None:
+        self.f.write(data.decode())
+
+    def flush(self) -> None:
+        self.f.flush()
+
+
+def write_bed(target:Union[str, IO],
+        source:BEDSource,
+        compression:Optional[str]=None,
+        level:int=6,
+        threads:int=1,
+        index:bool=False) -> None:
+    """
+    Write BED records to a file, the output is the same as writing `str(record) + '\\n'` of each record.
+
+    Parameters
+    ----------
+    target : {str, file object}
+        Path, '-' for stdout, or an opened file object(binary or text).
+    source : {str, file object, iterable}
+        BED records(`BEDLike`), `BEDBatch`es, or path/file object of a BED file.
+    compression : {None, 'gzip', 'bgzip'}
+        Compress the output with gzip or bgzip(BGZF).
+    level : int
+        Compression level.
+    threads : int
+        Number of threads for compression.
+    index : bool
+        Build the tabix index(target + '.tbi'), require bgzip compression,
+        target to be a path and the records are sorted.
+    """
+    if compression not in (None, "gzip", "bgzip"):
+        raise ValueError(f"Unsupported compression: {compression}")
+    if index and (compression != "bgzip" or not isinstance(target, str) or target == "-"):
+        raise ValueError("Index can only be built for bgzip compressed output file.")
+    with ExitStack() as stack:
+        if target == "-":
+            f = sys.stdout.buffer
+        elif isinstance(target, str):
+            f = stack.enter_context(open(target, 'wb'))
+        elif isinstance(target, io.TextIOBase) and hasattr(target, "buffer"):
+            target.flush()
+            f = target.buffer
+        elif isinstance(target, io.TextIOBase):
+            if compression is not None:
+                raise ValueError("Compressed output require a binary file object.")
+            f = _TextSink(target)
+        else:
+            f = target
+        chunks = _iter_formatted(source)
+        if compression == "gzip":
+            _write_gzip(f, chunks, level, threads)
+        elif compression == "bgzip":
+            with BgzfWriter(f, level=level, threads=threads) as writer:
+                for data in chunks:
+                    writer.write(data)
+        else:
+            for data in chunks:
+                f.write(data)
+        f.flush()
+    if index:
+        index_bed(target)
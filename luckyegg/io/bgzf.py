@@ -0,0 +1,217 @@
+"""
+Reader and writer of the BGZF(blocked gzip) format.
+
+BGZF file is a series of gzip members(blocks) with at most 64KB data each,
+a position in the file is addressed by a 'virtual offset':
+`(block offset in file << 16) | (offset in uncompressed block)`.
+"""
+import zlib
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Iterator, Tuple, Union
+
+MAX_BLOCK_DATA = 0xff00
+EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+_HEADER = struct.Struct("<4sIBBH2sHH")
+
+
+def compress_block(data:bytes, level:int=6) -> bytes:
+    """
+    Compress data(at most `MAX_BLOCK_DATA` bytes) to a BGZF block.
+    """
+    c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = c.compress(data) + c.flush()
+    block_size = _HEADER.size + len(deflated) + 8
+    header = _HEADER.pack(b"\x1f\x8b\x08\x04", 0, 0, 0xff, 6, b"BC", 2, block_size - 1)
+    return header + deflated + struct.pack("<II", zlib.crc32(data), len(data))
+
+
+def make_voffset(block_offset:int, within:int) -> int:
+    return (block_offset << 16) | within
+
+
+def split_voffset(voffset:int) -> Tuple[int, int]:
+    return voffset >> 16, voffset & 0xffff
+
+
+class BgzfWriter(object):
+    """
+    Write data to a BGZF file.
+
+    Parameters
+    ----------
+    target : {str, file object}
+        Path or opened binary file object.
+    level : int
+        Compression level.
+    threads : int
+        Number of threads to compress the blocks, zlib release the GIL while compressing.
+    """
+    def __init__(self, target:Union[str, IO], level:int=6, threads:int=1) -> None:
+        if isinstance(target, str):
+            self._file = open(target, 'wb')
+            self._own_file = True
+        else:
+            self._file = target
+            self._own_file = False
+        self.level = level
+        self._buffer = bytearray()
+        self._block_offset = 0
+        self._pool = ThreadPoolExecutor(threads) if threads > 1 else None
+
+    def __enter__(self) -> 'BgzfWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def tell(self) -> int:
+        """
+        Virtual offset of the current position.
+        """
+        return make_voffset(self._block_offset, len(self._buffer))
+
+    def _write_blocks(self, blocks) -> None:
+        for block in blocks:
+            self._file.write(block)
+            self._block_offset += len(block)
+
+    def write(self, data:bytes) -> None:
+        self._buffer += data
+        if len(self._buffer) >= MAX_BLOCK_DATA:
+            n_full = len(self._buffer) // MAX_BLOCK_DATA
+            chunks = [bytes(self._buffer[i*MAX_BLOCK_DATA:(i+1)*MAX_BLOCK_DATA]) for i in range(n_full)]
+            del self._buffer[:n_full*MAX_BLOCK_DATA]
+            if self._pool is not None and n_full > 1:
+                self._write_blocks(self._pool.map(compress_block, chunks, [self.level] * n_full))
+            else:
+                self._write_blocks(compress_block(c, self.level) for c in chunks)
+
+    def flush(self) -> None:
+        """
+        Compress the buffered data to a block, following data start a new block.
+        """
+        if self._buffer:
+            self._write_blocks([compress_block(bytes(self._buffer), self.level)])
+            self._buffer.clear()
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        self.flush()
+        self._file.write(EOF_BLOCK)
+        if self._pool is not None:
+            self._pool.shutdown()
+        if self._own_file:
+            self._file.close()
+        self._file = None
+
+
+class BgzfReader(object):
+    """
+    Random access reader of a BGZF file.
+
+    Parameters
+    ----------
+    source : {str, file object}
+        Path or opened binary file object.
+    """
+    def __init__(self, source:Union[str, IO]) -> None:
+        if isinstance(source, str):
+            self._file = open(source, 'rb')
+            self._own_file = True
+        else:
+            self._file = source
+            self._own_file = False
+        self._block_offset = 0
+        self._next_block_offset = 0
+        self._data = b""
+        self._pos = 0
+        self.seek(0)
+
+    def __enter__(self) -> 'BgzfReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._own_file:
+            self._file.close()
+
+    def _load_block(self, block_offset:int) -> None:
+        self._file.seek(block_offset)
+        header = self._file.read(_HEADER.size)
+        if len(header) == 0:
+            self._block_offset = self._next_block_offset = block_offset
+            self._data = b""
+            return
+        if len(header) < _HEADER.size or header[:4] != b"\x1f\x8b\x08\x04" or header[12:14] != b"BC":
+            raise IOError(f"Invalid BGZF block at offset {block_offset}.")
+        block_size = _HEADER.unpack(header)[-1] + 1
+        rest = self._file.read(block_size - _HEADER.size)
+        self._data = zlib.decompress(rest[:-8], -15)
+        self._block_offset = block_offset
+        self._next_block_offset = block_offset + block_size
+
+    def seek(self, voffset:int) -> None:
+        block_offset, within = split_voffset(voffset)
+        if block_offset != self._block_offset or self._next_block_offset == 0:
+            self._load_block(block_offset)
+        self._pos = within
+
+    def tell(self) -> int:
+        """
+        Virtual offset of the current position.
+        """
+        if self._pos == len(self._data) and self._next_block_offset != self._block_offset:
+            return make_voffset(self._next_block_offset, 0)
+        return make_voffset(self._block_offset, self._pos)
+
+    def _next_block(self) -> bool:
+        if self._next_block_offset == self._block_offset:  # reach the end
+            return False
+        self._load_block(self._next_block_offset)
+        self._pos = 0
+        return True
+
+    def readline(self) -> bytes:
+        parts = []
+        while True:
+            if self._pos >= len(self._data):
+                if not self._next_block():
+                    break
+                continue
+            nl = self._data.find(b"\n", self._pos)
+            if nl >= 0:
+                parts.append(self._data[self._pos:nl+1])
+                self._pos = nl + 1
+                break
+            parts.append(self._data[self._pos:])
+            self._pos = len(self._data)
+        return b"".join(parts)
+
+    def read(self, size:int=-1) -> bytes:
+        parts = []
+        while size != 0:
+            if self._pos >= len(self._data):
+                if not self._next_block():
+                    break
+                continue
+            end = len(self._data) if size < 0 else min(len(self._data), self._pos + size)
+            parts.append(self._data[self._pos:end])
+            if size > 0:
+                size -= end - self._pos
+            self._pos = end
+        return b"".join(parts)
+
+    def iter_lines(self) -> Iterator[Tuple[int, bytes]]:
+        """
+        Iterate over lines from current position, yield (virtual offset, line).
+        """
+        while True:
+            voffset = self.tell()
+            line = self.readline()
+            if not line:
+                break
+            yield voffset, line
@@ -0,0 +1,802 @@
+"""
+Reader and writer of bigWig files, with vectorized summary statistics over many intervals.
+
+See the bigWig format in: Kent et al. 2010, BigWig and BigBed: enabling browsing of large distributed datasets.
+"""
+import zlib
+import tempfile
+import struct
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from luckyegg.genome import GenomeRange, GenomeRangeArray, ChromSizes, NONE_POS
+
+
+BIGWIG_MAGIC = 0x888FFC26
+CHROM_TREE_MAGIC = 0x78CA8C91
+CIR_TREE_MAGIC = 0x2468ACE0
+
+_HEADER = struct.Struct("<IHHQQQHHQQIQ")
+_ZOOM_HEADER = struct.Struct("<IIQQ")
+_SUMMARY = struct.Struct("<Qdddd")
+_CHROM_TREE_HEADER = struct.Struct("<IIIIQQ")
+_CIR_TREE_HEADER = struct.Struct("<IIQIIIIQII")
+_NODE_HEADER = struct.Struct("<BBH")
+_SECTION_HEADER = struct.Struct("<IIIIIBBH")
+
+SECTION_BEDGRAPH = 1
+SECTION_VARSTEP = 2
+SECTION_FIXEDSTEP = 3
+
+_LEAF_DTYPE = np.dtype([("start_chrom", "<u4"), ("start", "<u4"), ("end_chrom", "<u4"), ("end", "<u4"),
+                        ("offset", "<u8"), ("size", "<u8")])
+_NODE_DTYPE = np.dtype([("start_chrom", "<u4"), ("start", "<u4"), ("end_chrom", "<u4"), ("end", "<u4"),
+                        ("offset", "<u8")])
+_BEDGRAPH_DTYPE = np.dtype([("start", "<u4"), ("end", "<u4"), ("value", "<f4")])
+_VARSTEP_DTYPE = np.dtype([("start", "<u4"), ("value", "<f4")])
+ZOOM_DTYPE = np.dtype([("chrom", "<u4"), ("start", "<u4"), ("end", "<u4"), ("valid", "<u4"),
+                       ("min", "<f4"), ("max", "<f4"), ("sum", "<f4"), ("sumsq", "<f4")])
+
+STATS = ("mean", "max", "min", "coverage", "sum")
+QUERY_CHUNK = 1 << 17
+
+
+class Summaries(object):
+    """
+    Summary records sorted by position, of raw intervals or zoom level data.
+    Raw intervals are records with valid = length, sum = value * length.
+    """
+    def __init__(self, start:np.ndarray, end:np.ndarray, valid:np.ndarray,
+            min:np.ndarray, max:np.ndarray, sum:np.ndarray) -> None:
+        self.start = start.astype(np.int64)
+        self.end = end.astype(np.int64)
+        self.valid = valid.astype(np.float64)
+        self.min = min.astype(np.float64)
+        self.max = max.astype(np.float64)
+        self.sum = sum.astype(np.float64)
+
+    @staticmethod
+    def from_intervals(start:np.ndarray, end:np.ndarray, value:np.ndarray) -> 'Summaries':
+        length = end.astype(np.int64) - start
+        return Summaries(start, end, length, value, value, value * length)
+
+    @staticmethod
+    def concat(parts:List['Summaries']) -> 'Summaries':
+        if len(parts) == 0:
+            empty = np.zeros(0)
+            return Summaries(empty, empty, empty, empty, empty, empty)
+        return Summaries(*(np.concatenate([getattr(p, k) for p in parts])
+                           for k in ("start", "end", "valid", "min", "max", "sum")))
+
+    def __len__(self) -> int:
+        return self.start.shape[0]
+
+    def summarize(self, qstart:np.ndarray, qend:np.ndarray, stats:Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Summary statistics of the records over query intervals [qstart, qend),
+        records partially overlap with a query are weighted by the overlapped fraction.
+        """
+        n = len(self)
+        lo = np.searchsorted(self.end, qstart, side="right")
+        hi = np.maximum(np.searchsorted(self.start, qend, side="left"), lo)
+        has = hi > lo
+        first = np.minimum(lo, max(n - 1, 0))
+        last = np.maximum(hi - 1, 0)
+        res = {}
+        if n == 0:
+            empty = np.zeros(qstart.shape[0])
+            for name in stats:
+                res[name] = empty if name in ("coverage", "sum") else np.full(qstart.shape[0], np.nan)
+            return res
+        length = np.maximum(self.end - self.start, 1)
+        left_cut = np.where(has, (np.maximum(self.start[first], qstart) - self.start[first]) / length[first], 0.0)
+        right_cut = np.where(has, (self.end[last] - np.minimum(self.end[last], qend)) / length[last], 0.0)
+
+        def total(x):
+            prefix = np.concatenate([[0.0], np.cumsum(x)])
+            return prefix[hi] - prefix[lo] - np.where(has, x[first] * left_cut + x[last] * right_cut, 0.0)
+
+        need_sum = any(name in ("mean", "sum") for name in stats)
+        valid = total(self.valid) if ("coverage" in stats or "mean" in stats) else None
+        sums = total(self.sum) if need_sum else None
+        for name in stats:
+            if name == "mean":
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    res[name] = np.where(valid > 0, sums / valid, np.nan)
+            elif name == "sum":
+                res[name] = sums
+            elif name == "coverage":
+                res[name] = valid / np.maximum(qend - qstart, 1)
+            elif name in ("min", "max"):
+                ufunc = np.minimum if name == "min" else np.maximum
+                values = np.append(getattr(self, name), np.nan)
+                idx = np.empty(2 * lo.shape[0], dtype=np.int64)
+                idx[0::2] = lo
+                idx[1::2] = hi
+                reduced = ufunc.reduceat(values, np.minimum(idx, n))[0::2]
+                res[name] = np.where(has, reduced, np.nan)
+            else:
+                raise ValueError(f"Unknown statistic: {name}, available: {STATS}")
+        return res
+
+
+class BigWigReader(object):
+    """
+    Reader of bigWig file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the bigWig file.
+
+    Attributes
+    ----------
+    chromsizes : `luckyegg.genome.ChromSizes`
+        Chromosome sizes in the file.
+    zoom_levels : list of tuple
+        (reduction level, data offset, index offset) of each zoom level.
+    """
+    def __init__(self, path:str) -> None:
+        self.path = path
+        self._file = open(path, 'rb')
+        self._lock = threading.Lock()
+        header = _HEADER.unpack(self._read(0, _HEADER.size))
+        (magic, self.version, n_zoom, chrom_tree_offset, self.data_offset, self.index_offset,
+         _, _, _, self.summary_offset, self.uncompress_buf_size, _) = header
+        if magic != BIGWIG_MAGIC:
+            raise IOError(f"{path} is not a bigWig file(or in big endian, which is not supported).")
+        zooms = self._read(_HEADER.size, _ZOOM_HEADER.size * n_zoom)
+        self.zoom_levels = []
+        for i in range(n_zoom):
+            reduction, _, data_offset, index_offset = _ZOOM_HEADER.unpack_from(zooms, i * _ZOOM_HEADER.size)
+            self.zoom_levels.append((reduction, data_offset, index_offset))
+        self._chrom_ids = {}
+        self._chrom_names = {}
+        sizes = {}
+        for name, chrom_id, size in self._read_chrom_tree(chrom_tree_offset):
+            self._chrom_ids[name] = chrom_id
+            self._chrom_names[chrom_id] = name
+            sizes[name] = size
+        self.chromsizes = ChromSizes(sizes)
+        self._leaves = {}
+
+    def __enter__(self) -> 'BigWigReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _read(self, offset:int, size:int) -> bytes:
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size)
+
+    def _read_chrom_tree(self, offset:int) -> List[Tuple[str, int, int]]:
+        magic, _, key_size, _, _, _ = _CHROM_TREE_HEADER.unpack(self._read(offset, _CHROM_TREE_HEADER.size))
+        if magic != CHROM_TREE_MAGIC:
+            raise IOError(f"Invalid chromosome tree in {self.path}.")
+        items = []
+
+        def read_node(node_offset):
+            is_leaf, _, count = _NODE_HEADER.unpack(self._read(node_offset, _NODE_HEADER.size))
+            item_size = key_size + 8
+            data = self._read(node_offset + _NODE_HEADER.size, item_size * count)
+            for i in range(count):
+                item = data[i*item_size:(i+1)*item_size]
+                if is_leaf:
+                    chrom_id, size = struct.unpack("<II", item[key_size:])
+                    items.append((item[:key_size].rstrip(b"\0").decode(), chrom_id, size))
+                else:
+                    read_node(struct.unpack("<Q", item[key_size:])[0])
+
+        read_node(offset + _CHROM_TREE_HEADER.size)
+        return items
+
+    @property
+    def summary(self) -> Dict[str, float]:
+        """
+        Total summary of the whole file.
+        """
+        covered, min_, max_, sum_, sumsq = _SUMMARY.unpack(self._read(self.summary_offset, _SUMMARY.size))
+        return {"coverage": covered, "min": min_, "max": max_, "sum": sum_, "sumsq": sumsq}
+
+    def _chrom_leaves(self, index_offset:int, chrom_id:int) -> np.ndarray:
+        """
+        Leaf items(data blocks) of R-tree index overlap with a chromosome.
+        """
+        key = (index_offset, chrom_id)
+        if key in self._leaves:
+            return self._leaves[key]
+        magic = _CIR_TREE_HEADER.unpack(self._read(index_offset, _CIR_TREE_HEADER.size))[0]
+        if magic != CIR_TREE_MAGIC:
+            raise IOError(f"Invalid R-tree index in {self.path}.")
+        leaves = []
+
+        def read_node(node_offset):
+            is_leaf, _, count = _NODE_HEADER.unpack(self._read(node_offset, _NODE_HEADER.size))
+            dtype = _LEAF_DTYPE if is_leaf else _NODE_DTYPE
+            items = np.frombuffer(self._read(node_offset + _NODE_HEADER.size, dtype.itemsize * count), dtype=dtype)
+            overlap = (items["start_chrom"] <= chrom_id) & (items["end_chrom"] >= chrom_id)
+            items = items[overlap]
+            if is_leaf:
+                leaves.append(items)
+            else:
+                for child in items["offset"]:
+                    read_node(int(child))
+
+        read_node(index_offset + _CIR_TREE_HEADER.size)
+        leaves = np.concatenate(leaves) if leaves else np.zeros(0, dtype=_LEAF_DTYPE)
+        leaves = leaves[np.argsort(leaves["offset"], kind="stable")]
+        self._leaves[key] = leaves
+        return leaves
+
+    def _read_blocks(self, leaves:np.ndarray) -> List[bytes]:
+        blocks = []
+        for offset, size in zip(leaves["offset"].tolist(), leaves["size"].tolist()):
+            data = self._read(offset, size)
+            if self.uncompress_buf_size > 0:
+                data = zlib.decompress(data)
+            blocks.append(data)
+        return blocks
+
+    @staticmethod
+    def _needed(leaves:np.ndarray, chrom_id:int, qstart:np.ndarray, qend:np.ndarray) -> np.ndarray:
+        """
+        Mask of the blocks overlap with any of the queries.
+        """
+        block_start = np.where(leaves["start_chrom"] < chrom_id, 0, leaves["start"]).astype(np.int64)
+        block_end = np.where(leaves["end_chrom"] > chrom_id, np.iinfo(np.int64).max, leaves["end"]).astype(np.int64)
+        n_start_before = np.searchsorted(np.sort(qstart), block_end, side="left")
+        n_end_before = np.searchsorted(np.sort(qend), block_start, side="right")
+        return n_start_before > n_end_before
+
+    def _raw(self, chrom_id:int, qstart:np.ndarray, qend:np.ndarray) -> Summaries:
+        leaves = self._chrom_leaves(self.index_offset, chrom_id)
+        leaves = leaves[self._needed(leaves, chrom_id, qstart, qend)]
+        parts = []
+        for data in self._read_blocks(leaves):
+            start, end, value = _decode_section(data)
+            if _SECTION_HEADER.unpack_from(data)[0] == chrom_id:
+                parts.append(Summaries.from_intervals(start, end, value.astype(np.float64)))
+        return Summaries.concat(parts)
+
+    def _zoom(self, level:int, chrom_id:int, qstart:np.ndarray, qend:np.ndarray) -> Summaries:
+        leaves = self._chrom_leaves(self.zoom_levels[level][2], chrom_id)
+        leaves = leaves[self._needed(leaves, chrom_id, qstart, qend)]
+        parts = []
+        for data in self._read_blocks(leaves):
+            records = np.frombuffer(data, dtype=ZOOM_DTYPE)
+            records = records[records["chrom"] == chrom_id]
+            parts.append(Summaries(records["start"], records["end"], records["valid"],
+                                   records["min"], records["max"], records["sum"]))
+        return Summaries.concat(parts)
+
+    def intervals(self, grange:GenomeRange) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Raw data intervals (start, end, value) overlap with a genome range.
+        """
+        empty = np.zeros(0, dtype=np.int64)
+        if grange.chrom not in self._chrom_ids:
+            return empty, empty, np.zeros(0, dtype=np.float32)
+        start = 0 if grange.start is None else grange.start
+        end = self.chromsizes[grange.chrom] if grange.start is None else \
+            (start + 1 if grange.end is None else grange.end)
+        chrom_id = self._chrom_ids[grange.chrom]
+        qs, qe = np.array([start]), np.array([end])
+        leaves = self._chrom_leaves(self.index_offset, chrom_id)
+        leaves = leaves[self._needed(leaves, chrom_id, qs, qe)]
+        starts, ends, values = [], [], []
+        for data in self._read_blocks(leaves):
+            if _SECTION_HEADER.unpack_from(data)[0] != chrom_id:
+                continue
+            s, e, v = _decode_section(data)
+            keep = (s < end) & (e > start)
+            starts.append(s[keep])
+            ends.append(e[keep])
+            values.append(v[keep])
+        if not starts:
+            return empty, empty, np.zeros(0, dtype=np.float32)
+        return np.concatenate(starts).astype(np.int64), np.concatenate(ends).astype(np.int64), np.concatenate(values)
+
+    def _choose_zoom(self, bin_size:np.ndarray) -> np.ndarray:
+        """
+        Zoom level of each query, the level with the largest reduction <= bin size / 2,
+        -1 for raw data.
+        """
+        level = np.full(bin_size.shape[0], -1)
+        best = np.zeros(bin_size.shape[0], dtype=np.int64)
+        for i, (reduction, _, _) in enumerate(self.zoom_levels):
+            better = (reduction <= bin_size // 2) & (reduction > best)
+            level[better] = i
+            best[better] = reduction
+        return level
+
+    def summarize(self,
+            ranges:Union[GenomeRange, GenomeRangeArray, Iterable[GenomeRange]],
+            stats:Iterable[str]=("mean",),
+            nbins:int=1,
+            exact:bool=False) -> Dict[str, np.ndarray]:
+        """
+        Summary statistics of many genome ranges.
+
+        Parameters
+        ----------
+        ranges : {GenomeRange, GenomeRangeArray, list of GenomeRange}
+            Query ranges, e.g. the `ranges` of BED batches.
+        stats : list of str
+            Statistics to compute, in {'mean', 'max', 'min', 'coverage', 'sum'}.
+            coverage is the fraction of bases with data.
+        nbins : int
+            Split each range into `nbins` equal bins.
+        exact : bool
+            Always use raw data. Otherwise zoom levels are used when the bins
+            are at least two times larger than their reduction level.
+
+        Return
+        ------
+        result : dict
+            Statistic name to array of shape (n_ranges,) if nbins == 1,
+            else (n_ranges, nbins). Statistics of bins without data are NaN
+            (coverage and sum are 0).
+        """
+        stats = list(stats)
+        for name in stats:
+            if name not in STATS:
+                raise ValueError(f"Unknown statistic: {name}, available: {STATS}")
+        if isinstance(ranges, GenomeRange):
+            ranges = [ranges]
+        if not isinstance(ranges, GenomeRangeArray):
+            ranges = GenomeRangeArray.from_granges(ranges)
+        n = len(ranges)
+        chrom_sizes = np.array([self.chromsizes.sizes.get(c, 0) for c in ranges.chroms] + [0], dtype=np.int64)
+        start = np.where(ranges.start == NONE_POS, 0, ranges.start)
+        end = np.where(ranges.start == NONE_POS, chrom_sizes[ranges.codes],
+                       np.where(ranges.end == NONE_POS, start + 1, ranges.end))
+        k = np.arange(nbins + 1)
+        edges = start[:, None] + (end - start)[:, None] * k[None, :] // nbins
+        qstart = edges[:, :-1].ravel()
+        qend = edges[:, 1:].ravel()
+        qcodes = np.repeat(ranges.codes, nbins)
+        levels = np.full(qstart.shape[0], -1) if exact else self._choose_zoom(qend - qstart)
+        result = {name: np.full(qstart.shape[0], 0.0 if name in ("coverage", "sum") else np.nan) for name in stats}
+        for code, chrom in enumerate(ranges.chroms):
+            if chrom not in self._chrom_ids:
+                continue
+            chrom_id = self._chrom_ids[chrom]
+            for level in np.unique(levels):
+                idx = np.flatnonzero((qcodes == code) & (levels == level))
+                idx = idx[np.argsort(qstart[idx], kind="stable")]
+                for i in range(0, idx.shape[0], QUERY_CHUNK):
+                    chunk = idx[i:i+QUERY_CHUNK]
+                    qs, qe = qstart[chunk], qend[chunk]
+                    if level < 0:
+                        summaries = self._raw(chrom_id, qs, qe)
+                    else:
+                        summaries = self._zoom(level, chrom_id, qs, qe)
+                    for name, values in summaries.summarize(qs, qe, stats).items():
+                        result[name][chunk] = values
+        shape = (n,) if nbins == 1 else (n, nbins)
+        return {name: values.reshape(shape) for name, values in result.items()}
+
+    def stats(self,
+            ranges:Union[GenomeRange, GenomeRangeArray, Iterable[GenomeRange]],
+            stat:str="mean",
+            nbins:int=1,
+            exact:bool=False) -> np.ndarray:
+        """
+        A summary statistic of many genome ranges, see `BigWigReader.summarize`.
+        """
+        return self.summarize(ranges, [stat], nbins=nbins, exact=exact)[stat]
+
+
+def _decode_section(data:bytes) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decode a data section to (start, end, value) arrays.
+    """
+    chrom_id, start, end, step, span, type_, _, count = _SECTION_HEADER.unpack_from(data)
+    body = data[_SECTION_HEADER.size:]
+    if type_ == SECTION_BEDGRAPH:
+        items = np.frombuffer(body, dtype=_BEDGRAPH_DTYPE, count=count)
+        return items["start"], items["end"], items["value"]
+    elif type_ == SECTION_VARSTEP:
+        items = np.frombuffer(body, dtype=_VARSTEP_DTYPE, count=count)
+        starts = items["start"].astype(np.int64)
+        return starts, starts + span, items["value"]
+    elif type_ == SECTION_FIXEDSTEP:
+        values = np.frombuffer(body, dtype="<f4", count=count)
+        starts = start + np.arange(count, dtype=np.int64) * step
+        return starts, starts + span, values
+    else:
+        raise IOError(f"Unknown bigWig section type: {type_}")
+
+
+DEFAULT_ITEMS_PER_SLOT = 1024
+DEFAULT_BLOCK_SIZE = 256
+DEFAULT_MAX_ZOOMS = 10
+ZOOM_FACTOR = 4
+_RECORD_FIELDS = ("start", "end", "valid", "min", "max", "sum", "sumsq")
+
+
+class _ZoomLevel(object):
+    """
+    Streaming summarization of one zoom level, records are spilled to a temporary file.
+    """
+    def __init__(self, reduction:int) -> None:
+        self.reduction = reduction
+        self.spill = tempfile.TemporaryFile()
+        self.count = 0
+        self.pending = None  # the last record, may be continued by the next batch
+
+    def _emit(self, records:np.ndarray) -> None:
+        if records.shape[0] > 0:
+            self.spill.write(records.tobytes())
+            self.count += records.shape[0]
+
+    def flush(self) -> None:
+        if self.pending is not None:
+            self._emit(self.pending)
+            self.pending = None
+
+    def add(self, chrom_id:int, chrom_size:int, start:np.ndarray, end:np.ndarray, value:np.ndarray) -> None:
+        """
+        Add sorted, non-overlapping intervals of a chromosome.
+        """
+        r = self.reduction
+        first_bin = start // r
+        n_bins = (end - 1) // r - first_bin + 1
+        item = np.repeat(np.arange(start.shape[0]), n_bins)
+        bins = first_bin[item] + np.arange(item.shape[0]) - np.repeat(np.cumsum(n_bins) - n_bins, n_bins)
+        overlap = np.minimum(end[item], (bins + 1) * r) - np.maximum(start[item], bins * r)
+        v = value[item].astype(np.float64)
+        bounds = np.flatnonzero(np.diff(bins, prepend=-1))
+        records = np.zeros(bounds.shape[0], dtype=ZOOM_DTYPE)
+        records["chrom"] = chrom_id
+        records["start"] = bins[bounds] * r
+        records["end"] = np.minimum((bins[bounds] + 1) * r, chrom_size)
+        records["valid"] = np.add.reduceat(overlap, bounds)
+        records["min"] = np.minimum.reduceat(v, bounds)
+        records["max"] = np.maximum.reduceat(v, bounds)
+        records["sum"] = np.add.reduceat(v * overlap, bounds)
+        records["sumsq"] = np.add.reduceat(v * v * overlap, bounds)
+        if self.pending is not None:
+            p = self.pending[0]
+            if p["chrom"] == chrom_id and p["start"] == records[0]["start"]:
+                first = records[0]
+                first["valid"] += p["valid"]
+                first["min"] = min(first["min"], p["min"])
+                first["max"] = max(first["max"], p["max"])
+                first["sum"] += p["sum"]
+                first["sumsq"] += p["sumsq"]
+            else:
+                self._emit(self.pending)
+        self._emit(records[:-1])
+        self.pending = records[-1:].copy()
+
+    def iter_records(self, chunk:int) -> Iterable[np.ndarray]:
+        self.spill.seek(0)
+        while True:
+            data = self.spill.read(chunk * ZOOM_DTYPE.itemsize)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype=ZOOM_DTYPE)
+
+
+def _write_cir_tree(f, leaves:List[tuple], block_size:int, items_per_slot:int, end_file_offset:int) -> None:
+    """
+    Write R-tree(cirTree) index at current position.
+    leaves : (start chrom, start, end chrom, end, offset, size) of each block, sorted.
+    """
+    index_offset = f.tell()
+    if leaves:
+        bounds = (leaves[0][0], leaves[0][1], leaves[-1][2], leaves[-1][3])
+    else:
+        bounds = (0, 0, 0, 0)
+    f.write(_CIR_TREE_HEADER.pack(CIR_TREE_MAGIC, block_size, len(leaves), *bounds,
+                                  end_file_offset, items_per_slot, 0))
+    # group items to nodes level by level, from bottom to top
+    levels = [[leaves[i:i+block_size] for i in range(0, len(leaves), block_size)] or [[]]]
+    while len(levels[-1]) > 1:
+        nodes = levels[-1]
+        levels.append([nodes[i:i+block_size] for i in range(0, len(nodes), block_size)])
+    levels.reverse()
+    # node offsets, from top to bottom
+    offsets = []
+    pos = index_offset + _CIR_TREE_HEADER.size
+    for depth, nodes in enumerate(levels):
+        item_size = _LEAF_DTYPE.itemsize if depth == len(levels) - 1 else _NODE_DTYPE.itemsize
+        level_offsets = []
+        for node in nodes:
+            level_offsets.append(pos)
+            pos += _NODE_HEADER.size + item_size * len(node)
+        offsets.append(level_offsets)
+
+    def node_bounds(node, depth):
+        if depth == len(levels) - 1:
+            return node[0][0], node[0][1], node[-1][2], node[-1][3]
+        first, last = node_bounds(node[0], depth + 1), node_bounds(node[-1], depth + 1)
+        return first[0], first[1], last[2], last[3]
+
+    for depth, nodes in enumerate(levels):
+        is_leaf = depth == len(levels) - 1
+        child_index = 0
+        for node in nodes:
+            f.write(_NODE_HEADER.pack(int(is_leaf), 0, len(node)))
+            if is_leaf:
+                f.write(np.array(node, dtype=_LEAF_DTYPE).tobytes() if node else b"")
+            else:
+                items = []
+                for child in node:
+                    items.append(node_bounds(child, depth + 1) + (offsets[depth + 1][child_index],))
+                    child_index += 1
+                f.write(np.array(items, dtype=_NODE_DTYPE).tobytes())
+
+
+def _write_chrom_tree(f, chroms:List[Tuple[str, int, int]]) -> None:
+    """
+    Write chromosome B+ tree with one leaf node, chroms: (name, id, size).
+    """
+    chroms = sorted(chroms, key=lambda c: c[0].encode())
+    key_size = max([len(c[0].encode()) for c in chroms] + [1])
+    f.write(_CHROM_TREE_HEADER.pack(CHROM_TREE_MAGIC, max(len(chroms), 1), key_size, 8, len(chroms), 0))
+    f.write(_NODE_HEADER.pack(1, 0, len(chroms)))
+    for name, chrom_id, size in chroms:
+        f.write(name.encode().ljust(key_size, b"\0") + struct.pack("<II", chrom_id, size))
+
+
+class BigWigWriter(object):
+    """
+    Streaming writer of bigWig file from sorted bedGraph data.
+
+    Data blocks are compressed and written as they come, zoom levels are
+    summarized batch by batch and spilled to temporary files, so the memory
+    usage does not grow with the input.
+
+    Parameters
+    ----------
+    path : str
+        Path to the output bigWig file.
+    chromsizes : `luckyegg.genome.ChromSizes`
+        Chromosome sizes of the genome.
+    items_per_slot : int
+        Number of items per data block.
+    block_size : int
+        Number of children per node of the R-tree index.
+    max_zooms : int
+        Max number of zoom levels.
+    reduction : int, optional
+        Bin size of the first zoom level, following levels are 4 times larger each,
+        default is 10 times the average item size of the first added intervals.
+    """
+    def __init__(self,
+            path:str,
+            chromsizes:ChromSizes,
+            items_per_slot:int=DEFAULT_ITEMS_PER_SLOT,
+            block_size:int=DEFAULT_BLOCK_SIZE,
+            max_zooms:int=DEFAULT_MAX_ZOOMS,
+            reduction:Optional[int]=None) -> None:
+        self.path = path
+        self.chromsizes = chromsizes
+        self.items_per_slot = items_per_slot
+        self.block_size = block_size
+        self.max_zooms = max_zooms
+        self.reduction = reduction
+        self._file = open(path, 'wb+')
+        self._chrom_ids = {}
+        self._leaves = []
+        self._zooms = None
+        self._carry = None  # items not filling a whole block
+        self._last = (None, -1)  # (chrom, end) of the last item
+        self._max_buf = 0
+        self._summary = [0, np.inf, -np.inf, 0.0, 0.0]
+        self._file.write(b"\0" * (_HEADER.size + _ZOOM_HEADER.size * max_zooms + _SUMMARY.size))
+        self.data_offset = self._file.tell()
+        self._file.write(struct.pack("<Q", 0))
+
+    def __enter__(self) -> 'BigWigWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _chrom_id(self, chrom:str) -> int:
+        if chrom not in self._chrom_ids:
+            if chrom not in self.chromsizes:
+                raise ValueError(f"Chromosome {chrom} not in chromsizes.")
+            self._chrom_ids[chrom] = len(self._chrom_ids)
+        return self._chrom_ids[chrom]
+
+    def _init_zooms(self, start:np.ndarray, end:np.ndarray) -> None:
+        reduction = self.reduction or max(int(np.mean(end - start)), 1) * 10
+        self._zooms = [_ZoomLevel(reduction * ZOOM_FACTOR ** i) for i in range(self.max_zooms)]
+
+    def _write_blocks(self, chrom_id:int, start:np.ndarray, end:np.ndarray, value:np.ndarray) -> None:
+        items = np.empty(start.shape[0], dtype=_BEDGRAPH_DTYPE)
+        items["start"] = start
+        items["end"] = end
+        items["value"] = value
+        for i in range(0, items.shape[0], self.items_per_slot):
+            block = items[i:i+self.items_per_slot]
+            s, e = int(block["start"][0]), int(block["end"][-1])
+            data = _SECTION_HEADER.pack(chrom_id, s, e, 0, 0, SECTION_BEDGRAPH, 0, block.shape[0]) + block.tobytes()
+            self._max_buf = max(self._max_buf, len(data))
+            compressed = zlib.compress(data)
+            offset = self._file.tell()
+            self._file.write(compressed)
+            self._leaves.append((chrom_id, s, chrom_id, e, offset, len(compressed)))
+
+    def add_intervals(self, chrom:str, start:np.ndarray, end:np.ndarray, value:np.ndarray) -> None:
+        """
+        Add sorted, non-overlapping intervals of a chromosome.
+        """
+        start = np.asarray(start, dtype=np.int64)
+        end = np.asarray(end, dtype=np.int64)
+        value = np.asarray(value, dtype=np.float32)
+        if start.shape[0] == 0:
+            return
+        chrom_size = self.chromsizes[chrom]
+        last_chrom, last_end = self._last
+        if chrom != last_chrom:
+            if chrom in self._chrom_ids:
+                raise ValueError(f"Input is not sorted: chromosome {chrom} is not contiguous.")
+            self._flush_carry()
+            last_end = 0
+        if np.any(end <= start) or start[0] < last_end or np.any(start[1:] < end[:-1]):
+            raise ValueError(f"Input intervals on {chrom} must be sorted, non-empty and non-overlapping.")
+        if end[-1] > chrom_size:
+            raise ValueError(f"Interval end {end[-1]} beyond the size of {chrom}: {chrom_size}.")
+        chrom_id = self._chrom_id(chrom)
+        self._last = (chrom, int(end[-1]))
+        if self._zooms is None:
+            self._init_zooms(start, end)
+        for zoom in self._zooms:
+            if zoom.pending is not None and zoom.pending[0]["chrom"] != chrom_id:
+                zoom.flush()
+            zoom.add(chrom_id, chrom_size, start, end, value)
+        length = end - start
+        v = value.astype(np.float64)
+        summary = self._summary
+        summary[0] += int(length.sum())
+        summary[1] = min(summary[1], float(v.min()))
+        summary[2] = max(summary[2], float(v.max()))
+        summary[3] += float(np.sum(v * length))
+        summary[4] += float(np.sum(v * v * length))
+        if self._carry is not None:
+            c_start, c_end, c_value = self._carry
+            start, end, value = np.concatenate([c_start, start]), np.concatenate([c_end, end]), np.concatenate([c_value, value])
+        n_full = start.shape[0] // self.items_per_slot * self.items_per_slot
+        self._write_blocks(chrom_id, start[:n_full], end[:n_full], value[:n_full])
+        self._carry = (start[n_full:], end[n_full:], value[n_full:]) if n_full < start.shape[0] else None
+
+    def _flush_carry(self) -> None:
+        if self._carry is not None:
+            self._write_blocks(self._chrom_ids[self._last[0]], *self._carry)
+            self._carry = None
+
+    def add_batch(self, batch) -> None:
+        """
+        Add a sorted `luckyegg.io.bed.BEDBatch` of bedGraph records.
+        """
+        ranges = batch.ranges
+        value = batch["value"]
+        if value.dtype.kind not in "iuf":
+            raise ValueError("The 'value' column of bedGraph batch must be numeric.")
+        bounds = np.flatnonzero(np.diff(ranges.codes, prepend=-1))
+        bounds = np.append(bounds, len(ranges))
+        for b0, b1 in zip(bounds[:-1], bounds[1:]):
+            chrom = ranges.chroms[ranges.codes[b0]]
+            self.add_intervals(chrom, ranges.start[b0:b1], ranges.end[b0:b1], value[b0:b1])
+
+    def add_records(self, records:Iterable) -> None:
+        """
+        Add sorted bedGraph records(`luckyegg.io.bed.BedGraph`).
+        """
+        chrom, starts, ends, values = None, [], [], []
+        for r in records:
+            if r.chrom != chrom:
+                if starts:
+                    self.add_intervals(chrom, starts, ends, values)
+                chrom, starts, ends, values = r.chrom, [], [], []
+            starts.append(r.start)
+            ends.append(r.end)
+            values.append(float(r.value))
+        if starts:
+            self.add_intervals(chrom, starts, ends, values)
+
+    def _write_zooms(self) -> List[Tuple[int, int, int]]:
+        headers = []
+        last_count = None
+        for zoom in self._zooms or []:
+            zoom.flush()
+            if zoom.count == 0 or (last_count is not None and zoom.count >= last_count):
+                break
+            last_count = zoom.count
+            data_offset = self._file.tell()
+            self._file.write(struct.pack("<I", zoom.count))
+            leaves = []
+            for records in zoom.iter_records(self.items_per_slot * 64):
+                bounds = np.flatnonzero(np.diff(records["chrom"].astype(np.int64), prepend=-1))
+                bounds = np.append(bounds, records.shape[0])
+                for b0, b1 in zip(bounds[:-1], bounds[1:]):
+                    for i in range(b0, b1, self.items_per_slot):
+                        block = records[i:min(i + self.items_per_slot, b1)]
+                        data = block.tobytes()
+                        self._max_buf = max(self._max_buf, len(data))
+                        compressed = zlib.compress(data)
+                        offset = self._file.tell()
+                        self._file.write(compressed)
+                        chrom_id = int(block["chrom"][0])
+                        leaves.append((chrom_id, int(block["start"][0]), chrom_id, int(block["end"][-1]),
+                                       offset, len(compressed)))
+            index_offset = self._file.tell()
+            _write_cir_tree(self._file, leaves, self.block_size, self.items_per_slot, index_offset)
+            headers.append((zoom.reduction, 0, data_offset, index_offset))
+        return headers
+
+    def close(self) -> None:
+        """
+        Write the index, zoom levels and header.
+        """
+        if self._file is None:
+            return
+        f = self._file
+        self._flush_carry()
+        full_index_offset = f.tell()
+        _write_cir_tree(f, self._leaves, self.block_size, self.items_per_slot, full_index_offset)
+        zoom_headers = self._write_zooms()
+        chrom_tree_offset = f.tell()
+        chroms = [(name, self._chrom_id(name), size) for name, size in self.chromsizes.sizes.items()]
+        _write_chrom_tree(f, chroms)
+        summary_offset = _HEADER.size + _ZOOM_HEADER.size * self.max_zooms
+        f.seek(0)
+        f.write(_HEADER.pack(BIGWIG_MAGIC, 4, len(zoom_headers), chrom_tree_offset, self.data_offset,
+                             full_index_offset, 0, 0, 0, summary_offset, self._max_buf, 0))
+        for header in zoom_headers:
+            f.write(_ZOOM_HEADER.pack(*header))
+        f.seek(summary_offset)
+        covered, min_, max_, sum_, sumsq = self._summary
+        if covered == 0:
+            min_ = max_ = 0.0
+        f.write(_SUMMARY.pack(covered, min_, max_, sum_, sumsq))
+        f.seek(self.data_offset)
+        f.write(struct.pack("<Q", len(self._leaves)))
+        f.close()
+        self._file = None
+        for zoom in self._zooms or []:
+            zoom.spill.close()
+
+
+def write_bigwig(path:str, source:Iterable, chromsizes:ChromSizes, **kwargs) -> None:
+    """
+    Write sorted bedGraph records or batches to a bigWig file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the output bigWig file.
+    source : iterable
+        `luckyegg.io.bed.BedGraph` records or `luckyegg.io.bed.BEDBatch` objects,
+        e.g. the output of `read_bed` or `read_bed_batches`.
+    chromsizes : `luckyegg.genome.ChromSizes`
+        Chromosome sizes of the genome.
+    **kwargs
+        Other parameters of `BigWigWriter`.
+    """
+    with BigWigWriter(path, chromsizes, **kwargs) as writer:
+        records = []
+        for item in source:
+            if hasattr(item, "ranges"):
+                if records:
+                    writer.add_records(records)
+                    records = []
+                writer.add_batch(item)
+            else:
+                records.append(item)
+                if len(records) >= DEFAULT_ITEMS_PER_SLOT * 64:
+                    writer.add_records(records)
+                    records = []
+        writer.add_records(records)
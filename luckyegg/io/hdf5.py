@@ -0,0 +1,238 @@
+"""
+HDF5 store of per-base or binned genomic signal tracks.
+
+Each track is a group in the file, with one chunked, compressed dataset per
+chromosome, so reading a region only touch the chunks overlap with it:
+
+    /<track name>/<chrom>    1d dataset, length is the chromosome size(in bins)
+"""
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import h5py
+
+from luckyegg.genome import GenomeRange, GenomeBinRange, GenomeRangeArray, GenomeBinRangeArray, ChromSizes, NONE_POS
+
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+DEFAULT_COMPRESSION = "gzip"
+DEFAULT_COMPRESSION_LEVEL = 4
+WRITE_BUFFER = 1 << 22  # max elements of a slab written by `Track.write_intervals`(block size)
+
+
+class Track(object):
+    """
+    A signal track in `TrackStore`.
+
+    Attributes
+    ----------
+    name : str
+        Name of the track.
+    binsize : int
+        Bin size of the track, 1 for per-base track.
+    chromsizes : `luckyegg.genome.ChromSizes`
+        Chromosome sizes of the genome, unit in 'bp'.
+    """
+    def __init__(self, group:h5py.Group) -> None:
+        self.group = group
+        self.name = group.name.lstrip("/")
+        self.binsize = int(group.attrs["binsize"])
+        chroms = [c.decode() if isinstance(c, bytes) else c for c in group.attrs["chroms"]]
+        self.chromsizes = ChromSizes(dict(zip(chroms, group.attrs["lengths"].tolist())))
+
+    def __repr__(self) -> str:
+        return f"Track({self.name!r}, binsize={self.binsize}, dtype={self.dtype})"
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(self.group.attrs["dtype"])
+
+    @property
+    def chroms(self) -> List[str]:
+        return list(self.chromsizes.sizes)
+
+    def extent(self, grange:GenomeRange) -> Tuple[str, int, int]:
+        """
+        (chrom, start, end) index range of the dataset for a genome range,
+        GenomeBinRange is treated as in unit of bins, clipped to the chromosome.
+        """
+        if grange.chrom not in self.group:
+            raise ValueError(f"Chromosome {grange.chrom} not in track {self.name}.")
+        n = self.group[grange.chrom].shape[0]
+        if grange.range_type == "chromosome":
+            return grange.chrom, 0, n
+        if isinstance(grange, GenomeBinRange) or self.binsize == 1:
+            start, end = grange.start, grange.end
+        else:
+            start = grange.start // self.binsize
+            end = None if grange.end is None else -(-grange.end // self.binsize)
+        end = start + 1 if end is None else max(end, start + 1)
+        start = min(max(start, 0), n)
+        end = min(max(end, start), n)
+        return grange.chrom, start, end
+
+    def fetch(self, grange:Union[GenomeRange, str]) -> np.ndarray:
+        """
+        Read values of a genome range, only the chunks overlap with it are loaded.
+        """
+        if isinstance(grange, str):
+            grange = GenomeRange.from_str(grange)
+        chrom, start, end = self.extent(grange)
+        return self.group[chrom][start:end]
+
+    def fetch_many(self, granges:Iterable[GenomeRange]) -> List[np.ndarray]:
+        """
+        Read values of many genome ranges.
+        """
+        return [self.fetch(g) for g in granges]
+
+    def write(self, grange:GenomeRange, values:Union[np.ndarray, float]) -> None:
+        """
+        Write values to a genome range, scalar is broadcast to the whole range.
+        """
+        chrom, start, end = self.extent(grange)
+        values = np.asarray(values, dtype=self.dtype)
+        if values.ndim > 0 and values.shape[0] != end - start:
+            raise ValueError(f"Expect {end - start} values for {grange}, got {values.shape[0]}.")
+        self.group[chrom][start:end] = values
+
+    def write_intervals(self, ranges:GenomeRangeArray, values:np.ndarray) -> None:
+        """
+        Set each interval of `ranges` to the corresponding value, like a bedGraph.
+        Ranges are converted to the unit of the track the same way as `fetch`,
+        intervals are cut at multiples of `WRITE_BUFFER`, and the pieces in each block are
+        written in one slab, so a slab has at most `WRITE_BUFFER` elements.
+        """
+        values = np.asarray(values, dtype=self.dtype)
+        if values.shape[0] != len(ranges):
+            raise ValueError(f"Length mismatch: {len(ranges)} ranges, {values.shape[0]} values.")
+        if np.any((ranges.start == NONE_POS) | (ranges.end == NONE_POS)):
+            raise ValueError("Ranges must have start and end.")
+        for code in np.unique(ranges.codes):
+            chrom = ranges.chroms[code]
+            if chrom not in self.group:
+                raise ValueError(f"Chromosome {chrom} not in track {self.name}.")
+            dataset = self.group[chrom]
+            idx = np.flatnonzero(ranges.codes == code)
+            start, end = ranges.start[idx], ranges.end[idx]
+            if self.binsize > 1 and not isinstance(ranges, GenomeBinRangeArray):
+                start, end = start // self.binsize, -(-end // self.binsize)
+            start = np.clip(start, 0, dataset.shape[0])
+            end = np.clip(np.maximum(end, start + 1), start, dataset.shape[0])
+            order = np.argsort(start, kind="stable")
+            start, end, vals = start[order], end[order], values[idx][order]
+            # cut intervals at multiples of WRITE_BUFFER, the pieces of a block are written in one slab
+            first = start // WRITE_BUFFER
+            n_pieces = np.where(end > start, (end - 1) // WRITE_BUFFER - first + 1, 0)
+            rows = np.repeat(np.arange(start.shape[0]), n_pieces)
+            block = first[rows] + np.arange(rows.shape[0]) - np.repeat(np.cumsum(n_pieces) - n_pieces, n_pieces)
+            order = np.argsort(block, kind="stable")  # keep the start order within a block
+            rows, block = rows[order], block[order]
+            p_start = np.maximum(start[rows], block * WRITE_BUFFER)
+            p_end = np.minimum(end[rows], (block + 1) * WRITE_BUFFER)
+            bounds = np.flatnonzero(np.diff(block)) + 1
+            for i, j in zip([0] + bounds.tolist(), bounds.tolist() + [rows.shape[0]]):
+                lo, hi = int(p_start[i:j].min()), int(p_end[i:j].max())
+                slab = dataset[lo:hi]
+                lengths = p_end[i:j] - p_start[i:j]
+                pos = np.repeat(p_start[i:j] - lo - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+                slab[pos] = np.repeat(vals[rows[i:j]], lengths)
+                dataset[lo:hi] = slab
+
+
+class TrackStore(object):
+    """
+    HDF5 file contains many genomic signal tracks.
+
+    Parameters
+    ----------
+    path : str
+        Path to the HDF5 file.
+    mode : str
+        File mode, see `h5py.File`.
+    chunk_size : int
+        Number of elements per chunk of new tracks.
+    compression : str, optional
+        Compression filter of new tracks, None for no compression.
+    compression_opts : int, optional
+        Compression level.
+    """
+    def __init__(self,
+            path:str,
+            mode:str='a',
+            chunk_size:int=DEFAULT_CHUNK_SIZE,
+            compression:Optional[str]=DEFAULT_COMPRESSION,
+            compression_opts:Optional[int]=DEFAULT_COMPRESSION_LEVEL) -> None:
+        self.path = path
+        self.file = h5py.File(path, mode)
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.compression_opts = compression_opts if compression == "gzip" else None
+
+    def __enter__(self) -> 'TrackStore':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.file.close()
+
+    @property
+    def tracks(self) -> List[str]:
+        return list(self.file.keys())
+
+    def __contains__(self, name:str) -> bool:
+        return name in self.file
+
+    def __getitem__(self, name:str) -> Track:
+        if name not in self.file:
+            raise KeyError(f"Track {name} not in {self.path}.")
+        return Track(self.file[name])
+
+    def __delitem__(self, name:str) -> None:
+        del self.file[name]
+
+    def create_track(self,
+            name:str,
+            chromsizes:ChromSizes,
+            binsize:int=1,
+            dtype:Union[str, np.dtype]="float32",
+            fill_value:Union[float, int]=np.nan) -> Track:
+        """
+        Create a track, datasets are sized by the chromosome sizes
+        and filled with `fill_value` lazily.
+
+        Parameters
+        ----------
+        name : str
+            Name of the track.
+        chromsizes : `luckyegg.genome.ChromSizes`
+            Chromosome sizes of the genome, normally unit in 'bp'.
+            Sizes with unit 'bin' are taken as numbers of bins of `binsize`,
+            and converted to 'bp'(so the last bin of each chromosome is full).
+        binsize : int
+            Bin size of the track, 1 for per-base track.
+        dtype : str or np.dtype
+            Data type of values.
+        fill_value : scalar
+            Value of not written positions.
+        """
+        if name in self.file:
+            raise ValueError(f"Track {name} already exists in {self.path}.")
+        dtype = np.dtype(dtype)
+        if dtype.kind in "iub" and isinstance(fill_value, float) and np.isnan(fill_value):
+            fill_value = 0
+        if chromsizes.unit == "bin":
+            chromsizes = chromsizes.to_bp(binsize)
+        group = self.file.create_group(name)
+        group.attrs["binsize"] = binsize
+        group.attrs["dtype"] = dtype.str
+        group.attrs["chroms"] = list(chromsizes.sizes)
+        group.attrs["lengths"] = np.array(list(chromsizes.sizes.values()), dtype=np.int64)
+        for chrom, n in chromsizes.to_bin(binsize).sizes.items():
+            group.create_dataset(chrom, shape=(n,), dtype=dtype, fillvalue=fill_value,
+                                 chunks=(max(min(self.chunk_size, n), 1),),
+                                 compression=self.compression, compression_opts=self.compression_opts,
+                                 shuffle=self.compression is not None)
+        return Track(group)
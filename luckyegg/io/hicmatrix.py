@@ -1,22 +1,111 @@
-from luckyegg.genome import GenomeRange
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple, Union, Iterable, Iterator
+
+import numpy as np
+import scipy.sparse as sp
+
+from luckyegg.genome import GenomeRange, GenomeBinRange, ChromSizes, GenomeRangeArray, NONE_POS
+from luckyegg.instrument import inc, timer
 
 from cooler.api import Cooler
+from cooler.fileops import list_coolers
+
+
+DEFAULT_CACHE_BYTES = 256 * 1024**2
+DEFAULT_TILE_SIZE = 256
+DEFAULT_SPARSE_CHUNK = 4096
+PILEUP_CHUNK = 4096
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions", "tiles", "nbytes", "max_bytes"])
+DiagonalWindow = namedtuple("DiagonalWindow", ["range", "matrix"])
+ResolutionMatrix = namedtuple("ResolutionMatrix", ["resolution", "range1", "range2", "matrix"])
+
+
+class TileCache(object):
+    """
+    Thread safe LRU cache of matrix tiles, with a memory budget.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Memory budget of the cached tiles.
+    """
+    def __init__(self, max_bytes:int=DEFAULT_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key) -> Optional[np.ndarray]:
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._tiles.move_to_end(key)
+            return tile
+
+    def put(self, key, tile:np.ndarray) -> None:
+        if tile.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._tiles:
+                return
+            self._tiles[key] = tile
+            self.nbytes += tile.nbytes
+            while self.nbytes > self.max_bytes:
+                _, old = self._tiles.popitem(last=False)
+                self.nbytes -= old.nbytes
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tiles.clear()
+            self.nbytes = 0
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.evictions, len(self._tiles), self.nbytes, self.max_bytes)
 
 
 class MatrixSelector(object):
     """
     Selector for fetch the matrix from cool file.
 
+    Matrix are read in square tiles, which are kept in a LRU cache,
+    so overlapping windows don't read and balance the same data again.
+
     Parameters
     ----------
     cool : `cooler.api.Cooler`
         cool object.
     balance : bool
         balance matrix or not.
+    cache_size : int
+        Memory budget(bytes) of the tile cache.
+    tile_size : int
+        Number of bins of each tile's side.
     """
-    def __init__(self, cool:Cooler, balance:bool=True) -> None:
+    def __init__(self,
+            cool:Cooler,
+            balance:bool=True,
+            cache_size:int=DEFAULT_CACHE_BYTES,
+            tile_size:int=DEFAULT_TILE_SIZE) -> None:
         self.cool = cool
         self.balance = balance
+        self.tile_size = tile_size
+        self.cache = TileCache(cache_size)
+        self.genome = ChromSizes(self.chromsizes)
+        self._chrom_bins = self.genome.to_bin(self.binsize).sizes
+        offsets = self.genome.offsets(self.binsize)
+        self._chrom_offsets = dict(zip(self.genome.chroms, offsets[:-1].tolist()))
+        self.n_bins = int(offsets[-1])
+        self._count_dtype = cool.pixels().dtypes["count"]
 
     @property
     def chromsizes(self):
@@ -26,3 +115,549 @@ class MatrixSelector(object):
     def binsize(self):
         return self.cool.binsize
 
+    def chrom_offset(self, chrom:str) -> int:
+        """
+        Global bin index of the first bin of a chromosome.
+        """
+        if chrom not in self._chrom_offsets:
+            raise ValueError(f"Chromosome {chrom} not in the cool file.")
+        return self._chrom_offsets[chrom]
+
+    def chrom_bins(self, chrom:str) -> int:
+        """
+        Number of bins of a chromosome.
+        """
+        if chrom not in self._chrom_bins:
+            raise ValueError(f"Chromosome {chrom} not in the cool file.")
+        return self._chrom_bins[chrom]
+
+    def extent(self, grange:GenomeRange) -> Tuple[int, int]:
+        """
+        Global bin index range [start, end) of a genome range.
+        GenomeBinRange is treated as in unit of bins.
+        """
+        if grange.chrom not in self._chrom_offsets:
+            raise ValueError(f"Chromosome {grange.chrom} not in the cool file.")
+        offset = self._chrom_offsets[grange.chrom]
+        n_bins = self._chrom_bins[grange.chrom]
+        if grange.range_type == "chromosome":
+            return offset, offset + n_bins
+        if not isinstance(grange, GenomeBinRange):
+            grange = grange.to_bin(self.binsize)
+        start = grange.start
+        end = start + 1 if grange.end is None else max(grange.end, start + 1)
+        start = min(max(start, 0), n_bins)
+        end = min(max(end, start), n_bins)
+        return offset + start, offset + end
+
+    def _read(self, rows:Tuple[int, int], cols:Tuple[int, int], balance) -> np.ndarray:
+        return self.cool.matrix(balance=balance, sparse=False)[rows[0]:rows[1], cols[0]:cols[1]]
+
+    def _tile(self, ti:int, tj:int, balance) -> np.ndarray:
+        """
+        Get a tile, tiles below the diagonal are the transpose of the upper ones.
+        """
+        if ti > tj:
+            return self._tile(tj, ti, balance).T
+        key = (balance, ti, tj)
+        tile = self.cache.get(key)
+        if tile is None:
+            inc("hicmatrix.tile_misses")
+            size = self.tile_size
+            rows = (ti * size, min((ti + 1) * size, self.n_bins))
+            cols = (tj * size, min((tj + 1) * size, self.n_bins))
+            # cooler balances while reading, balanced and raw reads are timed apart
+            with timer("hicmatrix.read_balanced_seconds" if balance else "hicmatrix.read_seconds"):
+                tile = self._read(rows, cols, balance)
+            inc("hicmatrix.bytes", tile.nbytes)
+            tile.flags.writeable = False
+            self.cache.put(key, tile)
+        else:
+            inc("hicmatrix.tile_hits")
+        return tile
+
+    def fetch(self,
+            grange1:GenomeRange,
+            grange2:Optional[GenomeRange]=None,
+            balance:Optional[Union[bool, str]]=None) -> np.ndarray:
+        """
+        Fetch the dense matrix of grange1(rows) x grange2(columns).
+
+        Parameters
+        ----------
+        grange1 : `luckyegg.genome.GenomeRange`
+            Genome range of rows, GenomeBinRange is in unit of bins.
+        grange2 : `luckyegg.genome.GenomeRange`, optional
+            Genome range of columns, default is the same as grange1.
+        balance : {bool, str}, optional
+            balance matrix or not, default is self.balance.
+        """
+        if grange2 is None:
+            grange2 = grange1
+        if balance is None:
+            balance = self.balance
+        with timer("hicmatrix.fetch_seconds"):
+            r0, r1 = self.extent(grange1)
+            c0, c1 = self.extent(grange2)
+            dtype = np.float64 if balance else self._count_dtype
+            mat = np.zeros((r1 - r0, c1 - c0), dtype=dtype)
+            size = self.tile_size
+            for ti in range(r0 // size, (r1 - 1) // size + 1 if r1 > r0 else r0 // size):
+                tr0 = ti * size
+                rs, re = max(r0, tr0), min(r1, tr0 + size)
+                for tj in range(c0 // size, (c1 - 1) // size + 1 if c1 > c0 else c0 // size):
+                    tc0 = tj * size
+                    cs, ce = max(c0, tc0), min(c1, tc0 + size)
+                    tile = self._tile(ti, tj, balance)
+                    mat[rs - r0:re - r0, cs - c0:ce - c0] = tile[rs - tr0:re - tr0, cs - tc0:ce - tc0]
+        return mat
+
+    def weights(self, extent:Tuple[int, int], balance:Union[bool, str]=True) -> np.ndarray:
+        """
+        Balancing weights of the bins in a global bin index range [start, end).
+        """
+        column = "weight" if balance is True else balance
+        return self.cool.bins()[column][extent[0]:extent[1]].values
+
+    def _read_pixels(self, rows:Tuple[int, int], cols:Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        with timer("hicmatrix.read_seconds"):
+            mat = self.cool.matrix(balance=False, sparse=True)[rows[0]:rows[1], cols[0]:cols[1]]
+        inc("hicmatrix.pixels", mat.nnz)
+        return mat.row + rows[0], mat.col + cols[0], mat.data
+
+    def fetch_sparse(self,
+            grange1:GenomeRange,
+            grange2:Optional[GenomeRange]=None,
+            balance:Optional[Union[bool, str]]=None,
+            format:str="coo",
+            max_dist:Optional[int]=None,
+            chunk_bins:int=DEFAULT_SPARSE_CHUNK) -> Union[sp.coo_matrix, sp.csr_matrix]:
+        """
+        Fetch the sparse matrix of grange1(rows) x grange2(columns),
+        balancing weights are applied to the nonzero values only,
+        so bins with NaN weight give NaN values like `cooler.Cooler.matrix`.
+
+        Parameters
+        ----------
+        grange1 : `luckyegg.genome.GenomeRange`
+            Genome range of rows, GenomeBinRange is in unit of bins.
+        grange2 : `luckyegg.genome.GenomeRange`, optional
+            Genome range of columns, default is the same as grange1.
+        balance : {bool, str}, optional
+            balance matrix or not, default is self.balance.
+        format : {'coo', 'csr'}
+            Format of the result.
+        max_dist : int, optional
+            Only keep the diagonal band, pixels which more than
+            `max_dist` bins away from the diagonal are dropped.
+        chunk_bins : int
+            Number of rows read at a time when `max_dist` is given.
+        """
+        if grange2 is None:
+            grange2 = grange1
+        if balance is None:
+            balance = self.balance
+        if format not in ("coo", "csr"):
+            raise ValueError(f"Unknown sparse format: {format}")
+        r0, r1 = self.extent(grange1)
+        c0, c1 = self.extent(grange2)
+        if max_dist is None:
+            rows, cols, data = self._read_pixels((r0, r1), (c0, c1))
+        else:
+            parts = []
+            for i in range(r0, r1, chunk_bins):
+                i1 = min(i + chunk_bins, r1)
+                j0, j1 = max(c0, i - max_dist), min(c1, i1 + max_dist)
+                if j0 >= j1:
+                    continue
+                row, col, val = self._read_pixels((i, i1), (j0, j1))
+                in_band = np.abs(row - col) <= max_dist
+                parts.append((row[in_band], col[in_band], val[in_band]))
+            if parts:
+                rows, cols, data = (np.concatenate(p) for p in zip(*parts))
+            else:
+                rows = cols = np.zeros(0, dtype=np.int64)
+                data = np.zeros(0, dtype=self._count_dtype)
+        if balance:
+            with timer("hicmatrix.balance_seconds"):
+                w1 = self.weights((r0, r1), balance)
+                w2 = self.weights((c0, c1), balance)
+                data = data * w1[rows - r0] * w2[cols - c0]
+        mat = sp.coo_matrix((data, (rows - r0, cols - c0)), shape=(r1 - r0, c1 - c0))
+        return mat.tocsr() if format == "csr" else mat
+
+    def _read_band(self, chrom:str, start:int, end:int, depth:int, balance) -> np.ndarray:
+        """
+        Read rows [start, end) of a chromosome's diagonal band in diagonal format:
+        band[i, k] is the value of (start + i, start + i + k - depth), NaN if out of the chromosome.
+        """
+        n_bins = self._chrom_bins[chrom]
+        offset = self._chrom_offsets[chrom]
+        width = 2 * depth + 1
+        band = np.zeros((end - start, width))
+        c0, c1 = max(start - depth, 0), min(end + depth, n_bins)
+        mat = self.fetch_sparse(GenomeBinRange(chrom, start, end), GenomeBinRange(chrom, c0, c1),
+                                balance=False, max_dist=depth)
+        band[mat.row, mat.col + c0 - (mat.row + start) + depth] = mat.data
+        cols = np.arange(start, end)[:, None] + np.arange(-depth, depth + 1)[None, :]
+        outside = (cols < 0) | (cols >= n_bins)
+        if balance:
+            with timer("hicmatrix.balance_seconds"):
+                w = self.weights((offset + c0, offset + c1), balance)
+                w_rows = w[start - c0:end - c0]
+                w_cols = w[np.clip(cols - c0, 0, c1 - c0 - 1)]
+                band *= w_rows[:, None] * w_cols
+        band[outside] = np.nan
+        return band
+
+    def iter_diagonal(self,
+            chrom:str,
+            window:int,
+            step:int,
+            depth:int,
+            balance:Optional[Union[bool, str]]=None,
+            prefetch:bool=True) -> Iterator[DiagonalWindow]:
+        """
+        Iterate over overlapping windows along a chromosome's diagonal.
+
+        Only the band within `depth` bins of the diagonal is read, rows shared
+        by consecutive windows are kept instead of read again, and the rows of
+        the next window are read in a background thread while the current
+        window is being processed.
+
+        Parameters
+        ----------
+        chrom : str
+            Chromosome name.
+        window : int
+            Size(number of bins) of the windows. If the windows stop before the
+            chromosome's end, one more window starts a step later(if still within
+            the chromosome) and is clipped to the end.
+        step : int
+            Number of bins between the start of consecutive windows,
+            bins between windows are skipped if it's larger than `window`.
+        depth : int
+            Max distance(number of bins) from the diagonal to read.
+        balance : {bool, str}, optional
+            balance matrix or not, default is self.balance.
+        prefetch : bool
+            Read ahead in a background thread or not.
+
+        Yields
+        ------
+        window : DiagonalWindow
+            (range, matrix), range is the GenomeBinRange of the window,
+            matrix is the dense window, cells beyond `depth` are NaN.
+        """
+        if balance is None:
+            balance = self.balance
+        if window <= 0 or step <= 0 or depth < 0:
+            raise ValueError("window and step must > 0, depth must >= 0.")
+        if chrom not in self._chrom_bins:
+            raise ValueError(f"Chromosome {chrom} not in the cool file.")
+        n_bins = self._chrom_bins[chrom]
+        window = min(window, n_bins)
+        starts = list(range(0, n_bins - window + 1, step))
+        if starts[-1] + window < n_bins and starts[-1] + step < n_bins:  # next window, clipped to the end
+            starts.append(starts[-1] + step)
+        # rows need to read before each window
+        reads = []
+        hi = 0
+        for w0 in starts:
+            w1 = min(w0 + window, n_bins)
+            reads.append((max(hi, w0), w1))
+            hi = max(hi, w1)
+        a = np.arange(window)
+        k = a[None, :] - a[:, None] + depth
+        in_band = (k >= 0) & (k <= 2 * depth)
+        k = np.clip(k, 0, 2 * depth)
+
+        def read(i):
+            r0, r1 = reads[i]
+            return r0, self._read_band(chrom, r0, r1, depth, balance)
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            next_read = executor.submit(read, 0) if executor else None
+            buffer = np.zeros((0, 2 * depth + 1))
+            buffer_start = 0
+            for i, w0 in enumerate(starts):
+                r0, rows = next_read.result() if executor else read(i)
+                if executor and i + 1 < len(starts):
+                    next_read = executor.submit(read, i + 1)
+                # drop rows before the window, append the new rows
+                keep = buffer[max(w0 - buffer_start, 0):r0 - buffer_start]
+                buffer = np.concatenate([keep, rows])
+                buffer_start = w0
+                m = min(window, n_bins - w0)
+                matrix = buffer[a[:m, None], k[:m, :m]]
+                matrix[~in_band[:m, :m]] = np.nan
+                yield DiagonalWindow(GenomeBinRange(chrom, w0, w0 + m), matrix)
+        finally:
+            if executor:
+                executor.shutdown(wait=True)
+
+    def cache_info(self) -> CacheInfo:
+        """
+        Statistics of the tile cache.
+        """
+        return self.cache.info()
+
+
+class MultiResSelector(object):
+    """
+    Selector for multi-resolution(.mcool) file, fetch each request from
+    the coarsest resolution which still give enough pixels.
+    Selectors(and their tile caches) of each resolution are kept open and reused.
+
+    Parameters
+    ----------
+    path : str
+        Path to the .mcool file.
+    balance : bool
+        balance matrix or not.
+    cache_size : int
+        Memory budget(bytes) of the tile cache of each resolution.
+    """
+    def __init__(self, path:str, balance:bool=True, cache_size:int=DEFAULT_CACHE_BYTES) -> None:
+        self.path = path
+        self.balance = balance
+        self.cache_size = cache_size
+        self._uris = {}
+        for group in list_coolers(path):
+            cool = Cooler(f"{path}::{group}")
+            self._uris[cool.binsize] = cool.uri
+        if not self._uris:
+            raise IOError(f"No cooler found in {path}.")
+        self.resolutions = sorted(self._uris)
+        self._selectors = {}
+        self._lock = threading.Lock()
+
+    def selector(self, resolution:int) -> MatrixSelector:
+        """
+        Get the MatrixSelector of a resolution.
+        """
+        if resolution not in self._uris:
+            raise ValueError(f"Resolution {resolution} not in {self.path}, available: {self.resolutions}")
+        with self._lock:
+            if resolution not in self._selectors:
+                cool = Cooler(self._uris[resolution])
+                self._selectors[resolution] = MatrixSelector(cool, balance=self.balance, cache_size=self.cache_size)
+            return self._selectors[resolution]
+
+    @property
+    def chromsizes(self):
+        return self.selector(self.resolutions[0]).chromsizes
+
+    def n_bins(self, grange:GenomeRange, resolution:int) -> int:
+        """
+        Number of bins of a genome range at a resolution.
+        """
+        if grange.range_type == "chromosome":
+            grange = GenomeRange(grange.chrom, 0, self.chromsizes[grange.chrom])
+        bin_range = grange.to_bin(resolution)
+        if bin_range.end is None:
+            return 1
+        return bin_range.end - bin_range.start
+
+    def select_resolution(self, grange:GenomeRange, target_pixels:int) -> int:
+        """
+        The coarsest resolution give at least `target_pixels` bins on the genome range,
+        or the finest resolution if none of them does.
+        """
+        for resolution in reversed(self.resolutions):
+            if self.n_bins(grange, resolution) >= target_pixels:
+                return resolution
+        return self.resolutions[0]
+
+    def fetch(self,
+            grange1:GenomeRange,
+            grange2:Optional[GenomeRange]=None,
+            target_pixels:int=512,
+            balance:Optional[Union[bool, str]]=None) -> ResolutionMatrix:
+        """
+        Fetch the dense matrix of grange1(rows) x grange2(columns), at the
+        resolution selected by the larger range.
+
+        Return
+        ------
+        result : ResolutionMatrix
+            (resolution, range1, range2, matrix), range1 and range2 are the
+            genome ranges actually covered by the bins of the matrix.
+        """
+        if grange2 is None:
+            grange2 = grange1
+        resolution = min(self.select_resolution(grange1, target_pixels),
+                         self.select_resolution(grange2, target_pixels))
+        selector = self.selector(resolution)
+        matrix = selector.fetch(grange1, grange2, balance=balance)
+        return ResolutionMatrix(resolution,
+                                self._covered(selector, grange1),
+                                self._covered(selector, grange2),
+                                matrix)
+
+    @staticmethod
+    def _covered(selector:MatrixSelector, grange:GenomeRange) -> GenomeRange:
+        start, end = selector.extent(grange)
+        offset = selector.chrom_offset(grange.chrom)
+        covered = GenomeBinRange(grange.chrom, start - offset, end - offset).to_bp(selector.binsize)
+        return GenomeRange(covered.chrom, covered.start, min(covered.end, selector.chromsizes[grange.chrom]))
+
+
+def _as_range_array(anchors:Union[GenomeRangeArray, Iterable[GenomeRange]]) -> GenomeRangeArray:
+    if isinstance(anchors, GenomeRangeArray):
+        return anchors
+    return GenomeRangeArray.from_granges(anchors)
+
+
+def _center_bins(anchors:GenomeRangeArray, binsize:int) -> np.ndarray:
+    if np.any(anchors.start == NONE_POS):
+        raise ValueError("Anchors must be ranges or points, not chromosomes.")
+    end = np.where(anchors.end == NONE_POS, anchors.start + 1, anchors.end)
+    return (anchors.start + end) // 2 // binsize
+
+
+def _pileup_group(selector:MatrixSelector,
+        chrom1:str, chrom2:str,
+        bins1:np.ndarray, bins2:np.ndarray,
+        flank:int, balance) -> np.ndarray:
+    """
+    Snippets of anchor pairs on one chromosome pair, the band cover all pairs are read once.
+    Out of chromosome cells are NaN.
+    """
+    n1 = selector.chrom_bins(chrom1)
+    n2 = selector.chrom_bins(chrom2)
+    width = 2 * flank + 1
+    stack = np.full((bins1.shape[0], width, width), np.nan)
+    r0, r1 = max(int(bins1.min()) - flank, 0), min(int(bins1.max()) + flank + 1, n1)
+    c0, c1 = max(int(bins2.min()) - flank, 0), min(int(bins2.max()) + flank + 1, n2)
+    if r0 >= r1 or c0 >= c1:
+        return stack
+    max_dist = int(np.abs(bins1 - bins2).max()) + 2 * flank if chrom1 == chrom2 else None
+    mat = selector.fetch_sparse(
+        GenomeBinRange(chrom1, r0, r1), GenomeBinRange(chrom2, c0, c1),
+        balance=False, max_dist=max_dist)
+    n_cols = c1 - c0
+    keys = mat.row.astype(np.int64) * n_cols + mat.col
+    order = np.argsort(keys)
+    keys = np.append(keys[order], -1)  # sentinel for not found
+    data = np.append(mat.data[order].astype(np.float64), 0.0)
+    if balance:
+        offset1 = selector.chrom_offset(chrom1)
+        offset2 = selector.chrom_offset(chrom2)
+        w1 = selector.weights((offset1 + r0, offset1 + r1), balance)
+        w2 = selector.weights((offset2 + c0, offset2 + c1), balance)
+    delta = np.arange(-flank, flank + 1)
+    for i in range(0, bins1.shape[0], PILEUP_CHUNK):
+        rows = bins1[i:i+PILEUP_CHUNK, None, None] + delta[None, :, None]
+        cols = bins2[i:i+PILEUP_CHUNK, None, None] + delta[None, None, :]
+        rows, cols = np.broadcast_arrays(rows, cols)
+        inside = (rows >= r0) & (rows < r1) & (cols >= c0) & (cols < c1)
+        rows = np.clip(rows - r0, 0, r1 - r0 - 1)
+        cols = np.clip(cols - c0, 0, c1 - c0 - 1)
+        query = rows * n_cols + cols
+        pos = np.minimum(np.searchsorted(keys[:-1], query), keys.shape[0] - 1)
+        values = np.where(keys[pos] == query, data[pos], 0.0)
+        if balance:
+            values = values * w1[rows] * w2[cols]
+        values[~inside] = np.nan
+        stack[i:i+PILEUP_CHUNK] = values
+    return stack
+
+
+def _pileup_task(uri:str, balance, chrom1:str, chrom2:str,
+        bins1:np.ndarray, bins2:np.ndarray, flank:int, mode:str):
+    selector = MatrixSelector(Cooler(uri), balance=balance, cache_size=0)
+    stack = _pileup_group(selector, chrom1, chrom2, bins1, bins2, flank, balance)
+    if mode == "mean":
+        return np.nansum(stack, axis=0), np.sum(~np.isnan(stack), axis=0)
+    return stack
+
+
+def pileup(selector:MatrixSelector,
+        anchors1:Union[GenomeRangeArray, Iterable[GenomeRange]],
+        anchors2:Union[GenomeRangeArray, Iterable[GenomeRange]],
+        flank:int=10,
+        mode:str="mean",
+        balance:Optional[Union[bool, str]]=None,
+        workers:int=1) -> np.ndarray:
+    """
+    Aggregate(pileup) the matrix snippets around many anchor pairs.
+
+    Pairs are grouped by chromosome pair, the matrix band covering each group
+    is read once, and snippets are extracted with vectorized indexing.
+    The snippet of a pair is the (2*flank+1) x (2*flank+1) bins centered at
+    the bins of the anchors' midpoints, cells out of the chromosome are NaN.
+
+    Parameters
+    ----------
+    selector : MatrixSelector
+        Selector of the cool file.
+    anchors1 : {`luckyegg.genome.GenomeRangeArray`, list of GenomeRange}
+        First anchors(rows) of the pairs.
+    anchors2 : {`luckyegg.genome.GenomeRangeArray`, list of GenomeRange}
+        Second anchors(columns) of the pairs.
+    flank : int
+        Number of bins around the center.
+    mode : {'mean', 'stack'}
+        Return the NaN-ignored mean of snippets, or the stack of all snippets
+        with shape (n_pairs, 2*flank+1, 2*flank+1) in input order.
+    balance : {bool, str}, optional
+        balance matrix or not, default is selector.balance.
+    workers : int
+        Number of processes, chromosome pairs are processed in parallel if > 1.
+    """
+    if mode not in ("mean", "stack"):
+        raise ValueError(f"Unknown pileup mode: {mode}")
+    if balance is None:
+        balance = selector.balance
+    anchors1 = _as_range_array(anchors1)
+    anchors2 = _as_range_array(anchors2)
+    if len(anchors1) != len(anchors2):
+        raise ValueError("anchors1 and anchors2 must have the same length.")
+    bins1 = _center_bins(anchors1, selector.binsize)
+    bins2 = _center_bins(anchors2, selector.binsize)
+    for anchors in (anchors1, anchors2):
+        missing = {anchors.chroms[c] for c in np.unique(anchors.codes)} - set(selector.genome.chroms)
+        if missing:
+            raise ValueError(f"Chromosomes {sorted(missing)} not in the cool file.")
+    group_keys = anchors1.codes.astype(np.int64) * (len(anchors2.chroms) + 1) + anchors2.codes
+    uniq, group_ids = np.unique(group_keys, return_inverse=True)
+    groups = []
+    for g in range(uniq.shape[0]):
+        idx = np.flatnonzero(group_ids == g)
+        chrom1 = anchors1.chroms[anchors1.codes[idx[0]]]
+        chrom2 = anchors2.chroms[anchors2.codes[idx[0]]]
+        groups.append((idx, chrom1, chrom2))
+
+    width = 2 * flank + 1
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        futures = [
+            executor.submit(_pileup_task, selector.cool.uri, balance, chrom1, chrom2,
+                            bins1[idx], bins2[idx], flank, mode)
+            for idx, chrom1, chrom2 in groups]
+        results = (f.result() for f in futures)
+    else:
+        executor = None
+        results = (
+            _pileup_group(selector, chrom1, chrom2, bins1[idx], bins2[idx], flank, balance)
+            for idx, chrom1, chrom2 in groups)
+    try:
+        if mode == "stack":
+            stack = np.full((len(anchors1), width, width), np.nan)
+            for (idx, _, _), res in zip(groups, results):
+                stack[idx] = res
+            return stack
+        total = np.zeros((width, width))
+        count = np.zeros((width, width), dtype=np.int64)
+        for res in results:
+            if executor is None:
+                res = np.nansum(res, axis=0), np.sum(~np.isnan(res), axis=0)
+            total += res[0]
+            count += res[1]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return total / count
+    finally:
+        if executor is not None:
+            executor.shutdown()
@@ -0,0 +1,309 @@
+"""
+Build .cool files from Hi-C pairs(4DN pairs/pairix style) contact files.
+
+Contacts are read as a stream of line blocks, each block is mapped to bin ids and
+reduced to (bin1, bin2, count) pixels with a vectorized sort-and-reduce(in worker processes).
+Partial pixel tables are spilled to sorted runs when they exceed the memory budget,
+and the runs are merged block by block into the cool file.
+
+Positions in pairs files are 1-based, lines start with '#' are header, e.g.:
+
+    #columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2
+    #chromsize: chr1 248956422
+"""
+import os
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from typing import Dict, IO, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from luckyegg.genome import ChromSizes
+from luckyegg.utils import as_bytes_array, tokenize, gather_bytes, decode_bytes
+from luckyegg.io.bed import _open_binary, _iter_line_blocks
+
+import cooler
+
+
+DEFAULT_CHUNKSIZE = 1 << 18  # lines per block
+DEFAULT_BLOCKSIZE = 1 << 22
+DEFAULT_PAIRS_MEMORY = 1 << 30
+DEFAULT_COLUMNS = ("chrom1", "pos1", "chrom2", "pos2")
+_DEFAULT_INDICES = (1, 2, 3, 4)
+
+IngestStats = namedtuple("IngestStats", ["contacts", "dropped", "pixels", "runs"])
+
+
+def parse_pairs_header(lines:List[str]) -> Tuple[Optional[Tuple[int, int, int, int]], Optional[ChromSizes]]:
+    """
+    Parse header lines of a pairs file.
+    Return the (chrom1, pos1, chrom2, pos2) column indices from '#columns:',
+    and chromosome sizes from '#chromsize:' lines, None if not present.
+    """
+    columns, sizes = None, {}
+    for line in lines:
+        if line.startswith("#columns:"):
+            names = line[len("#columns:"):].split()
+            missing = [c for c in DEFAULT_COLUMNS if c not in names]
+            if missing:
+                raise ValueError(f"Columns {missing} not in the pairs header.")
+            columns = tuple(names.index(c) for c in DEFAULT_COLUMNS)
+        elif line.startswith("#chromsize:"):
+            chrom, size = line[len("#chromsize:"):].split()
+            sizes[chrom] = int(size)
+    return columns, (ChromSizes(sizes) if sizes else None)
+
+
+def _read_header(blocks:Iterator[bytes]) -> Tuple[List[str], bytes]:
+    """
+    Consume the header lines from line blocks, return the header lines and the rest of the block.
+    """
+    header = []
+    for block in blocks:
+        pos = 0
+        while pos < len(block):
+            nl = block.find(b"\n", pos)
+            if block[pos:pos+1] != b"#":
+                return header, block[pos:]
+            header.append(block[pos:nl].decode(errors="replace"))
+            pos = nl + 1
+    return header, b""
+
+
+def _sum_by_key(keys:np.ndarray, counts:np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sort keys and sum up the counts of the same key.
+    """
+    if keys.shape[0] == 0:
+        return keys, counts
+    order = np.argsort(keys, kind="stable")
+    keys, counts = keys[order], counts[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[starts], np.add.reduceat(counts, starts)
+
+
+def reduce_pairs_block(data:bytes,
+        columns:Tuple[int, int, int, int],
+        chrom_index:Dict[str, int],
+        lengths:np.ndarray,
+        offsets:np.ndarray,
+        binsize:int) -> Tuple[np.ndarray, np.ndarray, int, int]:
+    """
+    Map the contacts of a block of complete pairs lines to upper triangle pixels.
+
+    Parameters
+    ----------
+    data : bytes
+        Text of the lines(without header).
+    columns : tuple of int
+        Column indices of (chrom1, pos1, chrom2, pos2).
+    chrom_index : dict
+        Chromosome name to the index in `lengths` and `offsets`.
+    lengths : numpy.ndarray
+        Chromosome sizes in bp.
+    offsets : numpy.ndarray
+        Global bin offsets of chromosomes, see `ChromSizes.offsets`.
+    binsize : int
+        Bin size.
+
+    Return
+    ------
+    keys : numpy.ndarray
+        Sorted pixel keys, bin1_id * n_bins + bin2_id, bin1_id <= bin2_id.
+    counts : numpy.ndarray
+        Contact count of each pixel.
+    n_contacts : int
+        Number of contacts in the block.
+    n_dropped : int
+        Number of contacts dropped, chromosome not in the genome or position out of it.
+    """
+    buf = as_bytes_array(data)
+    line_ids, tok_starts, tok_ends, n_lines = tokenize(buf)
+    n_fields = np.bincount(line_ids, minlength=n_lines)
+    n_fields = n_fields[n_fields > 0]  # skip empty lines
+    first = np.cumsum(n_fields) - n_fields
+    if np.any(n_fields <= max(columns)):
+        i = int(np.flatnonzero(n_fields <= max(columns))[0])
+        line = bytes(data[tok_starts[first[i]]:tok_ends[first[i] + n_fields[i] - 1]]).decode(errors="replace")
+        raise ValueError(f"Pairs line with {n_fields[i]} fields, expect more than {max(columns)}: {line!r}")
+
+    def column(k):
+        return gather_bytes(buf, tok_starts[first + k], tok_ends[first + k])
+
+    n_bins = int(offsets[-1])
+    valid = np.ones(first.shape[0], dtype=bool)
+    bins = []
+    for chrom_col, pos_col in ((columns[0], columns[1]), (columns[2], columns[3])):
+        uniq, inverse = np.unique(column(chrom_col), return_inverse=True)
+        lut = np.array([chrom_index.get(c, -1) for c in decode_bytes(uniq)] + [-1], dtype=np.int64)
+        codes = lut[inverse.ravel()]
+        try:
+            pos = column(pos_col).astype(np.int64) - 1  # 1-based to 0-based
+        except ValueError as e:
+            raise ValueError(f"Pairs positions must be integers: {e}")
+        ok = (codes >= 0) & (pos >= 0)
+        ok[ok] = pos[ok] < lengths[codes[ok]]
+        valid &= ok
+        bins.append(offsets[codes] + pos // binsize)
+    bin1, bin2 = bins[0][valid], bins[1][valid]
+    keys = np.minimum(bin1, bin2) * n_bins + np.maximum(bin1, bin2)
+    keys, counts = np.unique(keys, return_counts=True)
+    return keys, counts.astype(np.int64), int(valid.shape[0]), int((~valid).sum())
+
+
+def _write_run(keys:np.ndarray, counts:np.ndarray, path:str) -> str:
+    os.makedirs(path)
+    np.save(os.path.join(path, "keys.npy"), keys)
+    np.save(os.path.join(path, "counts.npy"), counts)
+    return path
+
+
+def _merge_runs(run_paths:List[str], max_memory:int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    K-way merge sorted pixel runs, the counts of the same pixel in different runs are summed.
+    Each step loads a block from the runs which limit the progress, and emits the pixels
+    before the smallest 'last loaded key' of unfinished runs.
+    """
+    runs = []
+    for path in run_paths:
+        keys = np.load(os.path.join(path, "keys.npy"), mmap_mode="r")
+        counts = np.load(os.path.join(path, "counts.npy"), mmap_mode="r")
+        if keys.shape[0] > 0:
+            runs.append([keys, counts, 0])
+    if not runs:
+        return
+    block_rows = max(max_memory // (2 * len(runs) * 16), 1024)
+    buf_keys, buf_counts = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    loading = runs
+    while True:
+        parts_keys, parts_counts = [buf_keys], [buf_counts]
+        for run in loading:
+            keys, counts, pos = run
+            parts_keys.append(np.array(keys[pos:pos+block_rows]))
+            parts_counts.append(np.array(counts[pos:pos+block_rows]))
+            run[2] = pos + block_rows
+        active = [r for r in runs if r[2] < r[0].shape[0]]
+        keys, counts = _sum_by_key(np.concatenate(parts_keys), np.concatenate(parts_counts))
+        if not active:
+            yield keys, counts
+            break
+        last_loaded = lambda r: int(r[0][r[2] - 1])
+        bound = min(last_loaded(r) for r in active)
+        n_emit = int(np.searchsorted(keys, bound, side="left"))
+        if n_emit > 0:
+            yield keys[:n_emit], counts[:n_emit]
+        buf_keys, buf_counts = keys[n_emit:], counts[n_emit:]
+        loading = [r for r in active if last_loaded(r) == bound]
+
+
+def _pixel_chunks(keys_iter:Iterator[Tuple[np.ndarray, np.ndarray]], n_bins:int, stats:dict) -> Iterator[dict]:
+    for keys, counts in keys_iter:
+        stats["pixels"] += keys.shape[0]
+        yield {"bin1_id": keys // n_bins, "bin2_id": keys % n_bins, "count": counts}
+
+
+def pairs_to_cool(source:Union[str, IO],
+        cool_uri:str,
+        binsize:int,
+        chromsizes:Optional[ChromSizes]=None,
+        columns:Optional[Tuple[int, int, int, int]]=None,
+        chunksize:int=DEFAULT_CHUNKSIZE,
+        max_memory:int=DEFAULT_PAIRS_MEMORY,
+        workers:int=1,
+        tmp_dir:Optional[str]=None,
+        assembly:Optional[str]=None) -> IngestStats:
+    """
+    Aggregate the contacts of a pairs file to a .cool file(upper triangle, raw counts).
+
+    Parameters
+    ----------
+    source : {str, file object}
+        Path to the pairs file(gzip or plain text), '-' for stdin, or an opened file object.
+    cool_uri : str
+        Path(or URI like 'file.mcool::/resolutions/1000') of the output cool file.
+    binsize : int
+        Bin size.
+    chromsizes : `luckyegg.genome.ChromSizes`, optional
+        Chromosome sizes, unit in 'bp'. Default is read from the '#chromsize:' header lines.
+        Contacts on other chromosomes are dropped.
+    columns : tuple of int, optional
+        Column indices of (chrom1, pos1, chrom2, pos2), default is from the '#columns:' header,
+        or (1, 2, 3, 4).
+    chunksize : int
+        Number of lines per block.
+    max_memory : int
+        Approximate memory ceiling(bytes) of the in-memory pixel tables, they are spilled
+        to temporary runs if exceeded.
+    workers : int
+        Number of processes to reduce the blocks.
+    tmp_dir : str, optional
+        Directory of temporary files, default is the system temporary directory.
+    assembly : str, optional
+        Name of the genome assembly, stored in the cool file.
+
+    Return
+    ------
+    `IngestStats`
+        Number of contacts, contacts dropped, pixels written, and sorted runs
+        spilled to `tmp_dir`(0 if the pixels fit in `max_memory`).
+    """
+    from luckyegg.parallel import iter_ordered
+    with ExitStack() as stack:
+        f = _open_binary(source, stack)
+        blocks = _iter_line_blocks(f, chunksize, DEFAULT_BLOCKSIZE)
+        header, rest = _read_header(blocks)
+        header_columns, header_chromsizes = parse_pairs_header(header)
+        if chromsizes is None:
+            chromsizes = header_chromsizes
+        if chromsizes is None:
+            raise ValueError("chromsizes is required when the pairs file has no '#chromsize:' header.")
+        chromsizes = chromsizes.to_bp(1)
+        columns = columns or header_columns or _DEFAULT_INDICES
+        offsets = chromsizes.offsets(binsize)
+        n_bins = int(offsets[-1])
+        if n_bins >= 3037000499:  # n_bins ** 2 overflow int64 pixel keys
+            raise ValueError(f"Too many bins({n_bins}), use a larger binsize.")
+        chrom_index = {c: i for i, c in enumerate(chromsizes.chroms)}
+        task_args = (columns, chrom_index, chromsizes.lengths(), offsets, binsize)
+
+        def tasks():
+            if rest:
+                yield (rest,) + task_args
+            for block in blocks:
+                yield (block,) + task_args
+
+        if workers > 1:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            results = iter_ordered(executor, reduce_pairs_block, tasks(), 2 * workers)
+        else:
+            results = (reduce_pairs_block(*t) for t in tasks())
+
+        tmp = stack.enter_context(tempfile.TemporaryDirectory(prefix="luckyegg-pairs-", dir=tmp_dir))
+        stats = {"contacts": 0, "dropped": 0, "pixels": 0}
+        pending, pending_bytes, runs = [], 0, []
+        for keys, counts, n_contacts, n_dropped in results:
+            stats["contacts"] += n_contacts
+            stats["dropped"] += n_dropped
+            pending.append((keys, counts))
+            pending_bytes += keys.nbytes + counts.nbytes
+            if pending_bytes >= max_memory:
+                keys, counts = _sum_by_key(*map(np.concatenate, zip(*pending)))
+                runs.append(_write_run(keys, counts, os.path.join(tmp, f"run{len(runs)}")))
+                pending, pending_bytes = [], 0
+        if pending:
+            keys, counts = _sum_by_key(*map(np.concatenate, zip(*pending)))
+        else:
+            keys, counts = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        if runs:
+            runs.append(_write_run(keys, counts, os.path.join(tmp, f"run{len(runs)}")))
+            pixels = _merge_runs(runs, max_memory)
+        else:
+            pixels = iter([(keys, counts)])
+        bins = cooler.binnify(pd.Series(chromsizes.sizes), binsize)
+        cooler.create_cooler(cool_uri, bins, _pixel_chunks(pixels, n_bins, stats),
+                             dtypes={"count": np.int32}, ordered=True, symmetric_upper=True,
+                             assembly=assembly, ensure_sorted=False)
+    return IngestStats(stats["contacts"], stats["dropped"], stats["pixels"], len(runs))
@@ -0,0 +1,164 @@
+"""
+Tabix(.tbi) compatible index of BGZF compressed, sorted BED file.
+
+See the tabix format specification: https://samtools.github.io/hts-specs/tabix.pdf
+"""
+import struct
+from typing import Dict, List, Tuple, Iterable
+
+from luckyegg.io.bgzf import BgzfReader, BgzfWriter
+
+LINEAR_SHIFT = 14  # 16kb windows of linear index
+MAX_POS = 1 << 29  # max position can be indexed by the binning scheme
+FORMAT_BED = 0x10000  # generic format, 0-based half-open coordinates(UCSC)
+
+
+def reg2bin(beg:int, end:int) -> int:
+    """
+    Smallest bin fully contains the 0-based half-open region [beg, end).
+    """
+    end -= 1
+    if beg >> 14 == end >> 14:
+        return ((1 << 15) - 1) // 7 + (beg >> 14)
+    if beg >> 17 == end >> 17:
+        return ((1 << 12) - 1) // 7 + (beg >> 17)
+    if beg >> 20 == end >> 20:
+        return ((1 << 9) - 1) // 7 + (beg >> 20)
+    if beg >> 23 == end >> 23:
+        return ((1 << 6) - 1) // 7 + (beg >> 23)
+    if beg >> 26 == end >> 26:
+        return ((1 << 3) - 1) // 7 + (beg >> 26)
+    return 0
+
+
+def reg2bins(beg:int, end:int) -> List[int]:
+    """
+    All bins may overlap with the region [beg, end).
+    """
+    end -= 1
+    bins = [0]
+    for first, shift in ((1, 26), (9, 23), (73, 20), (585, 17), (4681, 14)):
+        bins.extend(range(first + (beg >> shift), first + (end >> shift) + 1))
+    return bins
+
+
+class TabixIndex(object):
+    """
+    Binning and linear index of a BGZF compressed, sorted BED file.
+
+    Attributes
+    ----------
+    names : list of str
+        Sequence(chromosome) names.
+    bins : list of dict
+        For each sequence, mapping from bin number to chunks [(begin, end), ...] of virtual offsets.
+    linear : list of list
+        For each sequence, smallest virtual offset of records overlap each 16kb window.
+    """
+    def __init__(self, names:List[str], bins:List[Dict[int, List[Tuple[int, int]]]], linear:List[List[int]]) -> None:
+        self.names = names
+        self.bins = bins
+        self.linear = linear
+        self._name_index = {n: i for i, n in enumerate(names)}
+
+    @staticmethod
+    def build(records:Iterable[Tuple[int, int, str, int, int]]) -> 'TabixIndex':
+        """
+        Build from (virtual offset begin, virtual offset end, chrom, start, end) of each record.
+        The records must be grouped by chromosome and sorted by start.
+        """
+        names, bins, linear = [], [], []
+        last_chrom, last_start = None, -1
+        for vbeg, vend, chrom, start, end in records:
+            if chrom != last_chrom:
+                if chrom in names:
+                    raise ValueError(f"BED file is not sorted: chromosome {chrom} is not contiguous.")
+                names.append(chrom)
+                bins.append({})
+                linear.append([])
+                last_chrom, last_start = chrom, -1
+            if start < last_start:
+                raise ValueError(f"BED file is not sorted: {chrom}:{start} after {chrom}:{last_start}.")
+            last_start = start
+            if end <= start:
+                end = start + 1
+            chunks = bins[-1].setdefault(reg2bin(start, end), [])
+            if chunks and chunks[-1][1] == vbeg:
+                chunks[-1] = (chunks[-1][0], vend)
+            else:
+                chunks.append((vbeg, vend))
+            lin = linear[-1]
+            last_window = (end - 1) >> LINEAR_SHIFT
+            if len(lin) <= last_window:
+                lin.extend([-1] * (last_window + 1 - len(lin)))  # -1: not set, 0 is a real offset
+            for w in range(start >> LINEAR_SHIFT, last_window + 1):
+                if lin[w] == -1:
+                    lin[w] = vbeg
+        for lin in linear:
+            for w in range(len(lin)):
+                if lin[w] == -1:
+                    lin[w] = lin[w - 1] if w > 0 else 0
+        return TabixIndex(names, bins, linear)
+
+    def chunks(self, chrom:str, beg:int, end:int) -> List[Tuple[int, int]]:
+        """
+        Merged chunks of virtual offsets may contain records overlap with [beg, end).
+        """
+        if chrom not in self._name_index:
+            return []
+        i = self._name_index[chrom]
+        lin = self.linear[i]
+        if len(lin) == 0:
+            min_off = 0
+        else:
+            min_off = lin[min(beg >> LINEAR_SHIFT, len(lin) - 1)]
+        bins = self.bins[i]
+        chunks = sorted(c for b in reg2bins(beg, end) if b in bins for c in bins[b] if c[1] > min_off)
+        merged = []
+        for cbeg, cend in chunks:
+            if merged and cbeg <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], cend))
+            else:
+                merged.append((cbeg, cend))
+        return merged
+
+    def save(self, path:str) -> None:
+        names = b"".join(n.encode() + b"\0" for n in self.names)
+        parts = [b"TBI\1", struct.pack("<8i", len(self.names), FORMAT_BED, 1, 2, 3, ord("#"), 0, len(names)), names]
+        for bins, lin in zip(self.bins, self.linear):
+            parts.append(struct.pack("<i", len(bins)))
+            for b, chunks in bins.items():
+                parts.append(struct.pack("<Ii", b, len(chunks)))
+                parts.extend(struct.pack("<QQ", *c) for c in chunks)
+            parts.append(struct.pack(f"<i{len(lin)}Q", len(lin), *lin))
+        parts.append(struct.pack("<Q", 0))  # n_no_coor
+        with BgzfWriter(path) as f:
+            f.write(b"".join(parts))
+
+    @staticmethod
+    def load(path:str) -> 'TabixIndex':
+        with BgzfReader(path) as f:
+            data = f.read()
+        if data[:4] != b"TBI\1":
+            raise IOError(f"{path} is not a tabix index file.")
+        n_ref, fmt, col_seq, col_beg, col_end, meta, skip, l_nm = struct.unpack_from("<8i", data, 4)
+        pos = 36
+        names = [n.decode() for n in data[pos:pos+l_nm].split(b"\0")[:n_ref]]
+        pos += l_nm
+        bins, linear = [], []
+        for _ in range(n_ref):
+            n_bin, = struct.unpack_from("<i", data, pos)
+            pos += 4
+            ref_bins = {}
+            for _ in range(n_bin):
+                b, n_chunk = struct.unpack_from("<Ii", data, pos)
+                pos += 8
+                flat = struct.unpack_from(f"<{2*n_chunk}Q", data, pos)
+                pos += 16 * n_chunk
+                ref_bins[b] = list(zip(flat[0::2], flat[1::2]))
+            n_intv, = struct.unpack_from("<i", data, pos)
+            pos += 4
+            linear.append(list(struct.unpack_from(f"<{n_intv}Q", data, pos)))
+            pos += 8 * n_intv
+            bins.append(ref_bins)
+        return TabixIndex(names, bins, linear)
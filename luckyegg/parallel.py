@@ -0,0 +1,494 @@
+"""
+Multi-process parsing and map/reduce over large BED(BED-like) files.
+
+The file is split into newline aligned byte ranges, each range is parsed to
+a `luckyegg.io.bed.BEDBatch` in a worker process. Functions passed to workers
+must be picklable(defined at module level).
+
+Large arrays are passed to and from workers through shared memory(`SharedArray`),
+only the segment name is pickled, see `map_chromosomes`.
+"""
+import os
+import sys
+import multiprocessing
+from collections import deque, Counter
+from concurrent.futures import ProcessPoolExecutor, Executor, wait
+from contextlib import ExitStack
+from multiprocessing import shared_memory, resource_tracker
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Any, Dict
+
+import numpy as np
+
+from luckyegg.genome import GenomeRangeArray, ChromSizes
+from luckyegg.instrument import inc, timer
+from luckyegg.io.bed import BEDBatch, BEDLike, parse_bed_block, sniff_bed
+
+DEFAULT_CHUNK_BYTES = 1 << 24
+
+
+def split_file(path:str, chunk_bytes:int=DEFAULT_CHUNK_BYTES, offset:int=0) -> List[Tuple[int, int]]:
+    """
+    Split a file into newline aligned byte ranges [begin, end).
+
+    Parameters
+    ----------
+    path : str
+        Path to the uncompressed text file.
+    chunk_bytes : int
+        Approximate size of each range.
+    offset : int
+        Byte offset to start splitting, e.g. end of the header.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    begin = offset
+    with open(path, 'rb') as f:
+        while begin < size:
+            end = begin + chunk_bytes
+            if end >= size:
+                end = size
+            else:
+                f.seek(end)
+                tail = f.readline()
+                end += len(tail)
+            ranges.append((begin, end))
+            begin = end
+    return ranges
+
+
+def _read_range(path:str, begin:int, end:int) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(begin)
+        data = f.read(end - begin)
+    if data and not data.endswith(b"\n"):
+        data += b"\n"
+    return data
+
+
+def _parse_range(path:str, begin:int, end:int, bed_type:type) -> BEDBatch:
+    return parse_bed_block(_read_range(path, begin, end), bed_type, [])
+
+
+def _map_range(path:str, begin:int, end:int, bed_type:type, mapper:Callable[[BEDBatch], Any]) -> Any:
+    return mapper(_parse_range(path, begin, end, bed_type))
+
+
+def iter_ordered(executor:Executor, func:Callable, args:Iterable[tuple], max_pending:int) -> Iterator[Any]:
+    """
+    Like `executor.map(func, *zip(*args))`, but only keep at most
+    `max_pending` tasks in flight, so results don't pile up in memory.
+    """
+    pending = deque()
+    for a in args:
+        pending.append(executor.submit(func, *a))
+        inc("parallel.tasks")
+        if len(pending) >= max_pending:
+            yield _wait_result(pending.popleft())
+    while pending:
+        yield _wait_result(pending.popleft())
+
+
+def _wait_result(future) -> Any:
+    with timer("parallel.wait_seconds"):
+        return future.result()
+
+
+def _recode(batch:BEDBatch, chroms:List[str], chrom_index:dict) -> BEDBatch:
+    """
+    Remap the chrom codes of a batch to a shared chromosome list.
+    """
+    ranges = batch.ranges
+    lut = np.array([chrom_index.setdefault(c, len(chrom_index)) for c in ranges.chroms] + [-1], dtype=np.int32)
+    chroms.extend(list(chrom_index)[len(chroms):])
+    batch.ranges = GenomeRangeArray(chroms, lut[ranges.codes], ranges.start, ranges.end)
+    return batch
+
+
+def _tasks(path:str, general:bool, chunk_bytes:int, *extra) -> Iterator[tuple]:
+    bed_type, offset = sniff_bed(path, general=general)
+    for begin, end in split_file(path, chunk_bytes, offset):
+        inc("parallel.bytes", end - begin)
+        yield (path, begin, end, bed_type) + extra
+
+
+def read_bed_parallel(path:str,
+        general:bool=False,
+        workers:Optional[int]=None,
+        chunk_bytes:int=DEFAULT_CHUNK_BYTES) -> Iterator[BEDBatch]:
+    """
+    Parse an uncompressed BED file in a process pool, yield `BEDBatch` in file order.
+    Chrom codes of all batches index into one shared chromosome list.
+
+    Parameters
+    ----------
+    path : str
+        Path to bed(bed-like) file.
+    general : bool
+        Treat the file as general bed-like file or not.
+    workers : int, optional
+        Number of worker processes, default is the number of CPUs.
+    chunk_bytes : int
+        Bytes of file parsed by a task.
+    """
+    workers = workers or os.cpu_count()
+    chroms, chrom_index = [], {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for batch in iter_ordered(executor, _parse_range, _tasks(path, general, chunk_bytes), 2 * workers):
+            yield _recode(batch, chroms, chrom_index)
+
+
+def map_reduce_bed(path:str,
+        mapper:Callable[[BEDBatch], Any],
+        reducer:Callable[[Any, Any], Any],
+        initial:Any=None,
+        general:bool=False,
+        workers:Optional[int]=None,
+        chunk_bytes:int=DEFAULT_CHUNK_BYTES) -> Any:
+    """
+    Run a map/reduce over an uncompressed BED file. `mapper` is called on the
+    `BEDBatch` of each chunk in worker processes, and the results are folded
+    with `reducer(accumulated, result)` in file order.
+
+    Parameters
+    ----------
+    path : str
+        Path to bed(bed-like) file.
+    mapper : callable
+        Function map a BEDBatch to a result, must be picklable.
+    reducer : callable
+        Function combine the accumulated value and a result.
+    initial : optional
+        Initial accumulated value, if not given the first result is used.
+    general : bool
+        Treat the file as general bed-like file or not.
+    workers : int, optional
+        Number of worker processes, default is the number of CPUs.
+    chunk_bytes : int
+        Bytes of file parsed by a task.
+    """
+    workers = workers or os.cpu_count()
+    acc = initial
+    first = initial is None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        tasks = _tasks(path, general, chunk_bytes, mapper)
+        for res in iter_ordered(executor, _map_range, tasks, 2 * workers):
+            if first:
+                acc, first = res, False
+            else:
+                acc = reducer(acc, res)
+    return acc
+
+
+def chrom_counts(batch:BEDBatch) -> Counter:
+    """
+    Mapper: count records of each chromosome.
+    """
+    counts = np.bincount(batch.ranges.codes, minlength=len(batch.ranges.chroms))
+    return Counter(dict(zip(batch.ranges.chroms, counts.tolist())))
+
+
+def chrom_coverage(batch:BEDBatch) -> Counter:
+    """
+    Mapper: total covered bases(sum of record lengths) of each chromosome.
+    """
+    ranges = batch.ranges
+    lengths = np.bincount(ranges.codes, weights=ranges.end - ranges.start, minlength=len(ranges.chroms))
+    return Counter(dict(zip(ranges.chroms, lengths.astype(np.int64).tolist())))
+
+
+def merge_counts(a:Counter, b:Counter) -> Counter:
+    """
+    Reducer: sum up two Counter.
+    """
+    a.update(b)
+    return a
+
+
+# Shared memory transport.
+
+SHARE_MIN_BYTES = 1 << 16  # smaller arrays are pickled as usual
+
+
+def _attach_segment(name:str, owner_pid:Optional[int]=None) -> shared_memory.SharedMemory:
+    """
+    Attach to an existing segment without registering it to the resource tracker,
+    the segment is unlinked by its owner.
+
+    Before Python 3.13 attaching always registers the segment, the registration is
+    undone right away unless the owner is this process or the multiprocessing parent:
+    they share the tracker, which keeps one entry per name, the entry belongs to the
+    owner and concurrent attach/unregister of workers would race on it.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    parent = multiprocessing.parent_process()
+    if owner_pid != os.getpid() and (parent is None or parent.pid != owner_pid):
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class SharedArray(object):
+    """
+    NumPy array stored in a shared memory segment.
+    Pickled as (segment name, shape, dtype), the unpickled object attach to the same memory
+    instead of copying the data. The creating process own the segment and should `unlink` it,
+    or use it as a context manager.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the array.
+    dtype : numpy.dtype
+        Data type of the array.
+    fill_value : scalar, optional
+        Initial value of elements, the content is uninitialized(zeros) if not given.
+    """
+    def __init__(self, shape, dtype, fill_value=None) -> None:
+        self.shape = tuple(np.atleast_1d(shape).tolist())
+        self.dtype = np.dtype(dtype)
+        nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        self.owner = True
+        self._pid = os.getpid()
+        if fill_value is not None:
+            self.array[...] = fill_value
+
+    @classmethod
+    def from_array(cls, arr:np.ndarray) -> 'SharedArray':
+        """
+        Copy an array to a new segment.
+        """
+        arr = np.asarray(arr)
+        shared = cls(arr.shape, arr.dtype)
+        shared.array[...] = arr
+        return shared
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def array(self) -> np.ndarray:
+        """
+        The array view of the segment(no copy).
+        """
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def __repr__(self) -> str:
+        return f"SharedArray({self.name!r}, shape={self.shape}, dtype={self.dtype})"
+
+    def __reduce__(self):
+        return _attach_array, (self.name, self.shape, self.dtype.str, self._pid)
+
+    def __enter__(self) -> 'SharedArray':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+        if self.owner:
+            self.unlink()
+
+    def close(self) -> None:
+        """
+        Detach from the segment, views returned by `array` should be released before.
+        """
+        try:
+            self._shm.close()
+        except BufferError:  # views still alive, the mapping is released with them
+            pass
+
+    def unlink(self) -> None:
+        """
+        Destroy the segment.
+        """
+        if sys.version_info < (3, 13):
+            # a segment created elsewhere(e.g. a worker result) was unregistered when
+            # attached, register it again(idempotent) so the unregister in unlink finds it
+            resource_tracker.register(self._shm._name, "shared_memory")
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _attach_array(name:str, shape:tuple, dtype:str, owner_pid:Optional[int]=None) -> SharedArray:
+    shared = SharedArray.__new__(SharedArray)
+    shared.shape, shared.dtype = shape, np.dtype(dtype)
+    shared._shm = _attach_segment(name, owner_pid)
+    shared.owner = False
+    shared._pid = owner_pid
+    return shared
+
+
+def share(obj:Any, segments:List[SharedArray], min_bytes:int=SHARE_MIN_BYTES) -> Any:
+    """
+    Replace large arrays in `obj` with `SharedArray`s, created segments are appended to `segments`.
+    NumPy arrays in tuple, list, dict, `GenomeRangeArray` and `BEDBatch` are replaced.
+    """
+    if isinstance(obj, np.ndarray):
+        if obj.nbytes < min_bytes or obj.dtype.hasobject:
+            return obj
+        shared = SharedArray.from_array(obj)
+        segments.append(shared)
+        return shared
+    elif isinstance(obj, GenomeRangeArray):
+        res = obj.__class__.__new__(obj.__class__)
+        res.__dict__.update({k: share(v, segments, min_bytes) for k, v in obj.__dict__.items()})
+        return res
+    elif isinstance(obj, BEDBatch):
+        return BEDBatch(obj.bed_type, share(obj.ranges, segments, min_bytes),
+                        share(obj.fields, segments, min_bytes), share(obj.values, segments, min_bytes))
+    elif isinstance(obj, (tuple, list)) and type(obj) in (tuple, list):
+        return type(obj)(share(v, segments, min_bytes) for v in obj)
+    elif isinstance(obj, dict):
+        return {k: share(v, segments, min_bytes) for k, v in obj.items()}
+    return obj
+
+
+def unshare(obj:Any, copy:bool=False, segments:Optional[List[SharedArray]]=None) -> Any:
+    """
+    Reverse of `share`, replace `SharedArray`s with array views(or copies if `copy`),
+    the `SharedArray`s are appended to `segments`.
+    """
+    if isinstance(obj, SharedArray):
+        if segments is not None:
+            segments.append(obj)
+        return obj.array.copy() if copy else obj.array
+    elif isinstance(obj, GenomeRangeArray):
+        res = obj.__class__.__new__(obj.__class__)
+        res.__dict__.update({k: unshare(v, copy, segments) for k, v in obj.__dict__.items()})
+        return res
+    elif isinstance(obj, BEDBatch):
+        return BEDBatch(obj.bed_type, unshare(obj.ranges, copy, segments),
+                        unshare(obj.fields, copy, segments), unshare(obj.values, copy, segments))
+    elif isinstance(obj, (tuple, list)) and type(obj) in (tuple, list):
+        return type(obj)(unshare(v, copy, segments) for v in obj)
+    elif isinstance(obj, dict):
+        return {k: unshare(v, copy, segments) for k, v in obj.items()}
+    return obj
+
+
+def _release(segments:List[SharedArray]) -> None:
+    for shared in segments:
+        shared.close()
+        shared.unlink()
+
+
+def _run_shared(func:Callable, chrom:str, size:int, out:Optional[Tuple[SharedArray, int, int]],
+        args:tuple, kwargs:dict) -> Any:
+    """
+    Run a task in a worker, inputs are attached views of shared arrays,
+    large arrays in the result are returned in new segments(owned by the caller).
+    Segments created for a failed task are unlinked.
+    """
+    attached = []
+    args, kwargs = unshare(args, segments=attached), unshare(kwargs, segments=attached)
+    if out is not None:
+        shared, begin, end = out
+        attached.append(shared)
+        args = (shared.array[begin:end],) + args
+    created = []
+    try:
+        return share(func(chrom, size, *args, **kwargs), created)
+    except BaseException:
+        _release(created)
+        raise
+    finally:
+        del args, kwargs
+        for shared in attached:
+            shared.close()
+
+
+def map_chromosomes(func:Callable,
+        chromsizes:ChromSizes,
+        args:tuple=(),
+        kwargs:Optional[dict]=None,
+        binsize:Optional[int]=None,
+        out_dtype=None,
+        fill_value=0,
+        chroms:Optional[Iterable[str]]=None,
+        workers:Optional[int]=None) -> Any:
+    """
+    Call `func(chrom, size, *args, **kwargs)` for each chromosome in a process pool.
+    Large arrays in `args`/`kwargs`(and in `GenomeRangeArray`, `BEDBatch` of them) are copied
+    to shared memory once, workers attach to them without copying. All segments are
+    unlinked when the call return or fail.
+
+    Parameters
+    ----------
+    func : callable
+        Function run on each chromosome, must be picklable.
+        `size` is the chromosome size in bins if `binsize` is given.
+    chromsizes : `luckyegg.genome.ChromSizes`
+        Chromosome sizes of the genome.
+    args : tuple
+        Extra positional arguments of `func`, shared by all chromosomes.
+    kwargs : dict, optional
+        Extra keyword arguments of `func`.
+    binsize : int, optional
+        Bin size of the output array, and unit of `size`.
+    out_dtype : numpy.dtype, optional
+        If given, a dense genome-wide array(indexed by global bin id, see `ChromSizes.offsets`)
+        is allocated in shared memory, and the slice of the chromosome is passed to `func`
+        as the first extra argument, `func(chrom, size, out, *args, **kwargs)`, to fill in place.
+    fill_value : scalar
+        Initial value of the output array.
+    chroms : list of str, optional
+        Chromosomes to process, default is all.
+    workers : int, optional
+        Number of worker processes, default is the number of CPUs.
+
+    Return
+    ------
+    The genome-wide output array if `out_dtype` is given, otherwise dict of chrom to the result of `func`.
+    """
+    workers = workers or os.cpu_count()
+    chroms = chromsizes.chroms if chroms is None else list(chroms)
+    offsets = chromsizes.offsets(binsize)
+    index = {c: i for i, c in enumerate(chromsizes.chroms)}
+    missing = [c for c in chroms if c not in index]
+    if missing:
+        raise ValueError(f"Chromosomes {missing} not in the genome.")
+    resource_tracker.ensure_running()  # workers share the tracker, segments are not reported as leaked
+    segments = []
+    results = {}
+    with ExitStack() as stack:
+        stack.callback(_release, segments)
+        shared_args = share(tuple(args), segments)
+        shared_kwargs = share(dict(kwargs or {}), segments)
+        out = None
+        if out_dtype is not None:
+            out = SharedArray(int(offsets[-1]), out_dtype, fill_value)
+            segments.append(out)
+        executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+        tasks = []
+        for chrom in chroms:
+            i = index[chrom]
+            begin, end = int(offsets[i]), int(offsets[i+1])
+            tasks.append((func, chrom, end - begin, None if out is None else (out, begin, end),
+                          shared_args, shared_kwargs))
+        inc("parallel.shared_bytes", sum(shared.array.nbytes for shared in segments))
+        futures = [executor.submit(_run_shared, *t) for t in tasks]
+        inc("parallel.tasks", len(futures))
+        try:
+            for chrom, fut in zip(chroms, futures):
+                received = []
+                try:
+                    results[chrom] = unshare(_wait_result(fut), copy=True, segments=received)
+                finally:
+                    _release(received)
+        except BaseException:
+            for fut in futures:
+                fut.cancel()
+            # results of the running/finished tasks are not collected, release their segments
+            wait(futures)
+            for fut in futures[len(results):]:
+                if not fut.cancelled() and fut.exception() is None:
+                    received = []
+                    unshare(fut.result(), segments=received)
+                    _release(received)
+            raise
+        if out is not None:
+            return out.array.copy()
+    return results
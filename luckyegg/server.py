@@ -0,0 +1,394 @@
+"""
+Asyncio service for concurrent region queries of Hi-C matrices and 1D tracks.
+
+Queries of a source arrive at the same time(within `window` seconds) and overlapping
+with each other are coalesced: the union region is read once in a bounded thread pool,
+and every waiter get its own part of the shared result. Queries contained in a region
+being read wait for that read instead of starting a new one.
+
+The service can be exposed by a minimal HTTP/1.1 endpoint on TCP or Unix socket:
+
+    GET /sources                               list of source names
+    GET /query/<source>?region=chr1:0-100000   query result in JSON
+        &region2=chr2:0-100000                 column range of matrix sources
+"""
+import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import numpy as np
+
+from luckyegg.genome import GenomeRange, GenomeBinRange, genome_range
+from luckyegg.io.tabix import MAX_POS
+
+
+DEFAULT_WORKERS = 4
+DEFAULT_WINDOW = 0.002  # seconds to wait for more queries to coalesce with
+MAX_REQUEST_LINE = 1 << 16
+
+Box = Tuple[Tuple[int, int], ...]  # [start, end) of each dimension
+
+
+class RegionSource(object):
+    """
+    Base class of data sources served by `RegionService`.
+
+    A query is mapped to a key(e.g. chromosome) and a box([start, end) of each dimension),
+    queries of the same key with overlapping boxes can be served by one read of the union box.
+    """
+    thread_safe = True
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+
+    def extent(self, grange1:GenomeRange, grange2:Optional[GenomeRange]=None) -> Tuple[Any, Box]:
+        raise NotImplementedError
+
+    def read(self, key:Any, box:Box) -> Any:
+        raise NotImplementedError
+
+    def select(self, data:Any, box:Box, qbox:Box) -> Any:
+        """
+        Part of the data(read for `box`) for the query box `qbox`.
+        """
+        raise NotImplementedError
+
+    def encode(self, result:Any) -> Any:
+        """
+        Convert a result to JSON serializable object.
+        """
+        return _encode_array(result)
+
+    def locked_read(self, key:Any, box:Box) -> Any:
+        if self.thread_safe:
+            return self.read(key, box)
+        with self.lock:
+            return self.read(key, box)
+
+
+def _encode_array(arr:np.ndarray) -> list:
+    """
+    Array to nested lists, NaN to None(null in JSON).
+    """
+    arr = np.asarray(arr)
+    out = arr.tolist()
+    if arr.dtype.kind == "f":
+        for idx in np.argwhere(np.isnan(arr)).tolist():
+            row = out
+            for i in idx[:-1]:
+                row = row[i]
+            row[idx[-1]] = None
+    return out
+
+
+class MatrixSource(RegionSource):
+    """
+    Dense matrix of a `luckyegg.io.hicmatrix.MatrixSelector`, boxes are global bin ranges.
+    """
+    def __init__(self, selector, balance:Optional[bool]=None) -> None:
+        super().__init__()
+        self.selector = selector
+        self.balance = selector.balance if balance is None else balance
+
+    def extent(self, grange1:GenomeRange, grange2:Optional[GenomeRange]=None) -> Tuple[Any, Box]:
+        grange2 = grange1 if grange2 is None else grange2
+        return (grange1.chrom, grange2.chrom), (self.selector.extent(grange1), self.selector.extent(grange2))
+
+    def read(self, key:Any, box:Box) -> np.ndarray:
+        (r0, r1), (c0, c1) = box
+        return self.selector.fetch(_bin_range(self.selector, key[0], r0, r1),
+                                   _bin_range(self.selector, key[1], c0, c1), balance=self.balance)
+
+    def select(self, data:np.ndarray, box:Box, qbox:Box) -> np.ndarray:
+        (r0, _), (c0, _) = box
+        (qr0, qr1), (qc0, qc1) = qbox
+        return data[qr0 - r0:qr1 - r0, qc0 - c0:qc1 - c0]
+
+
+def _bin_range(selector, chrom:str, start:int, end:int) -> GenomeRange:
+    offset = selector.chrom_offset(chrom)
+    return GenomeBinRange(chrom, start - offset, end - offset)
+
+
+class TrackSource(RegionSource):
+    """
+    Values of a `luckyegg.io.hdf5.Track`, boxes are index ranges of the chromosome dataset.
+    """
+    thread_safe = False
+
+    def __init__(self, track) -> None:
+        super().__init__()
+        self.track = track
+
+    def extent(self, grange1:GenomeRange, grange2:Optional[GenomeRange]=None) -> Tuple[Any, Box]:
+        chrom, start, end = self.track.extent(grange1)
+        return chrom, ((start, end),)
+
+    def read(self, key:Any, box:Box) -> np.ndarray:
+        (start, end), = box
+        return self.track.group[key][start:end]
+
+    def select(self, data:np.ndarray, box:Box, qbox:Box) -> np.ndarray:
+        (start, _), = box
+        (qs, qe), = qbox
+        return data[qs - start:qe - start]
+
+
+class _IntervalSource(RegionSource):
+    """
+    Sources of intervals, boxes are bp ranges, result are the intervals overlap with the query.
+    Ends are clipped to the chromosome length, or `MAX_POS` of tabix if the length is unknown.
+    """
+    def chrom_length(self, chrom:str) -> Optional[int]:
+        return None
+
+    def extent(self, grange1:GenomeRange, grange2:Optional[GenomeRange]=None) -> Tuple[Any, Box]:
+        length = self.chrom_length(grange1.chrom)
+        max_end = MAX_POS if length is None else length
+        if grange1.start is None:
+            return grange1.chrom, ((0, max_end),)
+        start = min(grange1.start, max_end)
+        end = start + 1 if grange1.end is None else max(grange1.end, start + 1)
+        return grange1.chrom, ((start, max(min(end, max_end), start)),)
+
+
+class BigWigSource(_IntervalSource):
+    """
+    Raw (start, end, value) intervals of a `luckyegg.io.bigwig.BigWigReader`.
+    """
+    thread_safe = False
+
+    def __init__(self, reader) -> None:
+        super().__init__()
+        self.reader = reader
+
+    def chrom_length(self, chrom:str) -> Optional[int]:
+        return self.reader.chromsizes.sizes.get(chrom)
+
+    def read(self, key:Any, box:Box) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        (start, end), = box
+        return self.reader.intervals(GenomeRange(key, start, end))
+
+    def select(self, data, box:Box, qbox:Box) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        s, e, v = data
+        (qs, qe), = qbox
+        keep = (s < qe) & (e > qs)
+        return s[keep], e[keep], v[keep]
+
+    def encode(self, result) -> list:
+        s, e, v = result
+        return [list(t) for t in zip(s.tolist(), e.tolist(), _encode_array(v))]
+
+
+class BedSource(_IntervalSource):
+    """
+    Records of a bgzip compressed, tabix indexed BED file, see `luckyegg.io.bed.fetch`.
+    """
+    def __init__(self, path:str, general:bool=False) -> None:
+        super().__init__()
+        self.path = path
+        self.general = general
+
+    def read(self, key:Any, box:Box) -> list:
+        from luckyegg.io.bed import fetch
+        (start, end), = box
+        return fetch(self.path, GenomeRange(key, start, end), general=self.general)
+
+    def select(self, data:list, box:Box, qbox:Box) -> list:
+        (qs, qe), = qbox
+        return [r for r in data if r.start < qe and r.end > qs]
+
+    def encode(self, result:list) -> list:
+        return [str(r) for r in result]
+
+
+def _contains(box:Box, qbox:Box) -> bool:
+    return all(s <= qs and qe <= e for (s, e), (qs, qe) in zip(box, qbox))
+
+
+def _overlap(box:Box, qbox:Box) -> bool:
+    return all(qs < e and s < qe for (s, e), (qs, qe) in zip(box, qbox))
+
+
+def _union(box:Box, qbox:Box) -> Box:
+    return tuple((min(s, qs), max(e, qe)) for (s, e), (qs, qe) in zip(box, qbox))
+
+
+def coalesce(boxes:List[Box]) -> List[Tuple[Box, List[int]]]:
+    """
+    Group overlapping boxes, return the union box and the members' indices of each group.
+    """
+    order = sorted(range(len(boxes)), key=lambda i: boxes[i])
+    groups = []
+    for i in order:
+        for g, (union, members) in enumerate(groups):
+            if _overlap(union, boxes[i]) or _contains(union, boxes[i]):
+                groups[g] = (_union(union, boxes[i]), members + [i])
+                break
+        else:
+            groups.append((boxes[i], [i]))
+    return groups
+
+
+class RegionService(object):
+    """
+    Serve region queries of named sources, coalescing concurrent overlapping queries.
+
+    Parameters
+    ----------
+    sources : dict
+        Name to `RegionSource`.
+    workers : int
+        Size of the thread pool for the blocking reads.
+    window : float
+        Seconds to wait for more queries before reading, 0 to read in the next event loop iteration.
+    """
+    def __init__(self, sources:Dict[str, RegionSource], workers:int=DEFAULT_WORKERS, window:float=DEFAULT_WINDOW) -> None:
+        self.sources = sources
+        self.window = window
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="luckyegg-io")
+        self._pending = {}  # (name, key) -> [(qbox, future)]
+        self._inflight = {}  # (name, key) -> [(box, future of data)]
+        self.stats = {"queries": 0, "reads": 0, "coalesced": 0}
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+    async def query(self, name:str, grange1:GenomeRange, grange2:Optional[GenomeRange]=None) -> Any:
+        """
+        Query a region of a source, return the result of `source.select`.
+        """
+        if name not in self.sources:
+            raise KeyError(f"Unknown source: {name}")
+        source = self.sources[name]
+        key, qbox = source.extent(grange1, grange2)
+        self.stats["queries"] += 1
+        for box, data in self._inflight.get((name, key), []):
+            if _contains(box, qbox):
+                self.stats["coalesced"] += 1
+                return source.select(await asyncio.shield(data), box, qbox)
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        pending = self._pending.setdefault((name, key), [])
+        pending.append((qbox, fut))
+        if len(pending) == 1:
+            if self.window > 0:
+                loop.call_later(self.window, self._flush, name, key)
+            else:
+                loop.call_soon(self._flush, name, key)
+        return await fut
+
+    def _flush(self, name:str, key:Any) -> None:
+        pending = self._pending.pop((name, key), [])
+        if not pending:
+            return
+        source = self.sources[name]
+        loop = asyncio.get_running_loop()
+        for union, members in coalesce([qbox for qbox, _ in pending]):
+            data = loop.run_in_executor(self.executor, source.locked_read, key, union)
+            inflight = self._inflight.setdefault((name, key), [])
+            inflight.append((union, data))
+            self.stats["reads"] += 1
+            self.stats["coalesced"] += len(members) - 1
+            waiters = [pending[i] for i in members]
+            data.add_done_callback(lambda d, u=union, w=waiters: self._deliver(name, key, source, u, d, w))
+
+    def _deliver(self, name:str, key:Any, source:RegionSource, box:Box, data:asyncio.Future, waiters:list) -> None:
+        inflight = self._inflight.get((name, key), [])
+        inflight[:] = [(b, d) for b, d in inflight if d is not data]
+        if not inflight:
+            self._inflight.pop((name, key), None)
+        for qbox, fut in waiters:
+            if fut.done():
+                continue
+            if data.cancelled():
+                fut.cancel()
+            elif data.exception() is not None:
+                fut.set_exception(data.exception())
+            else:
+                try:
+                    fut.set_result(source.select(data.result(), box, qbox))
+                except Exception as e:
+                    fut.set_exception(e)
+
+    async def handle_http(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> None:
+        """
+        Connection handler for `asyncio.start_server`/`asyncio.start_unix_server`, keep-alive is supported.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = line.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                status, body = await self._respond(request_line.decode("latin-1"))
+                keep_alive = headers.get("connection", "").lower() != "close"
+                payload = json.dumps(body).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, request_line:str) -> Tuple[str, Any]:
+        parts = request_line.split()
+        if len(parts) != 3 or parts[0] != "GET":
+            return "405 Method Not Allowed", {"error": "Only GET is supported."}
+        url = urlsplit(parts[1])
+        path = unquote(url.path).strip("/").split("/")
+        params = parse_qs(url.query)
+        if path == ["sources"]:
+            return "200 OK", sorted(self.sources)
+        if len(path) != 2 or path[0] != "query":
+            return "404 Not Found", {"error": f"Unknown path: {url.path}"}
+        name = path[1]
+        if name not in self.sources:
+            return "404 Not Found", {"error": f"Unknown source: {name}"}
+        if "region" not in params:
+            return "400 Bad Request", {"error": "Parameter 'region' is required."}
+        try:
+            grange1 = genome_range(params["region"][0])
+            grange2 = genome_range(params["region2"][0]) if "region2" in params else None
+            result = await self.query(name, grange1, grange2)
+            body = {"result": self.sources[name].encode(result)}
+        except ValueError as e:
+            return "400 Bad Request", {"error": str(e)}
+        except Exception as e:  # failure of the source, the client still get a response
+            return "500 Internal Server Error", {"error": f"{type(e).__name__}: {e}"}
+        return "200 OK", body
+
+    async def serve(self, host:str="127.0.0.1", port:int=8080, path:Optional[str]=None) -> asyncio.AbstractServer:
+        """
+        Start the HTTP endpoint on TCP(host, port) or Unix socket(path), return the server.
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle_http, path=path, limit=MAX_REQUEST_LINE)
+        return await asyncio.start_server(self.handle_http, host, port, limit=MAX_REQUEST_LINE)
+
+    def run(self, host:str="127.0.0.1", port:int=8080, path:Optional[str]=None) -> None:
+        """
+        Serve forever(blocking).
+        """
+        async def main():
+            server = await self.serve(host, port, path)
+            async with server:
+                await server.serve_forever()
+        try:
+            asyncio.run(main())
+        finally:
+            self.close()
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from luckyegg.genome import GenomeRange, GenomeRangeArray, ChromSizes
+from luckyegg.binning import *
+
+
+def naive_binning(records, chromsizes, binsize, agg, weighted):
+    acc = {c: [[] for _ in range(-(-n // binsize))] for c, n in chromsizes.sizes.items()}
+    for chrom, start, end, value in records:
+        end = min(end, chromsizes[chrom])
+        for b in range(start // binsize, (end - 1) // binsize + 1):
+            overlap = min(end, (b + 1) * binsize) - max(start, b * binsize)
+            acc[chrom][b].append((value, overlap if weighted else 1))
+    res = {}
+    for chrom, bins in acc.items():
+        out = []
+        for pieces in bins:
+            if agg == "sum":
+                out.append(sum(v * w for v, w in pieces))
+            elif agg == "count":
+                out.append(sum(w for _, w in pieces))
+            elif agg == "max":
+                out.append(max([v for v, _ in pieces], default=np.nan))
+            else:
+                total = sum(w for _, w in pieces)
+                out.append(sum(v * w for v, w in pieces) / total if total else np.nan)
+        res[chrom] = np.array(out, dtype=float)
+    return res
+
+
+def random_intervals(n, chromsizes, seed=0):
+    rng = np.random.default_rng(seed)
+    chroms = list(chromsizes.sizes)
+    records = []
+    for _ in range(n):
+        chrom = chroms[rng.integers(len(chroms))]
+        start = int(rng.integers(0, chromsizes[chrom]))
+        records.append((chrom, start, start + int(rng.integers(1, 3000)), float(rng.normal())))
+    return records
+
+
+@pytest.mark.parametrize("agg", AGGREGATIONS)
+@pytest.mark.parametrize("weighted", [True, False])
+def test_bin_signal(agg, weighted):
+    chromsizes = ChromSizes({"chr1": 50000, "chr2": 12345, "chr3": 999})
+    records = random_intervals(2000, chromsizes)
+    expect = naive_binning(records, chromsizes, 1000, agg, weighted)
+    chunks = []
+    for i in range(0, len(records), 300):
+        chunk = records[i:i+300]
+        ranges = GenomeRangeArray.from_granges([GenomeRange(c, s, e) for c, s, e, _ in chunk])
+        chunks.append((ranges, np.array([v for *_, v in chunk])))
+    res = bin_signal(chunks, chromsizes, 1000, agg=agg, weighted=weighted)
+    assert res.to_array().shape[0] == chromsizes.offsets(1000)[-1]
+    for chrom, values in res.to_dict().items():
+        np.testing.assert_allclose(values, expect[chrom])
+
+
+def test_bin_signal_bed(tmp_path):
+    from luckyegg.io.bed import BedGraph, Bed6
+    from luckyegg.io.hdf5 import TrackStore
+    chromsizes = ChromSizes({"chr1": 50000, "chr2": 12345})
+    records = random_intervals(500, chromsizes, seed=1)
+    graph = [BedGraph(c, s, e, str(v)) for c, s, e, v in records]
+    res = bin_signal(graph, chromsizes, 100, agg="mean")
+    expect = naive_binning(records, chromsizes, 100, "mean", True)
+    np.testing.assert_allclose(res.to_dict()["chr2"], expect["chr2"])
+    # coverage of peaks
+    peaks = [Bed6(c, s, e, ".", "0", "+") for c, s, e, _ in records]
+    cov = bin_signal(peaks, chromsizes, 100, agg="count")
+    expect = naive_binning([(c, s, e, 1.0) for c, s, e, _ in records], chromsizes, 100, "count", True)
+    np.testing.assert_allclose(cov.to_dict()["chr1"], expect["chr1"])
+    with TrackStore(str(tmp_path / "tracks.h5"), "w") as store:
+        track = res.write_track(store, "signal")
+        assert track.binsize == 100
+        np.testing.assert_allclose(track.fetch(GenomeRange("chr1", 0, 50000)), res.to_dict()["chr1"], rtol=1e-6)
+        bin_signal(peaks, chromsizes, 100, agg="count", store=store, track="coverage")
+        np.testing.assert_allclose(store["coverage"].fetch("chr2"), cov.to_dict()["chr2"])
+    with pytest.raises(ValueError):
+        BinnedSignal(chromsizes, 100, agg="median")
+    with pytest.raises(ValueError):
+        bin_signal(peaks, chromsizes, 100, column="value")
@@ -142,3 +142,127 @@ def test_ChromSizes_convert():
     assert chrsizes2["chr1"] == 20000
     assert chrsizes2["chr2"] == 20000
 
+
+def random_granges(n=200, seed=0):
+    import random
+    rnd = random.Random(seed)
+    granges = []
+    for _ in range(n):
+        chrom = rnd.choice(["chr1", "chr2", "chr3"])
+        kind = rnd.choice(["range", "range", "point", "point1", "chromosome"])
+        start = rnd.randint(0, 5000)
+        if kind == "range":
+            granges.append(GenomeRange(chrom, start, start + rnd.randint(0, 3000)))
+        elif kind == "point":
+            granges.append(GenomeRange(chrom, start, None))
+        elif kind == "point1":
+            granges.append(GenomeRange(chrom, start, start + 1))
+        else:
+            granges.append(GenomeRange(chrom, None, None))
+    return granges
+
+
+def test_GenomeRangeArray_convert():
+    granges = random_granges()
+    arr = GenomeRangeArray.from_granges(granges)
+    assert len(arr) == len(granges)
+    assert arr.to_granges() == granges
+    assert all(isinstance(gr, GenomeRange) for gr in arr.to_granges())
+    assert arr[3] == granges[3]
+    assert arr[10:20].to_granges() == granges[10:20]
+    assert list(arr.range_type) == [gr.range_type for gr in granges]
+    assert list(arr.chrom) == [gr.chrom for gr in granges]
+    for binsize in (1, 7, 1000):
+        barr = arr.to_bin(binsize)
+        assert isinstance(barr, GenomeBinRangeArray)
+        assert barr.to_granges() == [gr.to_bin(binsize) for gr in granges]
+        assert barr.to_bp(binsize).to_granges() == [gr.to_bin(binsize).to_bp(binsize) for gr in granges]
+    arr2 = GenomeRangeArray.from_arrays(["chr2", "chr1"], [0, 10], [100, 20])
+    assert arr2.to_granges() == [GenomeRange("chr2", 0, 100), GenomeRange("chr1", 10, 20)]
+
+
+def test_GenomeRangeArray_length_and_check():
+    granges = [gr for gr in random_granges() if gr.range_type != "chromosome"]
+    arr = GenomeRangeArray.from_granges(granges)
+    assert list(arr.lengths()) == [len(gr) for gr in granges]
+    with pytest.raises(ValueError):
+        GenomeRangeArray.from_granges([genome_range("chr1")]).lengths()
+    invalid = [GenomeRange("chr1", 10, 5), GenomeRange("chr1", None, 5), GenomeRange("chr1", 5, 10)]
+    assert list(GenomeRangeArray.from_granges(invalid).check()) == [False, False, True]
+
+
+def test_GenomeRangeArray_contains():
+    granges = random_granges(seed=1)
+    others = random_granges(seed=2)
+    arr = GenomeRangeArray.from_granges(granges)
+    arr_o = GenomeRangeArray.from_granges(others)
+    assert list(arr.contains(arr_o)) == [o in g for g, o in zip(granges, others)]
+    assert list(arr.within(arr_o)) == [g in o for g, o in zip(granges, others)]
+    for gr in others[:20] + [GenomeRange("chrX", 0, 10)]:
+        assert list(arr.contains(gr)) == [gr in g for g in granges]
+        assert list(arr.within(gr)) == [g in gr for g in granges]
+    with pytest.raises(ValueError):
+        arr.contains(arr_o[:10])
+
+    invalid, valid = parse_regions(["chr1:0-100", "bad::", "chr2:5-10", "bad::"])
+    assert list(valid) == [True, False, True, False]
+    for gr in [GenomeRange("chrX", 0, 10), genome_range("chrX"), GenomeRange("chr1", 10, 20)]:
+        assert list(invalid.contains(gr)) == [gr in GenomeRange("chr1", 0, 100), False, False, False]
+        assert not invalid.within(gr).any()
+    assert list(invalid.contains(invalid)) == [True, False, True, False]
+    assert list(invalid.within(invalid)) == [True, False, True, False]
+
+
+def test_parse_regions():
+    import numpy as np
+    granges = random_granges(seed=3)
+    regions = [str(gr) for gr in granges]
+    arr, valid = parse_regions(regions)
+    assert valid.all()
+    assert arr.to_granges() == [GenomeRange.from_str(r) for r in regions]
+    assert parse_regions(np.array(regions, dtype="S"))[0].to_granges() == arr.to_granges()
+    # same rules as GenomeRange.from_str, invalid ones are masked
+    regions = ["chr1-100-200", "chr1:100-200-300", "chr1:1:2", "chr1:x-10", "chr1:20-10", "", ":5", "chr1:5"]
+    arr, valid = parse_regions(regions)
+    assert list(valid) == [True, True, False, False, False, False, False, True]
+    assert arr[valid].to_granges() == [GenomeRange.from_str(r) for r, v in zip(regions, valid) if v]
+    assert list(arr.codes[~valid]) == [-1] * 5
+    # chromosome list is shared, names are interned
+    chroms = ["chr2"]
+    arr, _ = parse_regions(["chr1:1-2", "chr2:3-4"], chroms=chroms)
+    assert chroms == ["chr2", "chr1"] and list(arr.codes) == [1, 0]
+    assert GenomeRange.from_str("".join(["chr", "1"])).chrom is arr.chroms[1]
+    assert len(parse_regions([])[0]) == 0
+
+
+def test_ChromSizes_global_coordinates():
+    import numpy as np
+    sizes = ChromSizes({"chr1": 2500, "chr2": 1000, "chrM": 16, "chr3": 4001})
+    assert sizes.chroms == ["chr1", "chr2", "chrM", "chr3"]
+    assert list(sizes.offsets()) == [0, 2500, 3500, 3516, 7517]
+    assert list(sizes.offsets(1000)) == [0, 3, 4, 5, 10]
+    assert sizes.offsets(1000) is sizes.offsets(1000)
+    assert sizes.to_bin(1000) is sizes.to_bin(1000)
+    assert sizes.to_bin(1000).sizes == {"chr1": 3, "chr2": 1, "chrM": 1, "chr3": 5}
+    rng = np.random.default_rng(0)
+    chroms = np.array(sizes.chroms)[rng.integers(0, 4, 1000)]
+    pos = np.array([rng.integers(0, sizes[c]) for c in chroms])
+    for binsize in (None, 1000):
+        gpos = sizes.to_global(chroms, pos, binsize=binsize)
+        codes, local = sizes.from_global(gpos, binsize=binsize)
+        assert list(np.array(sizes.chroms)[codes]) == list(chroms)
+        assert list(local) == list(pos if binsize is None else pos // binsize)
+    ranges = GenomeRangeArray.from_arrays(chroms, pos, pos + 1)
+    assert list(sizes.range_codes(ranges)) == list(sizes.chrom_codes(chroms))
+    gstart, gend = sizes.ranges_to_global(ranges, 1000)
+    assert list(gstart) == list(sizes.to_global(chroms, pos, 1000)) and np.all(gend == gstart + 1)
+    bins = np.arange(10)
+    assert sizes.global_bins_to_ranges(bins, 1000).to_granges() == \
+        [GenomeRange(c, i * 1000, min((i + 1) * 1000, sizes[c]))
+         for c, n in sizes.to_bin(1000).sizes.items() for i in range(n)]
+    with pytest.raises(ValueError):
+        sizes.to_global(["chrX"], [0])
+    with pytest.raises(ValueError):
+        sizes.range_codes(GenomeRangeArray.from_arrays(np.array(["chrX"]), np.array([0]), np.array([1])))
+    with pytest.raises(ValueError):
+        sizes.from_global([7517])
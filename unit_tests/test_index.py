@@ -0,0 +1,83 @@
+import random
+
+import numpy as np
+import pytest
+
+from luckyegg.genome import GenomeRange, GenomeRangeArray, genome_range
+from luckyegg.index import *
+
+
+def random_intervals(n, seed, chroms=("chr1", "chr2", "chr3"), max_len=500):
+    rnd = random.Random(seed)
+    intervals = []
+    for _ in range(n):
+        start = rnd.randint(0, 10000)
+        intervals.append(GenomeRange(rnd.choice(chroms), start, start + rnd.randint(0, max_len)))
+    return intervals
+
+
+def is_overlap(a, b):
+    if a.chrom != b.chrom:
+        return False
+    if b.start is None:
+        return True
+    b_end = b.start + 1 if b.end is None else b.end
+    return a.start < b_end and a.end > b.start
+
+
+def gap(a, b):
+    if is_overlap(a, b):
+        return 0
+    return max(b.start - a.end, a.start - b.end)
+
+
+def test_overlap():
+    intervals = random_intervals(500, 0)
+    index = IntervalIndex.from_records(intervals)
+    queries = random_intervals(100, 1, chroms=("chr1", "chr2", "chrX"), max_len=2000)
+    queries += [genome_range("chr1"), genome_range("chr2:5000")]
+    for q in queries:
+        expect = [i for i, iv in enumerate(intervals) if is_overlap(iv, q)]
+        assert sorted(index.overlap(q)) == expect
+        assert index.count_overlaps(q) == len(expect)
+        assert sorted(index.overlap_records(q)) == sorted(intervals[i] for i in expect)
+    qarr = GenomeRangeArray.from_granges(queries)
+    query_ids, ids = index.query(qarr)
+    pairs = sorted(zip(query_ids.tolist(), ids.tolist()))
+    expect = [(j, i) for j, q in enumerate(queries) for i, iv in enumerate(intervals) if is_overlap(iv, q)]
+    assert pairs == expect
+    counts = index.count_overlaps(qarr)
+    assert list(counts) == [index.count_overlaps(q) for q in queries]
+
+
+def test_nearest():
+    intervals = random_intervals(300, 2, chroms=("chr1", "chr2"), max_len=50)
+    index = IntervalIndex.from_records(intervals)
+    queries = random_intervals(200, 3, chroms=("chr1", "chr2", "chrX"), max_len=50)
+    ids, dists = index.nearest(GenomeRangeArray.from_granges(queries))
+    for q, i, d in zip(queries, ids, dists):
+        if q.chrom == "chrX":
+            assert (i, d) == (-1, -1)
+            continue
+        expect = min(gap(iv, q) for iv in intervals if iv.chrom == q.chrom)
+        assert d == expect
+        assert gap(intervals[i], q) == expect
+    assert index.nearest(queries[0]) == (ids[0], dists[0])
+
+
+def test_from_batches():
+    intervals = random_intervals(100, 4)
+    batches = [GenomeRangeArray.from_granges(intervals[:50]), GenomeRangeArray.from_granges(intervals[50:])]
+
+    class Batch(object):
+        def __init__(self, ranges):
+            self.ranges = ranges
+
+    index = IntervalIndex.from_batches(Batch(b) for b in batches)
+    q = GenomeRange("chr1", 1000, 3000)
+    assert sorted(index.overlap(q)) == [i for i, iv in enumerate(intervals) if is_overlap(iv, q)]
+    empty = IntervalIndex.from_records([])
+    assert empty.count_overlaps(q) == 0
+    assert empty.nearest(q) == (-1, -1)
+    with pytest.raises(ValueError):
+        IntervalIndex(batches[0]).overlap_records(q)
@@ -0,0 +1,114 @@
+import os
+import json
+import threading
+
+import pytest
+
+from luckyegg import instrument
+from luckyegg.instrument import *
+from luckyegg.io.bed import Bed6, read_bed, read_bed_batches
+from luckyegg.parallel import read_bed_parallel
+
+from test_io_bed import create_sample
+
+
+def test_registry():
+    reg = Registry()
+    reg.inc("bed.rows", 10)
+    reg.inc("bed.rows", 5)
+    for v in [0.0002, 0.002, 0.002, 20.0]:
+        reg.observe("bed.parse_seconds", v)
+    assert reg["bed.rows"].value == 15
+    hist = reg["bed.parse_seconds"]
+    assert hist.count == 4
+    assert hist.max == 20.0
+    assert hist.to_dict()["buckets"]["0.005"] == 3
+    assert hist.to_dict()["buckets"]["+Inf"] == 4
+    assert hist.quantile(0.5) == 0.005
+    assert hist.quantile(1) == 20.0
+    assert list(reg.query("bed.*")) == ["bed.parse_seconds", "bed.rows"]
+    assert reg.value("missing") == 0
+    with pytest.raises(ValueError):
+        reg.observe("bed.rows", 1.0)
+
+    threads = [threading.Thread(target=lambda: [reg.inc("n") for _ in range(1000)]) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert reg["n"].value == 4000
+
+
+def test_export(tmp_path):
+    reg = Registry()
+    reg.inc("hicmatrix.tile_hits", 3)
+    reg.observe("hicmatrix.fetch_seconds", 0.01)
+    text = reg.to_prometheus()
+    assert "# TYPE luckyegg_hicmatrix_tile_hits_total counter\nluckyegg_hicmatrix_tile_hits_total 3" in text
+    assert 'luckyegg_hicmatrix_fetch_seconds_bucket{le="0.01"} 1' in text
+    assert 'luckyegg_hicmatrix_fetch_seconds_bucket{le="0.005"} 0' in text
+    assert "luckyegg_hicmatrix_fetch_seconds_count 1" in text
+    path = reg.export(str(tmp_path / "metrics.json"))
+    with open(path) as f:
+        data = json.load(f)
+    assert data["hicmatrix.tile_hits"] == {"type": "counter", "value": 3}
+    path = reg.export(str(tmp_path / "metrics.prom"))
+    with open(path) as f:
+        assert f.read() == text
+
+
+def test_profile():
+    bed_path = create_sample('example_bed_instrument', Bed6, lines=1000)
+    assert not enabled()
+    with timer("x") as t:
+        pass
+    assert t is instrument._NULL_TIMER
+    list(read_bed(bed_path))
+    assert len(REGISTRY) == 0
+
+    with profile() as prof:
+        assert enabled()
+        with profile() as inner:
+            batches = list(read_bed_batches(bed_path, chunksize=300))
+        records = list(read_bed(bed_path))
+    assert not enabled()
+    assert inner["bed.rows"].value == len(records)
+    assert prof["bed.rows"].value == 2 * len(records)
+    assert inner["bed.parse_seconds"].count == len(batches)
+    assert inner["bed.sniff_seconds"].count == 1
+    assert inner.value("bed.bytes") > 0
+    assert "bed.to_records_seconds" not in inner
+    assert "bed.to_records_seconds" in prof
+
+    with profile() as prof:
+        batches = list(read_bed_parallel(bed_path, workers=2, chunk_bytes=4096))
+    assert prof["parallel.tasks"].value == prof["parallel.wait_seconds"].count == len(batches)
+    assert len(REGISTRY) == 0
+
+    enable()
+    try:
+        list(read_bed(bed_path))
+        assert REGISTRY["bed.rows"].value == len(records)
+    finally:
+        disable()
+        REGISTRY.reset()
+    os.remove(bed_path)
+
+
+def test_matrix_selector(tmp_path):
+    import cooler
+    from test_io_hicmatrix import create_cool
+    from luckyegg.genome import genome_range
+    from luckyegg.io.hicmatrix import MatrixSelector
+    selector = MatrixSelector(cooler.Cooler(create_cool(str(tmp_path / "test.cool"))), tile_size=16)
+    with profile() as prof:
+        selector.fetch(genome_range("chr1:0-20000"))
+        selector.fetch(genome_range("chr1:0-20000"))
+        selector.fetch_sparse(genome_range("chr1:0-20000"))
+    info = selector.cache_info()
+    assert prof["hicmatrix.tile_hits"].value == info.hits
+    assert prof["hicmatrix.tile_misses"].value == info.misses
+    assert prof["hicmatrix.read_balanced_seconds"].count == info.misses
+    assert prof["hicmatrix.fetch_seconds"].count == 2
+    assert prof["hicmatrix.balance_seconds"].count == 1
+    assert prof["hicmatrix.pixels"].value > 0
@@ -1,8 +1,16 @@
+import io
 import os
-from os.path import join
+import gzip
 import random
+import shutil
+from os.path import join
+
+import numpy as np
+import pytest
 
+from luckyegg.genome import GenomeRange, ChromSizes
 from luckyegg.io.bed import *
+from luckyegg.io.tabix import TabixIndex
 
 
 def create_sample(name:str,
@@ -119,3 +127,309 @@ def test_read_bed():
     test_general(Bed9)
     test_general(Bed12)
 
+
+def test_read_bed_batches():
+    for bed_type in (BedGraph, Bed6, Bed9, Bed12):
+        bed_path = create_sample('example_bed', bed_type, lines=100)
+        records = list(read_bed(bed_path))
+        batches = list(read_bed_batches(bed_path, chunksize=7))
+        assert all(len(b) <= 7 for b in batches)
+        assert all(b.bed_type is bed_type for b in batches)
+        assert sum([b.to_records() for b in batches], []) == records
+        starts = np.concatenate([b["start"] for b in batches])
+        assert starts.dtype == np.int64
+        assert list(starts) == [r.start for r in records]
+        col = "value" if bed_type is BedGraph else "score"
+        values = np.concatenate([b[col] for b in batches])
+        assert values.dtype == np.int64
+        assert list(values) == [int(getattr(r, col)) for r in records]
+        os.remove(bed_path)
+
+
+def test_read_bed_batches_stream():
+    text = "track name=x\n" + "\n".join(example_bed_line(Bed6) for _ in range(50)) + "\n"
+    expect = [Bed6.from_line(line) for line in text.splitlines()[1:]]
+    assert list(read_bed(io.BytesIO(text.encode()))) == expect
+    assert list(read_bed(io.StringIO(text))) == expect
+    gz = gzip.compress(text.encode())
+    assert list(read_bed(io.BufferedReader(io.BytesIO(gz)))) == expect
+    reader = BEDReader(io.BytesIO(text.encode()), chunksize=10)
+    batches = list(reader)
+    assert reader.header_rows == 1
+    assert reader.bed_type is Bed6
+    assert sorted(reader.chroms) == sorted(set(r.chrom for r in expect))
+    assert [r.genome_range for b in batches for r in b.to_records()] == \
+        [gr for b in batches for gr in b.ranges.to_granges()]
+
+
+def test_read_bed_batches_invalid():
+    text = "chr1\t1\t10\tname\t0\t+\nchr1\t1\t10\tname\t0\n"
+    with pytest.raises(ValueError):
+        list(read_bed(io.BytesIO(text.encode())))
+    text = "chr1\tx\t10\tname\t0\t+\n"
+    with pytest.raises(ValueError):
+        list(read_bed(io.BytesIO(text.encode())))
+
+
+def test_bgzip_fetch(tmp_path):
+    rnd = random.Random(0)
+    rows = []
+    for chrom in ("chr1", "chr2", "chr10"):
+        for _ in range(3000):
+            start = rnd.randint(0, 2_000_000)
+            rows.append((chrom, start, start + rnd.randint(1, 50000)))
+    rows.sort(key=lambda r: (r[0], r[1]))
+    path = str(tmp_path / "sorted.bed")
+    with open(path, 'w') as f:
+        f.write("#header\n")
+        for i, (chrom, start, end) in enumerate(rows):
+            f.write(f"{chrom}\t{start}\t{end}\tp{i}\t{i % 100}\t+\n")
+    gz = bgzip_bed(path)
+    assert list(read_bed(gz)) == list(read_bed(path))
+    queries = [GenomeRange("chr1", 100000, 120000), GenomeRange("chr10", 1_999_000, 3_000_000),
+               GenomeRange("chr2", 5000, None), GenomeRange("chr3", 0, 100)]
+    for q in queries:
+        end = q.start + 1 if q.end is None else q.end
+        expect = [r for r in read_bed(path) if r.chrom == q.chrom and r.start < end and r.end > q.start]
+        assert fetch(gz, q) == expect
+    assert len(fetch(gz, GenomeRange("chr2", None, None))) == 3000
+    # rebuild index from the compressed file
+    index = index_bed(gz)
+    assert TabixIndex.load(gz + ".tbi").chunks("chr1", 0, 100) == index.chunks("chr1", 0, 100)
+
+
+def test_bgzip_fetch_first_record(tmp_path):
+    # first record is at virtual offset 0(no header) and spans several linear index windows
+    path = str(tmp_path / "first.bed")
+    with open(path, 'w') as f:
+        f.write("chr1\t0\t20000\ta\n")
+        f.write("chr1\t100\t200\tb\n")
+        f.write("chr1\t40000\t40100\tc\n")
+    gz = bgzip_bed(path)
+    names = lambda recs: [r.items[0] for r in recs]
+    assert names(fetch(gz, GenomeRange("chr1", 0, 50), general=True)) == ["a"]
+    assert names(fetch(gz, GenomeRange("chr1", 18000, 19000), general=True)) == ["a"]
+    assert names(fetch(gz, GenomeRange("chr1", 150, 40050), general=True)) == ["a", "b", "c"]
+    pysam = pytest.importorskip("pysam")
+    with pysam.TabixFile(gz) as tbx:
+        assert [l.split("\t")[3] for l in tbx.fetch("chr1", 0, 50)] == ["a"]
+    ref = str(tmp_path / "ref.bed")
+    shutil.copy(path, ref)
+    ref = pysam.tabix_index(ref, preset="bed", force=True)
+    with pysam.TabixFile(ref) as tbx:
+        for beg, end in [(0, 50), (18000, 19000), (150, 40050)]:
+            expect = [l.split("\t")[3] for l in tbx.fetch("chr1", beg, end)]
+            assert names(fetch(gz, GenomeRange("chr1", beg, end), general=True)) == expect
+
+
+def test_bgzip_unsorted(tmp_path):
+    path = str(tmp_path / "unsorted.bed")
+    with open(path, 'w') as f:
+        f.write("chr1\t100\t200\nchr1\t50\t60\n")
+    with pytest.raises(ValueError):
+        bgzip_bed(path)
+
+
+def test_bed_cache(tmp_path):
+    path = create_sample("cached.bed", Bed6, lines=1000, header=False, sample_dir=str(tmp_path))
+    expect = list(read_bed(path))
+    assert list(read_bed(path, cache=True)) == expect
+    cache = bed_cache_path(path)
+    assert os.path.isdir(cache)
+    batch = load_bed_cache(path)
+    assert isinstance(batch.fields["name"], np.memmap) and not batch.ranges.start.flags.writeable
+    assert batch.values["score"].dtype == np.int64
+    batches = list(read_bed_batches(path, chunksize=300, cache=True))
+    assert [len(b) for b in batches] == [300, 300, 300, 100]
+    assert [r for b in batches for r in b.to_records()] == expect
+    # source changed, cache is rebuilt
+    with open(path, 'a') as f:
+        f.write("chrX\t1\t2\t.\t0\t+\n")
+    assert load_bed_cache(path) is None
+    records = list(read_bed(path, cache=True))
+    assert records[:-1] == expect and records[-1].chrom == "chrX"
+    assert load_bed_cache(path) is not None
+    # cache in other directory, for general bed-like records
+    cache_dir = str(tmp_path / "cache")
+    assert list(read_bed(path, general=True, cache=True, cache_dir=cache_dir)) == list(read_bed(path, general=True))
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_bed_cache_streaming(tmp_path):
+    # dtypes change between batches: longer names, float scores
+    path = str(tmp_path / "mixed.bed")
+    with open(path, 'w') as f:
+        for i in range(1000):
+            score = i if i < 500 else i + 0.5
+            f.write(f"chr{i % 3 + 1}\t{i}\t{i + 10}\t{'n' * (i // 100 + 1)}\t{score}\t+\n")
+    expect = list(read_bed_batches(path, chunksize=100))
+    # stopped early, no partial cache is left
+    reader = read_bed_batches(path, chunksize=100, cache=True)
+    next(reader)
+    assert os.path.isdir(bed_cache_path(path)) is False
+    reader.close()
+    assert os.listdir(str(tmp_path)) == ["mixed.bed"]
+    # batches are yielded while the cache is written
+    batches = list(read_bed_batches(path, chunksize=100, cache=True))
+    assert [b.to_records() for b in batches] == [b.to_records() for b in expect]
+    cached = load_bed_cache(path)
+    full = BEDBatch.concat(expect)
+    assert cached.to_records() == full.to_records()
+    assert cached.fields["name"].dtype == full.fields["name"].dtype
+    assert cached.values["score"].dtype == np.float64
+    np.testing.assert_array_equal(cached.values["score"], full.values["score"])
+
+
+def random_sorted_records(n:int, seed:int, chroms=("chr1", "chr10", "chr2")) -> list:
+    rnd = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        start = rnd.randint(0, 20000)
+        rows.append(Bed6(rnd.choice(chroms), start, start + rnd.randint(1, 500), f"r{len(rows)}", "0", "+"))
+    return sorted(rows, key=lambda r: (r.chrom, r.start))
+
+
+def collect(batches) -> list:
+    return [r for b in batches for r in b.to_records()]
+
+
+def test_set_operations():
+    a = random_sorted_records(3000, 0)
+    b = random_sorted_records(500, 1, chroms=("chr1", "chr2", "chr3"))
+    # batches split records of a chromosome
+    a_batches = [BEDBatch.from_records(a[i:i+700]) for i in range(0, len(a), 700)]
+
+    def overlap(x, y):
+        return x.chrom == y.chrom and x.start < y.end and y.start < x.end
+
+    expect = [r.__class__(r.chrom, max(r.start, o.start), min(r.end, o.end), *r[3:])
+              for r in a for o in b if overlap(r, o)]
+    assert collect(intersect(a_batches, b)) == expect
+    assert collect(intersect(a, b, mode="any")) == [r for r in a if any(overlap(r, o) for o in b)]
+    assert collect(intersect(a, iter(b), mode="none")) == [r for r in a if not any(overlap(r, o) for o in b)]
+
+    cover = {}
+    for r in b:
+        cover.setdefault(r.chrom, set()).update(range(r.start, r.end))
+    pieces = []
+    for r in a:
+        pos = [p for p in range(r.start, r.end) if p not in cover.get(r.chrom, ())]
+        for i, p in enumerate(pos):
+            if i == 0 or p != pos[i - 1] + 1:
+                pieces.append([p, p + 1, r])
+            else:
+                pieces[-1][1] = p + 1
+    assert collect(subtract(a_batches, b)) == [r.__class__(r.chrom, s, e, *r[3:]) for s, e, r in pieces]
+
+    merged = collect(merge(a_batches))
+    assert all(x.chrom != y.chrom or x.end < y.start for x, y in zip(merged, merged[1:]))
+    covered = {(r.chrom, p) for r in a for p in range(r.start, r.end)}
+    assert {(m.chrom, p) for m in merged for p in range(m.start, m.end)} == covered
+    merged = collect(merge(b, distance=100))
+    assert all(x.chrom != y.chrom or y.start - x.end > 100 for x, y in zip(merged, merged[1:]))
+    assert len(merged) < len(collect(merge(b)))
+
+    sizes = ChromSizes({"chr1": 21000, "chr10": 20400, "chr2": 30000, "chr0": 100})
+    gaps = collect(complement(a_batches, sizes))
+    assert gaps[0] == BedGeneral("chr0", 0, 100, [])
+    gap_pos = {(g.chrom, p) for g in gaps for p in range(g.start, g.end)}
+    genome = {(c, p) for c, s in sizes.sizes.items() for p in range(s)}
+    assert gap_pos == genome - covered
+
+    res = collect(closest(a, b))
+    assert len(res) == len(a)
+    for r, x in zip(res, a):
+        assert (r.chrom, r.start, r.end) == (x.chrom, x.start, x.end)
+        dists = [0 if overlap(x, o) else max(o.start - x.end, x.start - o.end) for o in b if o.chrom == x.chrom]
+        assert int(r.items[-1]) == (min(dists) if dists else -1)
+        assert len(r.items) == 3 + 3 + 3 + 1
+    with pytest.raises(ValueError):
+        list(merge(a[::-1]))
+    with pytest.raises(ValueError):
+        list(intersect(a, b[::-1]))
+
+
+def test_set_operations_streaming():
+    # b is consumed along with a, not loaded per chromosome
+    n_batches = 200
+    consumed = []
+
+    def b_stream():
+        for i in range(n_batches):
+            consumed.append(i)
+            start = np.arange(i * 1000, (i + 1) * 1000, 10)
+            yield BEDBatch.from_records([Bed6("chr1", int(s), int(s) + 5, ".", "0", "+") for s in start])
+
+    a = [Bed6("chr1", s + 3, s + 10, ".", "0", "+") for s in range(0, n_batches * 1000, 50)]
+    a_batches = [BEDBatch.from_records(a[i:i+100]) for i in range(0, len(a), 100)]
+    for op in (intersect, subtract, closest):
+        consumed.clear()
+        results = op(a_batches, b_stream())
+        next(results)
+        assert len(consumed) <= 10
+        n = len(collect(results))
+        assert len(consumed) == n_batches and n > 0
+    res = collect(closest(a_batches, b_stream()))
+    assert all(r.items[-1] == "0" for r in res)
+
+
+def test_sort_bed(tmp_path):
+    from collections import Counter
+    rnd = random.Random(2)
+    path = str(tmp_path / "unsorted.bed")
+    with open(path, 'w') as f:
+        f.write("#header\n")
+        for i in range(20000):
+            line = example_bed_line(Bed6).split("\t")
+            line[3] = f"r{i}"
+            f.write("\t".join(line) + "\n")
+    records = list(read_bed(path))
+    expect = sorted(records, key=lambda r: (r.chrom, r.start, r.end))
+    for workers in (1, 2):
+        out = str(tmp_path / f"sorted{workers}.bed")
+        sort_bed(path, out, max_memory=1 << 17, workers=workers, tmp_dir=str(tmp_path))
+        res = list(read_bed(out))
+        assert [(r.chrom, r.start, r.end) for r in res] == [(r.chrom, r.start, r.end) for r in expect]
+        assert Counter(res) == Counter(records)
+    assert sorted(os.listdir(str(tmp_path))) == ["sorted1.bed", "sorted2.bed", "unsorted.bed"]
+    # sorted output works with the set operations
+    assert len(collect(merge(str(tmp_path / "sorted1.bed")))) > 0
+
+
+def test_write_bed(tmp_path):
+    random.seed(3)
+    for bed_type in (Bed6, Bed9, Bed12, BedGraph):
+        text = "".join(example_bed_line(bed_type) + "\n" for _ in range(1000))
+        path = str(tmp_path / "in.bed")
+        with open(path, 'w') as f:
+            f.write(text)
+        records = list(read_bed(path))
+        expect = "".join(str(r) + "\n" for r in records)
+        out = str(tmp_path / "out.bed")
+        write_bed(out, records)
+        assert open(out).read() == expect
+        write_bed(out, read_bed_batches(path, chunksize=100))
+        assert open(out).read() == expect
+    # general records, whitespace in items are normalized like `str`
+    text = "chr1 1 2 a  b\nchr2\t3\t4\nchr10\t5\t6\tc \t d\te\n"
+    records = list(read_bed(io.StringIO(text), general=True))
+    expect = "".join(str(r) + "\n" for r in records)
+    buf = io.StringIO()
+    write_bed(buf, read_bed_batches(io.StringIO(text), general=True))
+    assert buf.getvalue() == expect
+    records.append(BedGeneral("chr3", 7, 8, ["x y", "z"]))
+    buf = io.BytesIO()
+    write_bed(buf, records)
+    assert buf.getvalue().decode() == "".join(str(r) + "\n" for r in records)
+    # compression
+    records = random_sorted_records(20000, 4)
+    expect = "".join(str(r) + "\n" for r in records)
+    for threads in (1, 3):
+        out = str(tmp_path / f"out{threads}.bed.gz")
+        write_bed(out, records, compression="gzip", threads=threads)
+        assert gzip.open(out, 'rt').read() == expect
+        write_bed(out, records, compression="bgzip", threads=threads, index=True)
+        assert gzip.open(out, 'rt').read() == expect
+        assert fetch(out, GenomeRange("chr2", 0, 10**9)) == [r for r in records if r.chrom == "chr2"]
+    with pytest.raises(ValueError):
+        write_bed(io.StringIO(), records, compression="gzip")
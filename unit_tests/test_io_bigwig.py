@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from luckyegg.genome import GenomeRange, GenomeRangeArray
+from luckyegg.io.bigwig import *
+
+pyBigWig = pytest.importorskip("pyBigWig")
+
+
+def create_bigwig(path:str, seed:int=0) -> str:
+    rng = np.random.default_rng(seed)
+    bw = pyBigWig.open(path, "w")
+    bw.addHeader([("chr1", 1000000), ("chr2", 500000), ("chr3", 1000)])
+    start = np.sort(rng.choice(990000, 20000, replace=False))
+    end = np.minimum(start + rng.integers(1, 40, start.shape[0]), np.append(start[1:], 1000000))
+    bw.addEntries(["chr1"] * start.shape[0], start.tolist(), ends=end.tolist(),
+                  values=rng.normal(size=start.shape[0]).tolist())
+    bw.addEntries("chr2", 100, values=rng.normal(size=5000).tolist(), span=20, step=30)
+    bw.addEntries("chr3", [10, 50, 200], values=[1.0, 2.0, 3.0], span=5)
+    bw.close()
+    return path
+
+
+@pytest.fixture(scope="module")
+def bigwig(tmp_path_factory):
+    return create_bigwig(str(tmp_path_factory.mktemp("bw") / "test.bw"))
+
+
+def queries():
+    rng = np.random.default_rng(1)
+    granges = [GenomeRange("chr1", 0, 1000000), GenomeRange("chr2", 0, 200000),
+               GenomeRange("chr2", 300000, 400000), GenomeRange("chr3", 0, 1000), GenomeRange("chr3", 12, 52)]
+    for _ in range(200):
+        chrom = rng.choice(["chr1", "chr2"])
+        start = int(rng.integers(0, 400000))
+        granges.append(GenomeRange(chrom, start, start + int(rng.integers(1, 5000))))
+    return granges
+
+
+def test_header(bigwig):
+    reader = BigWigReader(bigwig)
+    assert reader.chromsizes.sizes == {"chr1": 1000000, "chr2": 500000, "chr3": 1000}
+    assert len(reader.zoom_levels) > 0
+    bw = pyBigWig.open(bigwig)
+    for chrom in ("chr1", "chr2", "chr3"):
+        s, e, v = reader.intervals(GenomeRange(chrom, 100, 900))
+        expect = bw.intervals(chrom, 100, 900) or []
+        assert list(zip(s.tolist(), e.tolist())) == [(a, b) for a, b, _ in expect]
+        np.testing.assert_allclose(v, [c for _, _, c in expect], rtol=1e-6)
+
+
+@pytest.mark.parametrize("exact", [True, False])
+def test_stats(bigwig, exact):
+    reader = BigWigReader(bigwig)
+    bw = pyBigWig.open(bigwig)
+    granges = queries()
+    for nbins in (1, 4):
+        res = reader.summarize(GenomeRangeArray.from_granges(granges), ["mean", "max", "min", "coverage"],
+                               nbins=nbins, exact=exact)
+        for stat, values in res.items():
+            expect = np.array([bw.stats(g.chrom, g.start, g.end, type=stat, nBins=nbins, exact=exact)
+                               for g in granges], dtype=float).reshape(values.shape)
+            if stat == "coverage":
+                expect = np.nan_to_num(expect)
+            np.testing.assert_allclose(values, expect, rtol=1e-5)
+    assert reader.stats(GenomeRange("chr3", 0, 20), "max") == [1.0]
+    assert np.isnan(reader.stats(GenomeRange("chrX", 0, 20), "mean")[0])
+
+
+def test_write_bigwig(bigwig, tmp_path):
+    from luckyegg.io.bed import BedGraph, BEDBatch
+    reader = BigWigReader(bigwig)
+    records = []
+    for chrom in ("chr1", "chr2", "chr3"):
+        s, e, v = reader.intervals(GenomeRange(chrom, 0, reader.chromsizes[chrom]))
+        records.extend(BedGraph(chrom, a, b, str(c)) for a, b, c in zip(s.tolist(), e.tolist(), v.tolist()))
+    out = str(tmp_path / "out.bw")
+    write_bigwig(out, records, reader.chromsizes, items_per_slot=100, block_size=4, reduction=100)
+    written = BigWigReader(out)
+    bw = pyBigWig.open(out)
+    assert bw.chroms() == reader.chromsizes.sizes
+    assert bw.header()["nBasesCovered"] == sum(r.end - r.start for r in records)
+    assert len(written.zoom_levels) > 0
+    for chrom in ("chr1", "chr2", "chr3"):
+        assert bw.intervals(chrom) == pyBigWig.open(bigwig).intervals(chrom)
+    granges = queries()
+    for exact in (True, False):
+        res = written.summarize(GenomeRangeArray.from_granges(granges), ["mean", "max", "min"], exact=exact)
+        for stat, values in res.items():
+            expect = np.array([bw.stats(g.chrom, g.start, g.end, type=stat, exact=exact) for g in granges],
+                              dtype=float).reshape(values.shape)
+            np.testing.assert_allclose(values, expect, rtol=1e-5)
+    # columnar batches split at arbitrary positions give the same data
+    out2 = str(tmp_path / "out2.bw")
+    ranges = GenomeRangeArray.from_granges([GenomeRange(r.chrom, r.start, r.end) for r in records])
+    values = np.array([float(r.value) for r in records])
+    batches = []
+    for i0, i1 in ((0, 777), (777, 20001), (20001, len(records))):
+        batches.append(BEDBatch(BedGraph, ranges[i0:i1], {}, {"value": values[i0:i1]}))
+    write_bigwig(out2, batches, reader.chromsizes, items_per_slot=100, block_size=4, reduction=100)
+    written2 = BigWigReader(out2)
+    assert [z[0] for z in written2.zoom_levels] == [z[0] for z in written.zoom_levels]
+    data = slice(written.data_offset, written.zoom_levels[0][1])
+    with open(out, "rb") as f1, open(out2, "rb") as f2:
+        assert f1.read()[data] == f2.read()[data]
+    res2 = written2.summarize(GenomeRangeArray.from_granges(granges), ["mean", "max", "min"], exact=False)
+    for stat, values in res2.items():
+        np.testing.assert_allclose(values, res[stat], rtol=1e-5)
+    with pytest.raises(ValueError):
+        write_bigwig(str(tmp_path / "bad.bw"), records[::-1], reader.chromsizes)
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from luckyegg.genome import GenomeRange, GenomeBinRange, GenomeRangeArray, ChromSizes
+from luckyegg.io.hdf5 import *
+
+
+@pytest.fixture
+def chromsizes():
+    return ChromSizes({"chr1": 100000, "chr2": 12345})
+
+
+def test_track_store(tmp_path, chromsizes):
+    path = str(tmp_path / "tracks.h5")
+    rng = np.random.default_rng(0)
+    signal = rng.random(chromsizes["chr1"]).astype(np.float32)
+    with TrackStore(path, 'w', chunk_size=1000) as store:
+        track = store.create_track("coverage", chromsizes)
+        # streamed writes
+        for start in range(0, chromsizes["chr1"], 7777):
+            end = min(start + 7777, chromsizes["chr1"])
+            track.write(GenomeRange("chr1", start, end), signal[start:end])
+        binned = store.create_track("counts", chromsizes, binsize=1000, dtype="int32")
+        assert binned.group["chr2"].shape == (13,)
+        binned.write(GenomeBinRange("chr2", 10, 13), [1, 2, 3])
+        with pytest.raises(ValueError):
+            store.create_track("counts", chromsizes)
+        # sizes in bp are kept, sizes in bins are converted with the binsize
+        assert store.create_track("bp", chromsizes, binsize=10).chromsizes.sizes == chromsizes.sizes
+        in_bins = store.create_track("bins", chromsizes.to_bin(10), binsize=10)
+        assert in_bins.chromsizes.sizes == {"chr1": 100000, "chr2": 12350}
+        assert in_bins.group["chr2"].shape == (1235,)
+    with TrackStore(path, 'r') as store:
+        assert store.tracks == ["bins", "bp", "counts", "coverage"]
+        track = store["coverage"]
+        assert track.chromsizes.sizes == chromsizes.sizes
+        assert track.group["chr1"].chunks == (1000,)
+        np.testing.assert_array_equal(track.fetch(GenomeRange("chr1", 500, 2500)), signal[500:2500])
+        np.testing.assert_array_equal(track.fetch("chr1:99990-200000"), signal[99990:])
+        assert np.isnan(track.fetch("chr2")).all()
+        binned = store["counts"]
+        assert binned.fetch(GenomeRange("chr2", 9500, 12345)).tolist() == [0, 1, 2, 3]
+        assert binned.fetch(GenomeBinRange("chr2", 12, 13)).tolist() == [3]
+        with pytest.raises(ValueError):
+            track.fetch("chrX:1-10")
+        with pytest.raises(KeyError):
+            store["nothing"]
+
+
+def test_write_intervals(tmp_path, chromsizes, monkeypatch):
+    import luckyegg.io.hdf5
+    monkeypatch.setattr(luckyegg.io.hdf5, "WRITE_BUFFER", 1000)
+    rng = np.random.default_rng(1)
+    start = np.sort(rng.choice(chromsizes["chr1"] - 100, 500, replace=False))
+    end = np.minimum(start + rng.integers(1, 100, 500), np.append(start[1:], chromsizes["chr1"]))
+    values = rng.random(500)
+    expect = np.full(chromsizes["chr1"], np.nan, dtype=np.float32)
+    for s, e, v in zip(start, end, values):
+        expect[s:e] = v
+    ranges = GenomeRangeArray.from_arrays(np.array(["chr1"] * 500), start, end)
+    with TrackStore(str(tmp_path / "tracks.h5"), 'w', chunk_size=1000) as store:
+        track = store.create_track("signal", chromsizes)
+        order = rng.permutation(500)
+        track.write_intervals(ranges[order], values[order])
+        np.testing.assert_array_equal(track.fetch("chr1"), expect)
+        # a long interval and the ones overlap it, slabs are still bounded by WRITE_BUFFER
+        import h5py
+        slabs = []
+        setitem = h5py.Dataset.__setitem__
+
+        def record(self, key, value):
+            if isinstance(key, slice):
+                slabs.append(key.stop - key.start)
+            return setitem(self, key, value)
+
+        monkeypatch.setattr(h5py.Dataset, "__setitem__", record)
+        long_ranges = GenomeRangeArray.from_arrays(np.array(["chr1"] * 3), np.array([500, 3100, 20000]),
+                                                   np.array([45678, 3200, 20010]))
+        track.write_intervals(long_ranges, np.array([7.0, 8.0, 9.0]))
+        expect[500:45678], expect[3100:3200], expect[20000:20010] = 7, 8, 9
+        np.testing.assert_array_equal(track.fetch("chr1"), expect)
+        assert len(slabs) == 46 and max(slabs) <= 1000
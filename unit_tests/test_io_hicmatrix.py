@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sp
+
+import cooler
+
+from luckyegg.genome import GenomeRange, GenomeBinRange, genome_range
+from luckyegg.io.hicmatrix import *
+
+
+def create_cool(path:str, binsize:int=1000, n_contacts:int=20000, seed:int=0) -> str:
+    chromsizes = pd.Series({"chr1": 100500, "chr2": 60000, "chr3": 30000})
+    bins = cooler.binnify(chromsizes, binsize)
+    rng = np.random.default_rng(seed)
+    n_bins = len(bins)
+    weight = rng.uniform(0.5, 1.5, n_bins)
+    weight[rng.integers(0, n_bins, 5)] = np.nan
+    bins["weight"] = weight
+    i = rng.integers(0, n_bins, n_contacts)
+    j = np.clip(i + rng.geometric(0.05, n_contacts) - 1, 0, n_bins - 1)
+    pixels = pd.DataFrame({"bin1_id": i, "bin2_id": j, "count": 1})
+    pixels = pixels.groupby(["bin1_id", "bin2_id"]).sum().reset_index()
+    cooler.create_cooler(path, bins, pixels)
+    return path
+
+
+@pytest.fixture(scope="module")
+def cool(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("cool") / "test.cool")
+    return cooler.Cooler(create_cool(path))
+
+
+def test_fetch(cool):
+    selector = MatrixSelector(cool, balance=True, tile_size=16)
+    for region in ["chr1:1500-30000", "chr2", "chr1:99000-100500", "chr3:0-1"]:
+        expect = cool.matrix(balance=True).fetch(region)
+        np.testing.assert_allclose(selector.fetch(genome_range(region)), expect)
+    expect = cool.matrix(balance=False).fetch("chr1:0-20000", "chr2:5000-40000")
+    mat = selector.fetch(genome_range("chr1:0-20000"), genome_range("chr2:5000-40000"), balance=False)
+    assert mat.dtype == expect.dtype
+    np.testing.assert_array_equal(mat, expect)
+    np.testing.assert_allclose(
+        selector.fetch(GenomeBinRange("chr1", 2, 30)),
+        cool.matrix(balance=True).fetch("chr1:2000-30000"))
+    for chrom, (lo, hi) in zip(cool.chromnames, (cool.extent(c) for c in cool.chromnames)):
+        assert selector.chrom_offset(chrom) == lo
+        assert selector.chrom_bins(chrom) == hi - lo
+    with pytest.raises(ValueError):
+        selector.chrom_offset("chrX")
+
+
+def test_tile_cache(cool):
+    selector = MatrixSelector(cool, tile_size=32)
+    gr = genome_range("chr1:0-60000")
+    selector.fetch(gr)
+    info = selector.cache_info()
+    assert info.misses == 3  # upper triangle tiles of 2 x 2 tiles
+    selector.fetch(genome_range("chr1:10000-50000"))
+    assert selector.cache_info().misses == info.misses
+    assert selector.cache_info().hits > 0
+    selector.fetch(gr, balance=False)
+    assert selector.cache_info().misses > info.misses  # raw tiles cached separately
+    small = MatrixSelector(cool, tile_size=32, cache_size=32 * 32 * 8 * 2)
+    small.fetch(gr)
+    info = small.cache_info()
+    assert info.tiles <= 2 and info.evictions > 0
+    assert info.nbytes <= info.max_bytes
+
+
+def test_fetch_sparse(cool):
+    selector = MatrixSelector(cool)
+    for region in ["chr1", "chr2:1000-20000"]:
+        gr = genome_range(region)
+        dense = cool.matrix(balance=True).fetch(region)
+        mat = selector.fetch_sparse(gr)
+        assert sp.isspmatrix_coo(mat)
+        np.testing.assert_allclose(np.nan_to_num(mat.toarray()), np.nan_to_num(dense))
+        raw = selector.fetch_sparse(gr, balance=False, format="csr")
+        assert sp.isspmatrix_csr(raw)
+        np.testing.assert_array_equal(raw.toarray(), cool.matrix(balance=False).fetch(region))
+        for max_dist in (0, 3, 10):
+            band = selector.fetch_sparse(gr, max_dist=max_dist, chunk_bins=7)
+            i, j = np.indices(dense.shape)
+            expect = np.where(np.abs(i - j) <= max_dist, np.nan_to_num(dense), 0)
+            np.testing.assert_allclose(np.nan_to_num(band.toarray()), expect)
+    trans = selector.fetch_sparse(genome_range("chr1:0-20000"), genome_range("chr2"), balance=False)
+    np.testing.assert_array_equal(trans.toarray(), cool.matrix(balance=False).fetch("chr1:0-20000", "chr2"))
+    assert selector.fetch_sparse(genome_range("chr1:0-20000"), genome_range("chr2"), max_dist=5).nnz == 0
+
+
+def test_pileup(cool):
+    selector = MatrixSelector(cool)
+    rng = np.random.default_rng(1)
+    flank = 3
+    anchors1, anchors2 = [], []
+    for _ in range(60):
+        chrom1 = rng.choice(["chr1", "chr2"])
+        chrom2 = chrom1 if rng.random() < 0.8 else "chr3"
+        s1 = int(rng.integers(0, 50000))
+        s2 = s1 + int(rng.integers(0, 20000)) if chrom2 == chrom1 else int(rng.integers(0, 25000))
+        anchors1.append(GenomeRange(chrom1, s1, s1 + 500))
+        anchors2.append(GenomeRange(chrom2, s2, s2 + 500))
+    # anchor near the chromosome end
+    anchors1.append(GenomeRange("chr1", 100000, 100400))
+    anchors2.append(GenomeRange("chr1", 100000, 100400))
+
+    def naive(balance):
+        snippets = []
+        for a1, a2 in zip(anchors1, anchors2):
+            b1 = (a1.start + a1.end) // 2 // 1000
+            b2 = (a2.start + a2.end) // 2 // 1000
+            snippets.append(selector.fetch(
+                GenomeBinRange(a1.chrom, b1 - flank, b1 + flank + 1),
+                GenomeBinRange(a2.chrom, b2 - flank, b2 + flank + 1), balance=balance))
+        return snippets
+
+    for balance in (True, False):
+        expect = naive(balance)
+        stack = pileup(selector, anchors1, anchors2, flank=flank, mode="stack", balance=balance)
+        assert stack.shape == (len(anchors1), 2 * flank + 1, 2 * flank + 1)
+        n_checked = 0
+        for snippet, exp in zip(stack[:-1], expect[:-1]):
+            if exp.shape == snippet.shape:  # snippets inside the chromosomes
+                np.testing.assert_allclose(snippet, exp)
+                n_checked += 1
+        assert n_checked > 40
+        edge = stack[-1]  # chr1 has 101 bins, center bin is 100
+        assert np.all(np.isnan(edge[flank + 1:])) and np.all(np.isnan(edge[:, flank + 1:]))
+        np.testing.assert_allclose(edge[:flank + 1, :flank + 1], expect[-1])
+        mean = pileup(selector, anchors1, anchors2, flank=flank, balance=balance)
+        np.testing.assert_allclose(mean, np.nanmean(stack, axis=0))
+    mean_parallel = pileup(selector, anchors1, anchors2, flank=flank, workers=2)
+    np.testing.assert_allclose(mean_parallel, pileup(selector, anchors1, anchors2, flank=flank))
+    stack_parallel = pileup(selector, anchors1, anchors2, flank=flank, mode="stack", workers=2)
+    np.testing.assert_allclose(stack_parallel, pileup(selector, anchors1, anchors2, flank=flank, mode="stack"))
+
+
+def test_iter_diagonal(cool):
+    selector = MatrixSelector(cool)
+    # chr1 has 101 bins, chr3 has 30 bins
+    cases = [
+        ("chr1", 20, 5, 4, True, [(s, s + 20) for s in range(0, 85, 5)] + [(85, 101)]),
+        ("chr1", 10, 10, 12, False, [(s, s + 10) for s in range(0, 100, 10)] + [(100, 101)]),
+        ("chr1", 8, 20, 3, True, [(0, 8), (20, 28), (40, 48), (60, 68), (80, 88), (100, 101)]),
+        ("chr1", 200, 1, 2, True, [(0, 101)]),
+        ("chr1", 30, 7, 5, False, [(s, s + 30) for s in range(0, 71, 7)] + [(77, 101)]),
+        ("chr1", 40, 40, 6, True, [(0, 40), (40, 80), (80, 101)]),
+        ("chr3", 3, 5, 2, True, [(0, 3), (5, 8), (10, 13), (15, 18), (20, 23), (25, 28)]),
+        ("chr3", 5, 5, 2, False, [(0, 5), (5, 10), (10, 15), (15, 20), (20, 25), (25, 30)]),
+    ]
+    for chrom, window, step, depth, prefetch, expect_ranges in cases:
+        windows = list(selector.iter_diagonal(chrom, window, step, depth, prefetch=prefetch))
+        assert [(w.range.start, w.range.end) for w in windows] == expect_ranges
+        assert all(w.matrix.shape[0] > 0 for w in windows)
+        for w in windows:
+            expect = selector.fetch(w.range)
+            i, j = np.indices(expect.shape)
+            expect[np.abs(i - j) > depth] = np.nan
+            np.testing.assert_allclose(w.matrix, expect)
+    raw = next(selector.iter_diagonal("chr2", 10, 5, 3, balance=False))
+    expect = selector.fetch(raw.range, balance=False).astype(float)
+    i, j = np.indices(expect.shape)
+    expect[np.abs(i - j) > 3] = np.nan
+    np.testing.assert_array_equal(raw.matrix, expect)
+
+
+def test_multires_selector(cool, tmp_path):
+    path = str(tmp_path / "test.mcool")
+    cooler.zoomify_cooler(cool.uri, path, [1000, 2000, 5000, 10000], chunksize=10000)
+    selector = MultiResSelector(path, balance=False)
+    assert selector.resolutions == [1000, 2000, 5000, 10000]
+    gr = genome_range("chr1")
+    assert selector.select_resolution(gr, 10) == 10000
+    assert selector.select_resolution(gr, 30) == 2000
+    assert selector.select_resolution(gr, 1000) == 1000
+    assert selector.select_resolution(genome_range("chr1:0-50000"), 10) == 5000
+    res = selector.fetch(genome_range("chr1:1500-52000"), target_pixels=10)
+    assert res.resolution == 5000
+    assert res.range1 == GenomeRange("chr1", 0, 55000)
+    expect = cooler.Cooler(f"{path}::/resolutions/5000").matrix(balance=False).fetch("chr1:1500-52000")
+    np.testing.assert_array_equal(res.matrix, expect)
+    assert selector.fetch(gr, target_pixels=10).range1 == GenomeRange("chr1", 0, 100500)
+    assert selector.selector(5000) is selector.selector(5000)
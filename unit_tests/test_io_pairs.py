@@ -0,0 +1,87 @@
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cooler
+
+from luckyegg.genome import ChromSizes
+from luckyegg.io.pairs import *
+
+
+CHROMSIZES = {"chr1": 1000000, "chr2": 600000, "chr10": 300000}
+
+
+def create_pairs(path:str, n:int, seed:int=0, header:bool=True) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    chroms = np.array(list(CHROMSIZES))
+    sizes = np.array(list(CHROMSIZES.values()))
+    c1 = rng.integers(0, 3, n)
+    c2 = np.where(rng.random(n) < 0.8, c1, rng.integers(0, 3, n))
+    pos1 = rng.integers(1, sizes[c1] + 1)
+    pos2 = np.clip(pos1 + rng.integers(-50000, 50000, n), 1, sizes[c2])
+    df = pd.DataFrame({"readID": ".", "chrom1": chroms[c1], "pos1": pos1, "chrom2": chroms[c2], "pos2": pos2,
+                       "strand1": "+", "strand2": "-"})
+    df.loc[:9, "chrom1"] = "chrUn"  # dropped
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'wt') as f:
+        if header:
+            f.write("## pairs format v1.0\n")
+            for chrom, size in CHROMSIZES.items():
+                f.write(f"#chromsize: {chrom} {size}\n")
+            f.write("#columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2\n")
+        df.to_csv(f, sep="\t", header=False, index=False)
+    return df
+
+
+def expected_pixels(df:pd.DataFrame, binsize:int) -> pd.DataFrame:
+    bins = cooler.binnify(pd.Series(CHROMSIZES), binsize)
+    offsets = dict(zip(CHROMSIZES, np.cumsum([0] + [-(-s // binsize) for s in CHROMSIZES.values()])))
+    df = df[df.chrom1.isin(offsets) & df.chrom2.isin(offsets)]
+    b1 = df.chrom1.map(offsets) + (df.pos1 - 1) // binsize
+    b2 = df.chrom2.map(offsets) + (df.pos2 - 1) // binsize
+    pixels = pd.DataFrame({"bin1_id": np.minimum(b1, b2), "bin2_id": np.maximum(b1, b2), "count": 1})
+    return pixels.groupby(["bin1_id", "bin2_id"])["count"].sum().reset_index(), len(bins)
+
+
+@pytest.mark.parametrize("workers,max_memory", [(1, 1 << 30), (1, 1 << 16), (2, 1 << 16)])
+def test_pairs_to_cool(tmp_path, workers, max_memory):
+    path = str(tmp_path / "test.pairs.gz")
+    df = create_pairs(path, 200000)
+    out = str(tmp_path / "test.cool")
+    stats = pairs_to_cool(path, out, 10000, chunksize=30000, max_memory=max_memory,
+                          workers=workers, tmp_dir=str(tmp_path))
+    assert stats.contacts == len(df)
+    assert stats.dropped == 10
+    if max_memory < 1 << 20:
+        assert stats.runs >= 3  # every block spills, the runs go through the k-way merge
+    else:
+        assert stats.runs == 0
+    expect, n_bins = expected_pixels(df, 10000)
+    clr = cooler.Cooler(out)
+    assert clr.chromnames == list(CHROMSIZES)
+    assert clr.info["nbins"] == n_bins
+    pixels = clr.pixels()[:]
+    assert stats.pixels == len(pixels)
+    pd.testing.assert_frame_equal(pixels.astype("int64"), expect.astype("int64"))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["test.cool", "test.pairs.gz"]
+
+    ref = str(tmp_path / "ref.cool")
+    cooler.create_cooler(ref, cooler.binnify(pd.Series(CHROMSIZES), 10000), expect,
+                         dtypes={"count": np.int32}, symmetric_upper=True)
+    ref_clr = cooler.Cooler(ref)
+    pd.testing.assert_frame_equal(clr.bins()[:], ref_clr.bins()[:])
+    pd.testing.assert_frame_equal(pixels, ref_clr.pixels()[:])
+    np.testing.assert_array_equal(clr.matrix(balance=False)[:, :], ref_clr.matrix(balance=False)[:, :])
+
+
+def test_pairs_to_cool_no_header(tmp_path):
+    path = str(tmp_path / "test.pairs")
+    df = create_pairs(path, 5000, seed=1, header=False)
+    out = str(tmp_path / "test.cool")
+    with pytest.raises(ValueError):
+        pairs_to_cool(path, out, 50000)
+    pairs_to_cool(path, out, 50000, chromsizes=ChromSizes(CHROMSIZES))
+    expect, _ = expected_pixels(df, 50000)
+    assert cooler.Cooler(out).pixels()[:]["count"].sum() == expect["count"].sum()
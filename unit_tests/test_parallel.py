@@ -0,0 +1,113 @@
+import os
+import sys
+import subprocess
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from luckyegg.io.bed import Bed6, BedGraph, read_bed
+from luckyegg.parallel import *
+
+from test_io_bed import create_sample
+
+
+def test_split_file(tmp_path):
+    path = str(tmp_path / "lines.txt")
+    with open(path, 'w') as f:
+        for i in range(1000):
+            f.write(f"line{i}\n")
+    ranges = split_file(path, chunk_bytes=100, offset=6)
+    assert ranges[0][0] == 6
+    assert ranges[-1][1] == os.path.getsize(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    for (b1, e1), (b2, e2) in zip(ranges[:-1], ranges[1:]):
+        assert e1 == b2
+        assert data[e1 - 1:e1] == b"\n"
+
+
+def test_read_bed_parallel():
+    bed_path = create_sample('example_bed_parallel', Bed6, lines=2000)
+    records = list(read_bed(bed_path))
+    batches = list(read_bed_parallel(bed_path, workers=2, chunk_bytes=4096))
+    assert len(batches) > 1
+    assert all(b.ranges.chroms is batches[0].ranges.chroms for b in batches)
+    assert [r for b in batches for r in b.to_records()] == records
+    counts = map_reduce_bed(bed_path, chrom_counts, merge_counts, workers=2, chunk_bytes=4096)
+    assert counts == Counter(r.chrom for r in records)
+    coverage = map_reduce_bed(bed_path, chrom_coverage, merge_counts, initial=Counter(), workers=2, chunk_bytes=4096)
+    expect = Counter()
+    for r in records:
+        expect[r.chrom] += r.end - r.start
+    assert coverage == expect
+    os.remove(bed_path)
+
+
+def _fill_bins(chrom, size, out, scale):
+    out[:] = np.arange(size) * scale
+
+
+def _chrom_starts(chrom, size, ranges, offset=0):
+    starts = ranges.start[np.array(ranges.chroms)[ranges.codes] == chrom]
+    return starts + offset, size
+
+
+def _fail_on_chr2(chrom, size, arr):
+    if chrom == "chr2":
+        raise RuntimeError("failed")
+    return np.zeros(100000)
+
+
+def test_shared_array():
+    import pickle
+    arr = np.arange(100000, dtype=np.int64)
+    with SharedArray.from_array(arr) as shared:
+        attached = pickle.loads(pickle.dumps(shared))
+        assert not attached.owner
+        attached.array[0] = -1
+        assert shared.array[0] == -1
+        attached.close()
+        # another interpreter(own resource tracker) attaches and exits, the segment must survive
+        code = ("import sys, pickle; s = pickle.loads(bytes.fromhex(sys.argv[1])); "
+                "assert s.array[0] == -1; s.close()")
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        proc = subprocess.run([sys.executable, "-c", code, pickle.dumps(shared).hex()],
+                              capture_output=True, text=True, env=env)
+        assert proc.returncode == 0, proc.stderr
+        assert "leaked" not in proc.stderr
+        assert os.path.exists(f"/dev/shm/{shared.name}") or not os.path.isdir("/dev/shm")
+    segments = []
+    obj = share({"a": (arr, 1), "b": np.arange(3)}, segments)
+    assert isinstance(obj["a"][0], SharedArray) and isinstance(obj["b"], np.ndarray)
+    res = unshare(obj, copy=True)
+    np.testing.assert_array_equal(res["a"][0], arr)
+    for s in segments:
+        s.close()
+        s.unlink()
+
+
+def test_map_chromosomes():
+    from luckyegg.genome import ChromSizes, GenomeRangeArray
+    shm_dir = "/dev/shm"
+    before = set(os.listdir(shm_dir)) if os.path.isdir(shm_dir) else set()
+    chromsizes = ChromSizes({"chr1": 100000, "chr2": 55555, "chr3": 1000})
+    out = map_chromosomes(_fill_bins, chromsizes, (2.0,), binsize=10, out_dtype=np.float64, workers=2)
+    offsets = chromsizes.offsets(10)
+    assert out.shape[0] == offsets[-1]
+    for i, n in enumerate(chromsizes.lengths(10)):
+        np.testing.assert_array_equal(out[offsets[i]:offsets[i+1]], np.arange(n) * 2.0)
+    rng = np.random.default_rng(0)
+    ranges = GenomeRangeArray(["chr1", "chr2"], rng.integers(0, 2, 50000), rng.integers(0, 1000, 50000),
+                              np.zeros(50000, dtype=np.int64))
+    res = map_chromosomes(_chrom_starts, chromsizes, (ranges,), {"offset": 1}, chroms=["chr1", "chr2"], workers=2)
+    assert list(res) == ["chr1", "chr2"]
+    for code, chrom in enumerate(["chr1", "chr2"]):
+        np.testing.assert_array_equal(res[chrom][0], ranges.start[ranges.codes == code] + 1)
+        assert res[chrom][1] == chromsizes[chrom]
+    with pytest.raises(RuntimeError):
+        map_chromosomes(_fail_on_chr2, chromsizes, (np.zeros(100000),), workers=2)
+    with pytest.raises(ValueError):
+        map_chromosomes(_fill_bins, chromsizes, chroms=["chrX"])
+    if os.path.isdir(shm_dir):
+        assert set(os.listdir(shm_dir)) <= before
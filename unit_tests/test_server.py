@@ -0,0 +1,175 @@
+import json
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from luckyegg.genome import GenomeRange, ChromSizes, genome_range
+from luckyegg.io.hdf5 import TrackStore
+from luckyegg.server import *
+
+
+class CountingSource(TrackSource):
+    def __init__(self, track) -> None:
+        super().__init__(track)
+        self.reads = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def read(self, key, box):
+        self.reads.append((key, box))
+        self.gate.wait()
+        return super().read(key, box)
+
+
+@pytest.fixture
+def track(tmp_path):
+    store = TrackStore(str(tmp_path / "tracks.h5"), "w")
+    track = store.create_track("signal", ChromSizes({"chr1": 100000, "chr2": 5000}), binsize=10)
+    track.write(GenomeRange("chr1", 0, 100000), np.arange(10000, dtype=np.float32))
+    track.write(GenomeRange("chr2", 0, 5000), np.arange(500, dtype=np.float32))
+    yield track
+    store.close()
+
+
+def test_coalesce():
+    boxes = [((0, 10),), ((5, 20),), ((30, 40),), ((19, 25),), ((35, 36),)]
+    groups = coalesce(boxes)
+    assert [(u, sorted(m)) for u, m in groups] == [(((0, 25),), [0, 1, 3]), (((30, 40),), [2, 4])]
+    assert len(coalesce([((0, 10), (0, 10)), ((5, 15), (20, 30))])) == 2
+
+
+def test_service_coalescing(track):
+    source = CountingSource(track)
+    service = RegionService({"signal": source}, workers=2)
+    queries = ["chr1:0-1000", "chr1:500-2000", "chr1:1990-3000", "chr1:50000-50100", "chr2:0-100", "chr1:600-700"]
+
+    async def main():
+        results = await asyncio.gather(*[service.query("signal", genome_range(q)) for q in queries])
+        # contained in an in-flight read
+        source.gate.clear()
+        first = asyncio.ensure_future(service.query("signal", genome_range("chr1:10000-20000")))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(service.query("signal", genome_range("chr1:12000-13000")))
+        await asyncio.sleep(0)
+        source.gate.set()
+        return results + list(await asyncio.gather(first, second))
+
+    results = asyncio.run(main())
+    service.close()
+    for q, res in zip(queries + ["chr1:10000-20000", "chr1:12000-13000"], results):
+        np.testing.assert_array_equal(res, track.fetch(q))
+    assert service.stats["queries"] == 8
+    assert sorted(source.reads) == [
+        ("chr1", ((0, 300),)), ("chr1", ((1000, 2000),)), ("chr1", ((5000, 5010),)), ("chr2", ((0, 10),))]
+    assert service.stats["reads"] + service.stats["coalesced"] == service.stats["queries"]
+
+
+def test_service_errors(track):
+    service = RegionService({"signal": TrackSource(track)}, window=0)
+
+    async def main():
+        with pytest.raises(KeyError):
+            await service.query("missing", genome_range("chr1:0-10"))
+        with pytest.raises(ValueError):
+            await service.query("signal", genome_range("chrX:0-10"))
+
+    asyncio.run(main())
+    service.close()
+
+
+def test_http(track, tmp_path):
+    pytest.importorskip("h5py")
+    service = RegionService({"signal": TrackSource(track)})
+
+    async def request(reader, writer, path):
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        await writer.drain()
+        status = (await reader.readline()).decode()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line == b"\r\n":
+                break
+            k, _, v = line.decode().partition(":")
+            headers[k.lower()] = v.strip()
+        body = await reader.readexactly(int(headers["content-length"]))
+        return status.split()[1], json.loads(body)
+
+    async def main():
+        socket_path = str(tmp_path / "luckyegg.sock")
+        server = await service.serve(path=socket_path)
+        async with server:
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+            res = [await request(reader, writer, p) for p in
+                   ["/sources", "/query/signal?region=chr1:100-150", "/query/nope?region=chr1:0-1",
+                    "/query/signal", "/query/signal?region=chrX:0-10"]]
+            writer.close()
+        return res
+
+    res = asyncio.run(main())
+    service.close()
+    assert res[0] == ("200", ["signal"])
+    assert res[1] == ("200", {"result": [10.0, 11.0, 12.0, 13.0, 14.0]})
+    assert [r[0] for r in res[2:]] == ["404", "400", "400"]
+
+
+def test_matrix_source(tmp_path):
+    cooler = pytest.importorskip("cooler")
+    from luckyegg.io.hicmatrix import MatrixSelector
+    from test_io_hicmatrix import create_cool
+    clr = cooler.Cooler(create_cool(str(tmp_path / "test.cool")))
+    service = RegionService({"hic": MatrixSource(MatrixSelector(clr, balance=False))})
+    queries = [("chr1:0-20000", None), ("chr1:10000-30000", None), ("chr1:0-20000", "chr2:0-10000"),
+               ("chr1:15000-25000", "chr1:5000-8000")]
+
+    async def main():
+        return await asyncio.gather(*[
+            service.query("hic", genome_range(a), None if b is None else genome_range(b)) for a, b in queries])
+
+    results = asyncio.run(main())
+    service.close()
+    for (a, b), res in zip(queries, results):
+        np.testing.assert_array_equal(res, clr.matrix(balance=False).fetch(a, b))
+    assert service.stats["reads"] == 2
+
+
+class FailingSource(TrackSource):
+    def read(self, key, box):
+        raise OSError("disk error")
+
+
+def test_bed_source(track, tmp_path):
+    from luckyegg.io.bed import bgzip_bed
+    path = str(tmp_path / "peaks.bed")
+    with open(path, 'w') as f:
+        for i in range(100):
+            f.write(f"chr1\t{i * 1000}\t{i * 1000 + 500}\tp{i}\n")
+        f.write("chr2\t0\t10\tq\n")
+    service = RegionService({"bed": BedSource(bgzip_bed(path), general=True), "broken": FailingSource(track)})
+    assert service.sources["bed"].extent(genome_range("chr1"))[1] == ((0, 1 << 29),)
+    assert service.sources["bed"].extent(genome_range("chr1:100-9999999999"))[1] == ((100, 1 << 29),)
+
+    async def request(path):
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        writer.write(f"GET {path} HTTP/1.1\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        data = await reader.read()
+        writer.close()
+        head, _, body = data.partition(b"\r\n\r\n")
+        return head.split()[1].decode(), json.loads(body)
+
+    socket_path = str(tmp_path / "bed.sock")
+
+    async def main():
+        records = await service.query("bed", genome_range("chr1"))
+        server = await service.serve(path=socket_path)
+        async with server:
+            return records, await request("/query/bed?region=chr1"), await request("/query/broken?region=chr1:0-100")
+
+    records, (status, body), (err_status, err_body) = asyncio.run(main())
+    service.close()
+    assert len(records) == 100 and all(r.chrom == "chr1" for r in records)
+    assert status == "200" and len(body["result"]) == 100
+    assert err_status == "500" and "disk error" in err_body["error"]